@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+'''!@file       ADCBurst.py
+    @brief      Romi timed multi-channel ADC burst sampling
+    @details    ADCBurst.py contains the class that samples all of Romi's line sensor ADC
+                channels together in one timed burst, and a replay stand-in for running the
+                line sensor code off the robot.
+    @author     Joseph Penrose & Paolo Navarro
+    @date       October 18, 2026
+'''
+from array import array
+import struct
+try:
+    from pyb import ADC
+except ImportError:
+    ADC = None      # off the robot, only ADCReplay is usable
+
+class ADCBurst():
+    '''!@brief      Timed burst sampler for a group of ADC channels.
+        @details    Reading each line sensor with ADC.read() costs one conversion plus Python
+                    call overhead per channel, and the channels end up sampled at different
+                    moments while Romi is moving. ADCBurst uses pyb.ADC.read_timed_multi
+                    instead: on every tick of a hardware timer, every channel is converted back
+                    to back, so a whole set of channels is sampled within a few microseconds.
+                    Each channel is sampled n_os times at the timer rate and averaged, which
+                    knocks down ADC and motor PWM noise.
+
+        @details    All buffers are preallocated. One call to sample() runs one burst, averages
+                    it, and leaves the averaged 12-bit counts in self.vals, indexed the same
+                    way as the ADC tuple it was built with. A burst blocks for n_os timer
+                    periods (200 us at the defaults).
+    '''
+
+    def __init__(self, adcs, tim, n_os = 4):
+        '''!@brief      Initializes and returns an ADCBurst object.
+            @param      adcs    Tuple of pyb.ADC objects to sample together.
+            @param      tim     Timer object, already set to the burst sample rate.
+            @param      n_os    Samples per channel per burst (oversampling). Default 4
+        '''
+        if n_os < 1:
+            raise ValueError("Oversampling must be at least 1")
+        self.adcs = tuple(adcs)                 # ADC channels
+        self.tim = tim                          # burst sample timer
+        self.n_ch = len(self.adcs)              # number of channels
+        self.n_os = n_os                        # samples per channel per burst
+        self.bufs = tuple(array('H', [0]*n_os) for i in range(self.n_ch))   # raw burst
+        self.vals = array('H', [0]*self.n_ch)   # averaged counts
+
+
+
+    def capture(self):
+        '''!@brief      Fill the raw burst buffers from hardware.
+        '''
+        ADC.read_timed_multi(self.adcs, self.bufs, self.tim)
+
+
+
+    def sample(self):
+        '''!@brief      Run one burst and average it into self.vals.
+            @return     self.vals, the averaged 12-bit counts for each channel.
+        '''
+        self.capture()
+        n_os = self.n_os
+        vals = self.vals
+        for ch in range(self.n_ch):
+            buf = self.bufs[ch]
+            s = 0
+            for i in range(n_os):
+                s += buf[i]
+            vals[ch] = s//n_os
+        return vals
+
+
+
+    def record(self, fname, n_frames):
+        '''!@brief      Record raw bursts to flash for replay with ADCReplay.
+            @details    Blocking; meant to be run from the REPL with Romi on the track, not
+                        during a run. Each frame is n_ch*n_os little-endian uint16 counts,
+                        channel by channel.
+            @param      fname       File name to write.
+            @param      n_frames    Number of bursts to record.
+        '''
+        with open(fname, 'wb') as file:
+            file.write(bytes([self.n_ch, self.n_os]))
+            for f in range(n_frames):
+                self.capture()
+                for buf in self.bufs:
+                    file.write(buf)
+
+
+
+class ADCReplay(ADCBurst):
+    '''!@brief      Stand-in for ADCBurst that replays recorded bursts.
+        @details    ADCReplay plays back bursts recorded by ADCBurst.record(), or a list of
+                    frames given directly, through the same averaging as ADCBurst. It loops
+                    back to the start when it runs out, so line sensor code can be exercised
+                    off the robot.
+    '''
+
+    def __init__(self, frames = None, fname = None):
+        '''!@brief      Initializes and returns an ADCReplay object.
+            @param      frames  List of frames, each a sequence of n_ch sequences of n_os
+                                counts. Default none
+            @param      fname   File written by ADCBurst.record(), used if frames is not
+                                given. Default none
+        '''
+        if frames is None:
+            with open(fname, 'rb') as file:
+                data = file.read()
+            n_ch = data[0]
+            n_os = data[1]
+            raw = struct.unpack('<' + 'H'*((len(data) - 2)//2), data[2:])
+            frames = []
+            step = n_ch*n_os
+            for f in range(len(raw)//step):
+                frames.append([raw[f*step + ch*n_os:f*step + (ch + 1)*n_os] for ch in range(n_ch)])
+        if len(frames) == 0:
+            raise ValueError("Nothing to replay")
+        self.frames = frames
+        self.idx = 0
+        super().__init__([None]*len(frames[0]), None, len(frames[0][0]))
+
+
+
+    def capture(self):
+        '''!@brief      Copy the next recorded burst into the raw burst buffers.
+        '''
+        frame = self.frames[self.idx]
+        for ch in range(self.n_ch):
+            buf = self.bufs[ch]
+            src = frame[ch]
+            for i in range(self.n_os):
+                buf[i] = src[i]
+        self.idx += 1
+        if self.idx >= len(self.frames):
+            self.idx = 0
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+'''!@file       BattMon.py
+    @brief      Romi battery voltage monitor firmware
+    @details    BattMon.py contains the class driver that measures Romi's battery pack voltage
+                and computes the motor duty cycle compensation scale.
+    @author     Joseph Penrose & Paolo Navarro
+    @date       October 18, 2026
+'''
+
+class BattMon():
+    '''!@brief      A driver class for Romi's battery voltage measurement.
+        @details    Romi runs on 6x AA cells, and the pack voltage sags as the batteries
+                    discharge. A motor duty cycle is a fraction of the pack voltage, so the same
+                    duty command gives less and less speed over a run. BattMon reads the pack
+                    voltage through a resistor divider on an ADC pin, low-pass filters it, and
+                    publishes the ratio of a nominal voltage to the measured voltage. RomiMot
+                    multiplies every duty command by that ratio, so a tuned duty cycle always
+                    means the same motor voltage. Like all of Romi's firmware, it initializes
+                    with a set of Shares designed to pass important data in and out to the
+                    rest of Romi's program.
+
+        @details    The scale is only recomputed when BattMon runs, which can be much slower
+                    than the motor tasks, so the motor path only pays for one multiply.
+
+        @details    BattMon only needs an object with a read() method returning 12-bit ADC
+                    counts, so it can run off the host with BattStub in place of a pyb.ADC.
+    '''
+
+    def __init__(self, BattShares, adc, ratio, V_nom = 7.2, alpha = 0.1, V_low = 6.0):
+        '''!@brief      Initializes and returns an object associated with Romi's battery monitor.
+            @details    Unpacks Shares and precomputes the counts-to-volts factor. The filter
+                        is seeded with the first reading so it does not start from zero.
+
+                            BattShares contains two Shares. They are used to pass out data.
+                            BattShares[0] = battery voltage [V]     (float)
+                            BattShares[1] = duty scale      [--]    (float)
+
+            @param      BattShares  A tuple containing all of BattMon's Shares objects.
+            @param      adc         ADC object (or BattStub) on the divider output.
+            @param      ratio       Divider ratio, pack voltage / pin voltage.
+            @param      V_nom       Nominal pack voltage that duty cycles are tuned at [V].
+                                    Default 7.2 V
+            @param      alpha       First-order filter coefficient, 0 < alpha <= 1. Default 0.1
+            @param      V_low       Low battery warning threshold [V]. Default 6.0 V
+        '''
+        if alpha <= 0 or alpha > 1:
+            raise ValueError("Filter coefficient must be between 0 and 1")
+
+        # Set up access to battery Shares
+        self.V_share = BattShares[0]            # battery voltage Share
+        self.scale_share = BattShares[1]        # motor duty scale Share
+        self.scale_share.put(1.0)               # no compensation until measured
+
+        # Store hardware & constants
+        self.adc = adc                          # divider ADC
+        self.k = 3.3/4095*ratio                 # [V/count] counts to pack volts
+        self.V_nom = V_nom                      # [V] nominal voltage
+        self.alpha = alpha                      # filter coefficient
+        self.V_low = V_low                      # [V] low battery threshold
+        self.V_min = 3.0                        # [V] below this, no pack connected
+        self.s_max = 1.5                        # largest allowed duty scale
+
+        # Internal variables
+        self.V = self.adc.read()*self.k         # [V] filtered pack voltage
+        self.V_share.put(self.V)
+        self.scale = 1.0                        # duty scale
+        self.low_flag = 0                       # True once low battery warned
+
+
+
+    def update(self):
+        '''!@brief      Read and filter the pack voltage, then recompute the duty scale.
+            @details    The scale is clamped to s_max so a nearly dead pack does not ask for
+                        huge duty cycles. If no pack is connected (e.g. Romi powered from USB
+                        only), no compensation is applied.
+        '''
+        # First-order low-pass filter
+        self.V += self.alpha*(self.adc.read()*self.k - self.V)
+
+        # Precompute the scale for the motor tasks
+        if self.V < self.V_min:
+            self.scale = 1.0
+        else:
+            self.scale = self.V_nom/self.V
+            if self.scale > self.s_max:
+                self.scale = self.s_max
+
+        # Low battery warning, once
+        if self.low_flag == 0 and self.V_min < self.V < self.V_low:
+            print(f'BattMon: low battery, {self.V} V')
+            self.low_flag = 1
+
+        # Push data to Shares
+        self.V_share.put(self.V)
+        self.scale_share.put(self.scale)
+
+
+
+    def MainTask(self):
+        '''!@brief      Main cotask task for BattMon.
+            @details    The BattMon main task has states:
+
+                            1:  Normal operation state. Continuously measure the pack voltage
+                                and push the voltage and duty scale to Shares.
+
+            @details    Like all of Romi's cooperative multitasking tasks, MainTask is written
+                        as a generator function with an infinite loop. Each pass through the
+                        program runs through the MainTask while loop once, until it reaches a
+                        yield.
+        '''
+        while True:
+            self.update()
+            yield 1                     # end of task
+
+
+
+class BattStub():
+    '''!@brief      Stand-in for the battery divider ADC, for running BattMon off the robot.
+        @details    Returns the 12-bit counts a real divider would produce for a set pack
+                    voltage.
+    '''
+
+    def __init__(self, ratio, V = 7.2):
+        '''!@brief      Initializes a battery ADC stub.
+            @param      ratio   Divider ratio, pack voltage / pin voltage.
+            @param      V       Simulated pack voltage [V]. Default 7.2 V
+        '''
+        self.ratio = ratio
+        self.V = V
+
+    def read(self):
+        '''!@brief      Simulated ADC read.
+            @return     12-bit ADC counts for the simulated pack voltage.
+        '''
+        counts = int(self.V/self.ratio/3.3*4095)
+        return min(max(counts, 0), 4095)
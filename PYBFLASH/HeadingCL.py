@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+'''!@file       HeadingCL.py
+    @brief      Romi cascaded heading and yaw rate closed-loop controller.
+    @details    HeadingCL is a two-loop controller used by Romi MasterMind to point Romi in a
+                commanded direction. An outer loop turns heading error into a yaw rate
+                command, and an inner loop turns yaw rate error (measured by the BNO gyro)
+                into a differential wheel duty cycle. Like LineCL, it is called as a helper
+                function from within Romi's main program and does not run its own task.
+    @author     Joseph Penrose & Paolo Navarro
+    @date       October 18, 2026
+'''
+# Required modules
+import utime
+import math
+class HeadingCL():
+    '''!@brief      Romi cascaded heading / yaw rate controller object
+        @details    The outer heading loop is a proportional controller on the wrapped heading
+                    error, so it always turns the short way around and never sees the jump
+                    where phi rolls over from 2pi to 0. Its output is a yaw rate command,
+                    clamped to the rate limit, plus an optional rate feed-forward from a motion
+                    profile.
+
+        @details    The inner yaw rate loop is a PI controller on the BNO z angular velocity
+                    with a rate feed-forward. Closing a loop on rate adds the damping that a
+                    heading-only (bang-bang) controller is missing, so Romi can turn fast and
+                    still stop on target without overshoot or a fudged target angle.
+
+        @details    The controller output is the differential duty cycle for one wheel.
+                    Positive output turns Romi left (counter-clockwise, increasing phi), so
+                    the caller drives with Drive(-u, u).
+
+        @details    The controller reports itself settled once the heading error and the yaw
+                    rate have both stayed inside their tolerances for n_settle consecutive
+                    calls.
+    '''
+
+    def __init__(self, Kp_h, Kp_r, Ki_r = 0, Kff_r = 0, r_max = 4.0, u_max = 100,
+                 tol = 0.02, r_tol = 0.10, n_settle = 3):
+        '''!@brief      Constructs a cascaded heading controller object
+            @param      Kp_h        Heading loop proportional gain [(rad/s)/rad]
+            @param      Kp_r        Rate loop proportional gain [%/(rad/s)]
+            @param      Ki_r        Rate loop integral gain [%/rad]. Default off
+            @param      Kff_r       Rate feed-forward gain [%/(rad/s)]. Default off
+            @param      r_max       Yaw rate command limit [rad/s]. Default 4.0 rad/s
+            @param      u_max       Differential duty limit [%]. Default 100%
+            @param      tol         Settled heading tolerance [rad]. Default 0.02 rad
+            @param      r_tol       Settled yaw rate tolerance [rad/s]. Default 0.10 rad/s
+            @param      n_settle    Consecutive in-tolerance calls required to settle. Default 3
+        '''
+        # Store gains in memory
+        if Kp_h <= 0 or Kp_r <= 0:
+            raise Exception("Proportional gains must be positive & non-zero")
+        self.Kp_h = Kp_h            # Heading gain
+        self.Kp_r = Kp_r            # Rate proportional gain
+        self.Ki_r = Ki_r            # Rate integral gain
+        self.Kff_r = Kff_r          # Rate feed-forward gain
+        self.r_max = r_max          # Rate command limit
+        self.u_max = u_max          # Output limit
+
+        # Settle criteria
+        self.SetSettle(tol, r_tol, n_settle)
+
+        # Controller signals
+        self.err = 0.0              # [rad]     heading error
+        self.r_cmd = 0.0            # [rad/s]   yaw rate command
+        self.r_err = 0.0            # [rad/s]   yaw rate error
+        self.esum = 0.0             # [rad]     rate error integral
+        self.u = 0.0                # [%]       output differential duty
+        self.n_in = 0               # consecutive in-tolerance calls
+        self.t0 = utime.ticks_us()  # Curr utime (us)
+        self.dt = 0.0               # Delta time (s)
+
+
+    def SetSettle(self, tol, r_tol, n_settle = 3):
+        '''!@brief      Update the settle criteria
+            @param      tol         Settled heading tolerance [rad]
+            @param      r_tol       Settled yaw rate tolerance [rad/s]
+            @param      n_settle    Consecutive in-tolerance calls required to settle
+        '''
+        if tol <= 0 or r_tol <= 0 or n_settle < 1:
+            raise Exception("Settle tolerances must be positive & non-zero")
+        self.tol = tol
+        self.r_tol = r_tol
+        self.n_settle = n_settle
+
+
+    def SetKff(self, Kff_r):
+        '''!@brief      Update the rate feed-forward gain
+            @param      Kff_r       Rate feed-forward gain [%/(rad/s)]
+        '''
+        self.Kff_r = Kff_r
+
+
+    def reset(self):
+        '''!@brief      Clear controller memory before a new maneuver
+            @details    Zeros the rate integral and the settle counter, and restarts the clock.
+        '''
+        self.esum = 0.0
+        self.n_in = 0
+        self.u = 0.0
+        self.t0 = utime.ticks_us()
+
+
+    def settled(self):
+        '''!@brief      Check the settle criteria
+            @return     True if heading error and yaw rate have been in tolerance for
+                        n_settle consecutive calls, else False.
+        '''
+        return self.n_in >= self.n_settle
+
+
+    def controller(self, phi_ref, phi, r_meas, r_ff = 0.0):
+        '''!@brief      Cascaded heading / yaw rate controller
+            @details    Runs the outer heading loop and the inner yaw rate loop once, and
+                        updates the settle counter.
+            @param      phi_ref     Heading reference [rad]
+            @param      phi         Measured heading [rad]
+            @param      r_meas      Measured yaw rate [rad/s], positive counter-clockwise
+            @param      r_ff        Yaw rate feed-forward [rad/s], e.g. from a motion profile.
+                                    Default 0
+            @return     Differential duty for one wheel [%]. Positive turns left.
+        '''
+        # Deal with time
+        t1 = utime.ticks_us()
+        self.dt = utime.ticks_diff(t1, self.t0)/(10**6)     # Delta time (s)
+        self.t0 = t1
+
+        # Outer loop: wrapped heading error to rate command
+        err = phi_ref - phi
+        while err > math.pi:
+            err -= 2*math.pi
+        while err <= -math.pi:
+            err += 2*math.pi
+        self.err = err
+        r_cmd = r_ff + self.Kp_h*err
+        if r_cmd > self.r_max:
+            r_cmd = self.r_max
+        elif r_cmd < -self.r_max:
+            r_cmd = -self.r_max
+        self.r_cmd = r_cmd
+
+        # Inner loop: rate error to differential duty
+        self.r_err = r_cmd - r_meas
+        u = self.Kff_r*r_cmd + self.Kp_r*self.r_err + self.Ki_r*self.esum
+
+        # Saturate, and only integrate while not pushing further into saturation
+        if u > self.u_max:
+            u = self.u_max
+            if self.r_err < 0:
+                self.esum += self.r_err*self.dt
+        elif u < -self.u_max:
+            u = -self.u_max
+            if self.r_err > 0:
+                self.esum += self.r_err*self.dt
+        else:
+            self.esum += self.r_err*self.dt
+        self.u = u
+
+        # Settle check
+        if abs(err) < self.tol and abs(r_meas) < self.r_tol:
+            self.n_in += 1
+        else:
+            self.n_in = 0
+
+        return u
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+'''!@file       LidarIC.py
+    @brief      Romi LIDAR hardware input capture
+    @details    LidarIC.py contains the class that measures the LIDAR sensor's PWM pulse width
+                with a hardware timer in PWM input mode, and a stand-in for running the LIDAR
+                code off the robot.
+    @author     Joseph Penrose & Paolo Navarro
+    @date       October 18, 2026
+'''
+try:
+    from pyb import Timer, Pin
+    import stm
+except ImportError:
+    Timer = None    # off the robot, only LidarICStub is usable
+
+class LidarIC():
+    '''!@brief      Hardware pulse width capture for the LIDAR sensor.
+        @details    Timing the LIDAR pulse with an external interrupt puts the Python ISR's
+                    latency into every measurement, and the ISR runs late whenever interrupts
+                    are masked, for example while a Share is being written. LidarIC uses one of
+                    the STM32's advanced timers in PWM input mode instead, so both edges are
+                    timestamped by hardware and no code runs per pulse:
+
+                        -   The timer counts at 1 MHz, so one count is 1 us.
+                        -   Channel 1 captures the rising edge on TI1 and resets the counter
+                            (slave reset mode on TI1FP1), so CCR1 holds the pulse period.
+                        -   Channel 2 captures the falling edge of the same input (TI1, falling
+                            polarity), so CCR2 holds the pulse width directly.
+
+        @details    pyb.Timer sets up the clock, the pin alternate function, and channel 1;
+                    channel 2 and the slave mode are not exposed by pyb, so they are written
+                    straight to the timer registers with the stm module. The task reads CCR2
+                    whenever it likes; the capture flag tells it whether a new pulse came in
+                    since the last read. The LIDAR must be wired to a timer channel 1 pin, PC6
+                    (TIM8_CH1) on Romi.
+    '''
+
+    def __init__(self, tim_num = 8, pin = 'C6', t_stale = 50):
+        '''!@brief      Initializes and returns a LidarIC object.
+            @param      tim_num     Advanced or general purpose timer with channel 1 on the
+                                    LIDAR pin. Default 8
+            @param      pin         CPU pin name of the timer's channel 1. Default 'C6'
+            @param      t_stale     Reads with no new pulse before the measurement is stale.
+                                    Default 50
+        '''
+        self.tim = Timer(tim_num)
+        self.tim.init(prescaler = self.tim.source_freq()//1_000_000 - 1, period = 0xFFFF)
+        self.ch = self.tim.channel(1, Timer.IC, pin = getattr(Pin.cpu, pin),
+                                   polarity = Timer.RISING)
+        self.base = getattr(stm, f'TIM{tim_num}')
+        self.t_stale = t_stale
+
+        # Channel 2: capture on TI1 (CC2S = 10), falling edge (CC2P = 1), enabled (CC2E = 1)
+        stm.mem16[self.base + stm.TIM_CCER] &= ~(1 << 4)
+        ccmr1 = stm.mem16[self.base + stm.TIM_CCMR1]
+        stm.mem16[self.base + stm.TIM_CCMR1] = (ccmr1 & ~(0b11 << 8)) | (0b10 << 8)
+        stm.mem16[self.base + stm.TIM_CCER] |= (1 << 5) | (1 << 4)
+        # Slave mode: trigger on TI1FP1 (TS = 101), reset mode (SMS = 100)
+        smcr = stm.mem32[self.base + stm.TIM_SMCR]
+        stm.mem32[self.base + stm.TIM_SMCR] = (smcr & ~0x10077) | (0b101 << 4) | 0b100
+
+        self.width = 0      # [us] last pulse width
+        self.period = 0     # [us] last pulse period
+        self.stale = 0      # reads since the last new pulse
+        self.new = False    # True if the last read had a new pulse
+
+
+
+    def read(self):
+        '''!@brief      Read the latest captured pulse.
+            @details    Reading CCR2 clears the capture flag, so self.new is True only once
+                        per pulse.
+            @return     Pulse width [us], or 0 if no pulse has come in for t_stale reads.
+        '''
+        if stm.mem16[self.base + stm.TIM_SR] & (1 << 2):
+            self.width = stm.mem16[self.base + stm.TIM_CCR2]
+            self.period = stm.mem16[self.base + stm.TIM_CCR1]
+            self.stale = 0
+            self.new = True
+        else:
+            self.stale += 1
+            self.new = False
+            if self.stale > self.t_stale:
+                self.width = 0
+        return self.width
+
+
+
+class LidarICStub(LidarIC):
+    '''!@brief      Stand-in for LidarIC that plays back pulse widths.
+        @details    LidarICStub returns pulse widths from a list, one per read, looping back
+                    to the start when it runs out. A width of 0 plays back as no new pulse, so
+                    dropouts can be tested too. It needs no timer, so the LIDAR code can be
+                    exercised off the robot.
+    '''
+
+    def __init__(self, widths, t_stale = 50):
+        '''!@brief      Initializes and returns a LidarICStub object.
+            @param      widths      List of pulse widths [us] to play back.
+            @param      t_stale     Reads with no new pulse before the measurement is stale.
+                                    Default 50
+        '''
+        if len(widths) == 0:
+            raise ValueError("Nothing to play back")
+        self.widths = widths
+        self.idx = 0
+        self.t_stale = t_stale
+        self.width = 0
+        self.period = 0
+        self.stale = 0
+        self.new = False
+
+
+
+    def read(self):
+        '''!@brief      Play back the next pulse width.
+            @return     Pulse width [us], or 0 if no pulse has come in for t_stale reads.
+        '''
+        w = self.widths[self.idx]
+        self.idx += 1
+        if self.idx >= len(self.widths):
+            self.idx = 0
+        if w:
+            self.width = w
+            self.stale = 0
+            self.new = True
+        else:
+            self.stale += 1
+            self.new = False
+            if self.stale > self.t_stale:
+                self.width = 0
+        return self.width
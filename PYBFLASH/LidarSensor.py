@@ -6,6 +6,9 @@
     @author     Joseph Penrose & Paolo Navarro
     @date       December 5, 2023
 '''
+from array import array
+import utime
+
 class LidarSensor():
     '''!@brief      Romi LIDAR distance sensor firmware class
         @details    LidarSensor.py contains the class driver for the Pololu (item # 4064) LIDAR
@@ -19,31 +22,156 @@ class LidarSensor():
         @details    LidarSensor creates an object that runs regularly with Romi's multitasking.
                     It works with the pulse width measurement ISR to constantly update the
                     distance measurement Share.
+                    
+        @details    Given a LidarIC object, LidarSensor reads the pulse width from the hardware
+                    input capture instead, and publishes it to the pulse width Share itself, so
+                    no ISR is involved in the measurement at all.
+                    
+        @details    Single LIDAR readings are noisy, and one bad one used to be enough to start
+                    the obstacle routine. Each reading now goes into a small preallocated ring
+                    buffer, and the distance Share gets the median of the ring. A reading that
+                    jumps more than gate away from the median is thrown out once before it is
+                    let in, so a lone spike never reaches the median at all, while a real change
+                    in distance still comes through a few ticks later.
+                    
+        @details    LidarSensor also estimates the closing speed to whatever is ahead, and from
+                    it the time to collision (TTC). For a standing obstacle the closing speed is
+                    just Romi's own speed, which the encoders measure much more cleanly than
+                    differencing LIDAR readings can. So the closing speed is the encoder speed
+                    plus a slow low-pass of the difference between the LIDAR rate and the
+                    encoder speed, which only picks up obstacles that are themselves moving.
+                    Without encoder speeds, the low-passed LIDAR rate is used alone.
     '''
     
-    def __init__(self, LidarShares):
+    def __init__(self, LidarShares, IC = None, Speed = None, r = 0.035, N = 5):
         '''!@brief      Initializes and returns an object associated with a Romi LidarSensor.
             @details    Unpacks Shares and initializes variables.
         
-                            LidarShares contains two Shares. They are used to pass data around Romi's main program.
-                            LidarShares[0] = distance       [mm]    (float)
+                            LidarShares contains three Shares. They are used to pass data around Romi's main program.
+                            LidarShares[0] = distance       [mm]    (float, filtered)
                             LidarShares[1] = pulse width    [us]    (float)
+                            LidarShares[2] = time to coll.  [s]     (float)
             
             @param      LidarShares A tuple containing all of LidarSensor's Shares objects.
+            @param      IC          Optional LidarIC (or LidarICStub) object. When given, the
+                                    pulse width is measured by timer input capture instead of
+                                    the ISR. Default none
+            @param      Speed       Optional tuple of the left and right encoder speed Shares
+                                    [rad/s], for the closing speed. Default none
+            @param      r           Wheel radius [m]. Default 0.035
+            @param      N           Ring buffer length for the median. Default 5
         '''
         self.distance = LidarShares[0]      # distance measurement Share    
         self.dt = LidarShares[1]            # pulse width Share
         self.distance.put(999)              # Distance in [mm]
         self.d_calc = 999                   # calculated distance [mm]
+        self.ic = IC                        # hardware pulse width capture
+        self.ttc = LidarShares[2]           # time to collision Share
+        self.ttc.put(99)                    # Time to collision in [s]
+        self.speed = Speed                  # encoder speed Shares
+        self.k_v = 1000*r/2                 # [mm/rad] mean wheel speed to Romi speed
+        
+        # Median filter
+        self.N = N                          # ring buffer length
+        self.ring = array('f', [999]*N)     # [mm] last N accepted readings
+        self.srt = array('f', [999]*N)      # [mm] sorted scratch copy
+        self.idx = 0                        # next ring slot
+        self.n_fill = 0                     # readings in the ring
+        self.gate = 100                     # [mm] outlier gate around the median
+        self.n_rej = 0                      # readings rejected in a row
+        self.n_rej_max = 1                  # rejections before a jump is let in
+        self.d_med = 999                    # [mm] filtered distance
+        
+        # Closing speed & time to collision
+        self.d_prev = 999                   # [mm] last filtered distance
+        self.t_prev = utime.ticks_us()      # [us] time of the last filtered distance
+        self.v_rel = 0.0                    # [mm/s] obstacle's own closing speed
+        self.v_close = 0.0                  # [mm/s] closing speed
+        self.beta = 0.02                    # closing speed low-pass gain
+        self.v_min = 20.0                   # [mm/s] slower than this never collides
+        self.ttc_max = 99.0                 # [s] time to collision when not closing
+        self.t_coll = self.ttc_max          # [s] time to collision
         
         
 
     def getDistance(self):
         '''!@brief      Helper function that measures the distance sensed by the LIDAR sensor.
-            @details    TThe returned distance is in millimeters. The calculation can be found 
+            @details    The returned distance is in millimeters. The calculation can be found 
                         in Pololu's documentation for the sensor on their website (item # 4064).
         '''
+        # Pulse width from hardware capture, if we have it
+        if self.ic is not None:
+            width = self.ic.read()
+            if width == 0:
+                return              # no pulses, hold the last distance
+            self.dt.put(width)
         self.d_calc = 3/4*(self.dt.get()-1000) # [mm]
+        
+        
+        
+    def filter(self, d):
+        '''!@brief      Pass one reading through the outlier gate and ring buffer median.
+            @param      d       Raw distance [mm].
+            @return     Filtered distance [mm].
+        '''
+        # Outlier gate against the current median
+        if self.n_fill == self.N and abs(d - self.d_med) > self.gate and self.n_rej < self.n_rej_max:
+            self.n_rej += 1
+            return self.d_med
+        self.n_rej = 0
+        
+        # Into the ring
+        self.ring[self.idx] = d
+        self.idx += 1
+        if self.idx >= self.N:
+            self.idx = 0
+        if self.n_fill < self.N:
+            self.n_fill += 1
+            
+        # Median by insertion sort into the scratch buffer
+        srt = self.srt
+        n = self.n_fill
+        for i in range(n):
+            v = self.ring[i]
+            j = i
+            while j > 0 and srt[j - 1] > v:
+                srt[j] = srt[j - 1]
+                j -= 1
+            srt[j] = v
+        self.d_med = srt[n//2]
+        return self.d_med
+        
+        
+        
+    def closing(self, d):
+        '''!@brief      Update the closing speed and time to collision.
+            @param      d       Filtered distance [mm].
+        '''
+        t = utime.ticks_us()
+        dt = utime.ticks_diff(t, self.t_prev)/10**6
+        self.t_prev = t
+        if dt <= 0:
+            return
+        if self.n_fill < self.N:
+            self.d_prev = d             # no rate until the ring is full
+            return
+        v_lid = (self.d_prev - d)/dt        # [mm/s] LIDAR closing rate
+        self.d_prev = d
+        
+        if self.speed is not None:
+            # Encoder speed, plus whatever the obstacle is doing on its own
+            v_enc = self.k_v*(self.speed[0].get() + self.speed[1].get())
+            self.v_rel += self.beta*((v_lid - v_enc) - self.v_rel)
+            self.v_close = v_enc + self.v_rel
+        else:
+            self.v_close += self.beta*(v_lid - self.v_close)
+            
+        if self.v_close > self.v_min:
+            self.t_coll = d/self.v_close
+            if self.t_coll > self.ttc_max:
+                self.t_coll = self.ttc_max
+        else:
+            self.t_coll = self.ttc_max
             
         
         
@@ -51,8 +179,8 @@ class LidarSensor():
         '''!@brief      Main cotask task for LidarSensor.
             @details    The LidarSensor main task has states:
                 
-                            1:  Normal operation state. Continuously compute distance and push the
-                                current measurement to the distance Share.
+                            1:  Normal operation state. Continuously compute distance, filter it,
+                                update the time to collision, and push both to their Shares.
                             
             @details    Like all of Romi's cooperative multitasking tasks, MainTask is written
                         as a generator function with an infinite loop. Each pass through the
@@ -62,7 +190,10 @@ class LidarSensor():
         while True:
             # State 1: Get distance
             self.getDistance()
-            self.distance.put(self.d_calc)
+            self.filter(self.d_calc)
+            self.closing(self.d_med)
+            self.distance.put(self.d_med)
+            self.ttc.put(self.t_coll)
             # print(f'distance {self.d_calc} mm')
             yield 'grra'
             
\ No newline at end of file
@@ -11,7 +11,10 @@
     @date       October 17, 2023
 '''
 # Required modules
+from array import array
+import struct
 import utime
+from PID import PID
 class LineCL():
     '''!@brief      Romi line following closed-loop controller object
         @details    LineCL is a special closed-loop controller that is specifically set up for
@@ -24,9 +27,46 @@ class LineCL():
         @details    The LineCL class is intended to be used inside of Romi's main program to
                     compute differential drive effort required to stay on track following the
                     line of the ME 405 Mechatronics term project maze.
+                    
+        @details    The control law itself runs in a PID engine (see PID.py) with the gains
+                    precomputed into discrete coefficients for the task period, derivative on
+                    the measurement through a low-pass filter, conditional-integration
+                    anti-windup, and an optional output rate limit.
+                    
+        @details    Gains can be scheduled. The line follower's turning effort scales with its
+                    base speed, so one fixed Kp is sluggish when slow and oscillates when fast,
+                    and a tight curve needs more authority than a straight. With a schedule set
+                    (SetSchedule), Schedule() is called every tick with Romi's forward speed and
+                    path curvature, and Kp, Ki, and Kd are interpolated bilinearly from small
+                    tables over both. The speed and curvature are low-passed first, so the
+                    gains glide between table entries instead of jumping.
+                    
+        @details    Gains can also be found on the robot by relay auto-tuning. In place of the
+                    PID, a relay steers Romi by +/-d depending on which side of the line it is
+                    on, with a little hysteresis eps. This drives a small, steady oscillation
+                    about the line, and from its amplitude a and period Pu the ultimate gain is
+                    Ku = 4d/(pi*sqrt(a^2 - eps^2)). A tuning rule from RULES then turns Ku and Pu
+                    into Kp = kp*Ku, Ti = ti*Pu, Td = td*Pu. The first n_skip cycles are thrown
+                    out while the oscillation settles, and the test is called off if the sensor
+                    value goes past a_max, so the oscillation stays bounded.
+                    
+        @details    The tuned gains are saved to 'line_gains.bin', packed as '<2sffffff' (b'LG',
+                    Kp, Ki, Kd, Ku, Pu, tuning speed [m/s]), and load() applies them at boot. If
+                    a schedule is set, its Kp table is scaled to match the tuned Kp at the
+                    tuning speed on a straight, and Ki and Kd follow Kp with the tuned Ti and
+                    Td, so the schedule keeps its shape and only its level comes from the test.
     '''
+    
+    ## Tuning rules: (Kp/Ku, Ti/Pu, Td/Pu), 0 turns a term off
+    RULES = {'p':       (0.50, 0.0,  0.0),      # Ziegler-Nichols P only
+             'zn':      (0.60, 0.50, 0.125),    # Ziegler-Nichols PID
+             'tl':      (0.45, 2.2,  0.159),    # Tyreus-Luyben PID, less overshoot
+             'pessen':  (0.70, 0.40, 0.15),     # Pessen integral rule
+             'so':      (0.33, 0.50, 0.33),     # Ziegler-Nichols some overshoot
+             'no':      (0.20, 0.50, 0.33)}     # Ziegler-Nichols no overshoot
 
-    def __init__(self, Kp, Ki = 0, Kd = 0, highSat = None, lowSat = None):
+    def __init__(self, Kp, Ki = 0, Kd = 0, highSat = None, lowSat = None, Ts = 0.010, rate = None,
+                 measured_dt = False, fname = 'line_gains.bin'):
         '''!@brief      Constructs a closed loop controller object
             @details    Constructs a CL, P/PI/PD/PID controller with optional control signal saturation.
                         The type of controller is set by the non-zero gains entered. The init method
@@ -38,6 +78,10 @@ class LineCL():
             @param      Kd      Derivative gain, required for PD/PID control only. Default off
             @param      highSat Upper limit of control signal saturation level (i.e. PWM 100%). Default off
             @param      lowSat  Lower limit of control signal saturation level (i.e. PWM -100%). Default off
+            @param      Ts      Controller sample period [s], the calling task's period. Default 0.010
+            @param      rate    Control signal rate limit [1/s]. Default off
+            @param      measured_dt True to time each call instead of assuming Ts. Default False
+            @param      fname   Tuned gains file name on flash. Default 'line_gains.bin'
         '''
         # Store gains in memory
         if Kp <= 0:
@@ -46,13 +90,6 @@ class LineCL():
             self.Kp = Kp    # Proportional gain
         self.Ki = Ki        # Integral gain
         self.Kd = Kd        # Derivative gain
-        self.err = 0.0      # Error double
-        self.esum = 0.0     # Error sum double
-        self.t0 = utime.ticks_us()                                       # Curr utime (us)
-        self.dt = utime.ticks_diff(utime.ticks_us(), self.t0)/(10**6)     # Delta time (s)
-        self.Cp = 0.0       # Proportional control signal
-        self.Ci = 0.0       # Integral control signal
-        self.Cd = 0.0       # Derivative control signal
         self.C = 0.0        # Controller output signal
         
         # Set up control signal saturation
@@ -60,11 +97,29 @@ class LineCL():
             self.highSat = highSat  # Record high level saturation
             self.lowSat = lowSat    # Record low level saturation
             self.satEn = True       # Raise saturation enabled flag
-        elif highSat is not None and lowSat is None:
+        elif highSat is not None or lowSat is not None:
             raise Exception("Control saturation requires both upper and lower limits to be defined")
         else:
             self.satEn = False      # Lower saturation enabled flag
         
+        # Gain schedule, off until SetSchedule()
+        self.scheduled = False  # True once a schedule is set
+        self.v_f = 0.0          # [m/s] filtered scheduling speed
+        self.k_f = 0.0          # [1/m] filtered scheduling curvature
+        
+        # Relay auto-tune
+        self.fname = fname      # tuned gains file name
+        self.tuned = False      # True once tuned gains are applied
+        self.relay_done = True  # True when no relay test is running
+        self.relay_fail = False # True if the last relay test was called off
+        self.Ku = 0.0           # ultimate gain
+        self.Pu = 0.0           # [s] ultimate period
+        self.v_tune = 0.0       # [m/s] speed the gains were tuned at
+        
+        # PID engine, coefficients precomputed for the sample period
+        self.pid = PID(self.Kp, self.Ki, self.Kd, Ts, u_min = lowSat, u_max = highSat,
+                       du_max = rate, measured_dt = measured_dt)
+        
         
     def ChangeKp(self, newKp):    
         '''!@brief      Update proportional gain Kp with a new value
@@ -76,6 +131,7 @@ class LineCL():
             raise Exception("Proportional gain must be positive & non-zero")
         else:
             self.Kp = newKp
+            self.pid.set_gains(self.Kp, self.Ki, self.Kd)
         
         
     def ChangeKi(self, newKi):    
@@ -89,6 +145,7 @@ class LineCL():
             raise Exception("Integral gain must be non-negative")
         else:
             self.Ki = newKi
+            self.pid.set_gains(self.Kp, self.Ki, self.Kd)
         
         
     def ChangeKd(self, newKd):    
@@ -102,8 +159,237 @@ class LineCL():
             raise Exception("Derivative gain must be non-negative")
         else:
             self.Kd = newKd
+            self.pid.set_gains(self.Kp, self.Ki, self.Kd)
         
 
+    def SetSchedule(self, v_bp, k_bp, Kp_tab, Ki_tab = None, Kd_tab = None, alpha = 0.1):
+        '''!@brief      Set up gain scheduling by speed and curvature
+            @details    Each gain table has one row per speed breakpoint and one column per
+                        curvature breakpoint. Outside the breakpoints, the end values hold.
+            @param      v_bp    Increasing speed breakpoints [m/s]
+            @param      k_bp    Increasing curvature breakpoints [1/m]
+            @param      Kp_tab  Kp table, a tuple of rows
+            @param      Ki_tab  Ki table, a tuple of rows. Default all zero
+            @param      Kd_tab  Kd table, a tuple of rows. Default all zero
+            @param      alpha   Low-pass gain on speed & curvature per tick, 0~1. Default 0.1
+        '''
+        n_v = len(v_bp)
+        n_k = len(k_bp)
+        tabs = []
+        for tab in (Kp_tab, Ki_tab, Kd_tab):
+            if tab is None:
+                tabs.append(array('f', [0.0]*(n_v*n_k)))
+                continue
+            if len(tab) != n_v or any(len(row) != n_k for row in tab):
+                raise Exception("Gain tables must have one row per speed and one column per curvature")
+            tabs.append(array('f', [g for row in tab for g in row]))
+        if min(tabs[0]) <= 0:
+            raise Exception("Proportional gain must be positive & non-zero")
+        self.v_bp = array('f', v_bp)
+        self.k_bp = array('f', k_bp)
+        self.Kp_tab, self.Ki_tab, self.Kd_tab = tabs
+        self.alpha = alpha
+        self.scheduled = True
+        
+        
+    def _locate(self, bp, x):
+        '''!@brief      Find the breakpoint interval and fraction for x
+            @param      bp      Increasing breakpoints
+            @param      x       Scheduling variable
+            @return     Tuple (index, fraction) with 0 <= fraction <= 1
+        '''
+        n = len(bp)
+        if n == 1 or x <= bp[0]:
+            return 0, 0.0
+        if x >= bp[n - 1]:
+            return n - 2, 1.0
+        i = 0
+        while x > bp[i + 1]:
+            i += 1
+        return i, (x - bp[i])/(bp[i + 1] - bp[i])
+        
+        
+    def _lookup(self, tab, iv, fv, ik, fk):
+        '''!@brief      Bilinear interpolation in one gain table
+        '''
+        n_k = len(self.k_bp)
+        iv1 = iv + 1 if len(self.v_bp) > 1 else iv
+        ik1 = ik + 1 if n_k > 1 else ik
+        g0 = tab[iv*n_k + ik]*(1 - fk) + tab[iv*n_k + ik1]*fk
+        g1 = tab[iv1*n_k + ik]*(1 - fk) + tab[iv1*n_k + ik1]*fk
+        return g0*(1 - fv) + g1*fv
+        
+        
+    def Schedule(self, v, kappa):
+        '''!@brief      Update the gains for the current speed and curvature
+            @details    Does nothing if no schedule is set.
+            @param      v       Forward speed [m/s]
+            @param      kappa   Path curvature [1/m], either sign
+        '''
+        if not self.scheduled:
+            return
+        if kappa < 0:
+            kappa = -kappa
+        self.v_f += self.alpha*(v - self.v_f)
+        self.k_f += self.alpha*(kappa - self.k_f)
+        iv, fv = self._locate(self.v_bp, self.v_f)
+        ik, fk = self._locate(self.k_bp, self.k_f)
+        self.Kp = self._lookup(self.Kp_tab, iv, fv, ik, fk)
+        self.Ki = self._lookup(self.Ki_tab, iv, fv, ik, fk)
+        self.Kd = self._lookup(self.Kd_tab, iv, fv, ik, fk)
+        self.pid.set_gains(self.Kp, self.Ki, self.Kd)
+        
+        
+    def RelayStart(self, d = 0.3, eps = 0.05, n_cyc = 4, n_skip = 2, a_max = 1.5, t_max = 20.0):
+        '''!@brief      Start a relay auto-tune test
+            @param      d       Relay output amplitude, as a control signal. Default 0.3
+            @param      eps     Relay hysteresis, in sensor value. Default 0.05
+            @param      n_cyc   Oscillation cycles to measure. Default 4
+            @param      n_skip  Cycles to throw out first while the oscillation settles. Default 2
+            @param      a_max   Largest sensor value allowed before the test is called off.
+                                Default 1.5
+            @param      t_max   Longest test time [s]. Default 20
+        '''
+        if d <= 0 or eps < 0:
+            raise Exception("Relay amplitude must be positive and hysteresis non-negative")
+        self.r_d = d
+        self.r_eps = eps
+        self.r_n = n_cyc
+        self.r_skip = n_skip
+        self.r_amax = a_max
+        self.r_tmax = int(t_max*1000)
+        self.r_u = 0.0              # relay output
+        self.r_t0 = utime.ticks_ms()
+        self.r_tup = None           # [ms] time of the last upward switch
+        self.r_max = -3e38          # sensor peak this cycle
+        self.r_min = 3e38           # sensor trough this cycle
+        self.r_seen = 0             # cycles completed
+        self.r_P = 0.0              # [ms] sum of measured periods
+        self.r_a = 0.0              # sum of measured amplitudes
+        self.relay_done = False
+        self.relay_fail = False
+        
+        
+    def Relay(self, FB):
+        '''!@brief      Relay controller for auto-tuning
+            @details    Call every tick in place of controller() while a relay test runs. Sets
+                        relay_done when enough cycles have been measured or the test is called
+                        off, and relay_fail in the second case.
+            @param      FB      Feedback source, the line sensor value
+            @return     Control signal, +/-d
+        '''
+        if self.relay_done:
+            return 0.0
+        t = utime.ticks_ms()
+        if FB > self.r_amax or FB < -self.r_amax or utime.ticks_diff(t, self.r_t0) > self.r_tmax:
+            self.relay_done = True
+            self.relay_fail = True
+            return 0.0
+        if FB > self.r_max:
+            self.r_max = FB
+        if FB < self.r_min:
+            self.r_min = FB
+        
+        # Switch with hysteresis; the error is -FB since the target is zero
+        if self.r_u <= 0 and FB < -self.r_eps:
+            self.r_u = self.r_d
+            # One full cycle per upward switch
+            if self.r_tup is not None:
+                self.r_seen += 1
+                if self.r_seen > self.r_skip:
+                    self.r_P += utime.ticks_diff(t, self.r_tup)
+                    self.r_a += 0.5*(self.r_max - self.r_min)
+                    if self.r_seen - self.r_skip >= self.r_n:
+                        self.relay_done = True
+            self.r_tup = t
+            self.r_max = FB
+            self.r_min = FB
+        elif self.r_u >= 0 and FB > self.r_eps:
+            self.r_u = -self.r_d
+        return self.r_u
+        
+        
+    def Tune(self, rule = 'tl', v = 0.0):
+        '''!@brief      Work out and apply PID gains from the last relay test
+            @param      rule    Tuning rule name, a key of RULES. Default 'tl'
+            @param      v       Speed the test was run at [m/s]. Default 0
+            @return     Tuple (Kp, Ki, Kd), or None if the test did not finish.
+        '''
+        if rule not in self.RULES:
+            raise ValueError(f"Unknown tuning rule '{rule}'")
+        if not self.relay_done or self.relay_fail or self.r_seen <= self.r_skip:
+            return None
+        n = self.r_seen - self.r_skip
+        a = self.r_a/n
+        if a <= self.r_eps:
+            return None
+        self.Ku = 4*self.r_d/(3.14159265*(a*a - self.r_eps*self.r_eps)**0.5)
+        self.Pu = self.r_P/n/1000
+        kp, ti, td = self.RULES[rule]
+        Kp = kp*self.Ku
+        Ki = Kp/(ti*self.Pu) if ti > 0 else 0.0
+        Kd = Kp*td*self.Pu
+        self.Apply(Kp, Ki, Kd, v)
+        print(f'LineCL: Ku = {self.Ku:.3f}, Pu = {self.Pu:.3f} s, {rule}: '
+              f'Kp = {Kp:.3f}, Ki = {Ki:.3f}, Kd = {Kd:.4f}')
+        return Kp, Ki, Kd
+        
+        
+    def Apply(self, Kp, Ki, Kd, v):
+        '''!@brief      Apply tuned gains, rescaling the schedule if there is one
+            @param      Kp      Tuned proportional gain
+            @param      Ki      Tuned integral gain
+            @param      Kd      Tuned derivative gain
+            @param      v       Speed the gains were tuned at [m/s]
+        '''
+        if Kp <= 0 or Ki < 0 or Kd < 0:
+            raise Exception("Tuned gains must be non-negative with a positive Kp")
+        if self.scheduled:
+            iv, fv = self._locate(self.v_bp, v)
+            s = Kp/self._lookup(self.Kp_tab, iv, fv, 0, 0.0)
+            for i in range(len(self.Kp_tab)):
+                self.Kp_tab[i] *= s
+                self.Ki_tab[i] = self.Kp_tab[i]*Ki/Kp
+                self.Kd_tab[i] = self.Kp_tab[i]*Kd/Kp
+        self.Kp = Kp
+        self.Ki = Ki
+        self.Kd = Kd
+        self.pid.set_gains(Kp, Ki, Kd)
+        self.v_tune = v
+        self.tuned = True
+        
+        
+    def load(self):
+        '''!@brief      Read tuned gains from flash and apply them
+            @details    Call after SetSchedule, so the schedule is rescaled too.
+            @return     True if tuned gains were read, else False.
+        '''
+        try:
+            with open(self.fname, 'rb') as file:
+                data = file.read(26)
+        except OSError:
+            print(f'LineCL: no {self.fname}, using default gains')
+            return False
+        if len(data) < 26 or data[0:2] != b'LG':
+            print(f'LineCL: {self.fname} is not a gains file, ignoring it')
+            return False
+        magic, Kp, Ki, Kd, self.Ku, self.Pu, v = struct.unpack('<2sffffff', data)
+        if Kp <= 0 or Ki < 0 or Kd < 0:
+            print(f'LineCL: {self.fname} has bad gains, ignoring it')
+            return False
+        self.Apply(Kp, Ki, Kd, v)
+        return True
+        
+        
+    def save(self):
+        '''!@brief      Write the tuned gains to flash.
+        '''
+        with open(self.fname, 'wb') as file:
+            file.write(struct.pack('<2sffffff', b'LG', self.Kp, self.Ki, self.Kd,
+                                   self.Ku, self.Pu, self.v_tune))
+        print(f'LineCL: gains saved as "{self.fname}"')
+        
+        
     def controller(self, R, FB) :
         '''!@brief      Closed-loop, negative feedback controller
             @details    Runs closed-loop negative feedback control in P, PI, PD, or 
@@ -113,45 +399,17 @@ class LineCL():
                         control signal saturation if it was defined in initialization.
                         
                         Basic PID operation derived from ME 305 Intro to Mechatronics
-                        
-                        Input validation code written by Daniel Goldberg, stackoverflow
             @param      R       Reference input. Numerical input only
             @param      FB      Feedback source. Numerical input only
         '''   
-        # Validate inputs
-        try:
-            float(R)
-            float(FB)           # Only int/float data types work in float()
-        except ValueError:
-            print("Numeric (int or float) inputs only")
-        
-        # Compute error
-        self.err = R - FB       # Error at the summing junction (NFB)
-        
-        # Deal with time
-        self.dt = utime.ticks_diff(utime.ticks_us(), self.t0)/(10**6)   # Delta time (s)
-        self.t0 = utime.ticks_us()                                      # New time (us)           
-        
-        # Compute proportional control
-        self.Cp = self.Kp*self.err                  # Proportional control is just an error gain
-    
-        # Compute integral control
-        interr = self.err*self.dt
-        self.esum += interr
-        self.Ci = self.Ki*self.esum                 # Integral control using Riemann sum
-    
-        # Compute derivative control
-        self.Cd = self.Kd*(self.err/self.dt)        # Derivative control using high school calculus approx
-        
-        # Add up control signals
-        self.C = self.Cp + self.Ci + self.Cd        # Control is sum of signals
-        
-        # Handle control signal saturation
-        if self.satEn:                              # Check if saturation enabled
-            if self.C > self.highSat:
-                self.C = self.highSat               # High level saturation
-            if self.C < self.lowSat:
-                self.C = self.lowSat                # Low level saturation
-        
-        # Send control signal
-        return self.C                               # Return control signal
\ No newline at end of file
+        self.C = self.pid.update(R, FB)     # Control signal from the PID engine
+        return self.C                       # Return control signal
+
+
+    def reset(self):
+        '''!@brief      Clear the controller's integrator and history
+            @details    Call before starting a new line following run so that nothing is
+                        carried over from the last one.
+        '''
+        self.pid.reset()
+        self.C = 0.0
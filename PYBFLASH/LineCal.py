@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+'''!@file       LineCal.py
+    @brief      Romi line sensor calibration
+    @details    LineCal.py contains the class that calibrates each of Romi's line sensor
+                channels to its own white and black levels and normalizes raw readings.
+    @author     Joseph Penrose & Paolo Navarro
+    @date       October 18, 2026
+'''
+from array import array
+import struct
+import utime
+
+class LineCal():
+    '''!@brief      Per-channel line sensor calibration and normalization.
+        @details    Every QTR sensor has its own gain and offset, and the paper and ink change
+                    from track to track, so a fixed threshold on the raw reading only works on
+                    the robot and floor it was tuned on. LineCal records each channel's white
+                    (minimum) and black (maximum) reading during a calibration sweep, and then
+                    maps every raw reading onto a nominal sensor: the channel's white level
+                    becomes WHITE counts and its black level becomes BLACK counts. WHITE and
+                    BLACK are the typical levels of the sensors LineSensors was tuned with
+                    (0.2 V and 2.3 V), so the existing thresholds and controller gains keep
+                    their meaning while every channel reads the same on any floor.
+
+        @details    Normalization runs every tick on all channels, so it is done in integer
+                    arithmetic with tables precomputed from the calibration:
+
+                        norm = ((raw - off[ch])*scale[ch] >> 12) + WHITE
+
+                    clamped to 0~4095, where off is the white level and scale is the Q12 gain
+                    (BLACK - WHITE)/(black - white).
+
+        @details    Like BNO calibration, the white and black levels are saved to flash, in
+                    'line_cal.bin' as a compact binary table: b'LC', the channel count, then
+                    the white levels and the black levels as little-endian uint16 counts.
+    '''
+
+    ## Nominal white level [counts], 0.2 V
+    WHITE = 248
+    ## Nominal black level [counts], 2.3 V
+    BLACK = 2854
+
+    def __init__(self, n_ch = 10, t_sweep = 5000, min_span = 300, fname = 'line_cal.bin'):
+        '''!@brief      Initializes and returns a LineCal object.
+            @details    Until a calibration is loaded or measured, the tables pass raw readings
+                        straight through.
+            @param      n_ch        Number of channels. Default 10
+            @param      t_sweep     Calibration sweep length [ms]. Default 5000
+            @param      min_span    Smallest black - white span [counts] accepted for a
+                                    channel. Default 300
+            @param      fname       Calibration file name on flash. Default 'line_cal.bin'
+        '''
+        self.n_ch = n_ch
+        self.t_sweep = t_sweep
+        self.min_span = min_span
+        self.fname = fname
+
+        # Measured levels
+        self.white = array('H', [0]*n_ch)       # [counts] white level per channel
+        self.black = array('H', [4095]*n_ch)    # [counts] black level per channel
+
+        # Precomputed normalization tables, identity until calibrated
+        self.off = array('i', [0]*n_ch)         # [counts] offset per channel
+        self.scale = array('i', [4096]*n_ch)    # [Q12] gain per channel
+        self.base = 0                           # [counts] output offset
+        self.out = array('H', [0]*n_ch)         # normalized counts
+
+
+
+    def tables(self):
+        '''!@brief      Precompute the integer offset and scale tables from the levels.
+        '''
+        for ch in range(self.n_ch):
+            span = self.black[ch] - self.white[ch]
+            if span < 1:
+                span = 1
+            self.off[ch] = self.white[ch]
+            self.scale[ch] = ((self.BLACK - self.WHITE) << 12)//span
+        self.base = self.WHITE
+
+
+
+    def normalize(self, vals):
+        '''!@brief      Normalize one set of raw readings.
+            @param      vals    Raw 12-bit counts, one per channel.
+            @return     self.out, the normalized counts for each channel.
+        '''
+        out = self.out
+        off = self.off
+        scale = self.scale
+        base = self.base
+        for ch in range(self.n_ch):
+            n = ((vals[ch] - off[ch])*scale[ch] >> 12) + base
+            if n < 0:
+                n = 0
+            elif n > 4095:
+                n = 4095
+            out[ch] = n
+        return out
+
+
+
+    def load(self):
+        '''!@brief      Read the calibration from flash and build the tables.
+            @return     True if a valid calibration was read, else False.
+        '''
+        try:
+            with open(self.fname, 'rb') as file:
+                data = file.read()
+        except OSError:
+            return False
+        if len(data) != 3 + 4*self.n_ch or data[0:2] != b'LC' or data[2] != self.n_ch:
+            print(f'LineCal: {self.fname} does not match, ignoring it')
+            return False
+        vals = struct.unpack('<' + 'H'*(2*self.n_ch), data[3:])
+        for ch in range(self.n_ch):
+            self.white[ch] = vals[ch]
+            self.black[ch] = vals[self.n_ch + ch]
+        self.tables()
+        return True
+
+
+
+    def save(self):
+        '''!@brief      Write the calibration to flash as a compact binary table.
+        '''
+        with open(self.fname, 'wb') as file:
+            file.write(b'LC' + bytes([self.n_ch]))
+            file.write(struct.pack('<' + 'H'*(2*self.n_ch), *(tuple(self.white) + tuple(self.black))))
+        print(f'LineCal: new calibration saved as "{self.fname}"')
+
+
+
+    def Sweep(self, burst):
+        '''!@brief      Line sensor calibration sweep.
+            @details    Records the lowest and highest reading of every channel while Romi is
+                        slid back and forth across a line, so every sensor sees both paper and
+                        ink. If any channel does not see enough contrast, the sweep starts
+                        over. This works as a GENERATOR, a SUB-TASK within a STATE in a
+                        MainTask, and finishes with the tables built.
+            @param      burst   ADCBurst sampling the same channels.
+        '''
+        while True:
+            print(f'LineCal: slide Romi back and forth across a line for {self.t_sweep//1000} s')
+            for ch in range(self.n_ch):
+                self.white[ch] = 4095
+                self.black[ch] = 0
+            t0 = utime.ticks_ms()
+            while utime.ticks_diff(utime.ticks_ms(), t0) < self.t_sweep:
+                vals = burst.sample()
+                for ch in range(self.n_ch):
+                    v = vals[ch]
+                    if v < self.white[ch]:
+                        self.white[ch] = v
+                    if v > self.black[ch]:
+                        self.black[ch] = v
+                yield 0
+
+            # Check contrast on every channel
+            weak = [ch for ch in range(self.n_ch) if self.black[ch] - self.white[ch] < self.min_span]
+            if not weak:
+                break
+            print(f'LineCal: channels {weak} did not see the line, sweep again')
+
+        self.tables()
+        yield 1
@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+'''!@file       LineFeat.py
+    @brief      Romi track feature detector
+    @details    LineFeat.py contains the class that watches both of Romi's line sensor arrays
+                against distance travelled and classifies crossbars (the finish line), dashed
+                gaps, and a lost line.
+    @author     Joseph Penrose & Paolo Navarro
+    @date       October 18, 2026
+'''
+from array import array
+
+class LineFeat():
+    '''!@brief      Crossbar, gap, and lost line detector for Romi's line sensor arrays.
+        @details    The old finish check waits for every front sensor to read dark at once and
+                    then for all of them to go light. When Romi crosses the finish at a steep
+                    angle, the bar passes under the sensors one at a time, they are never all
+                    dark together, and the finish is missed. LineFeat instead remembers the
+                    distance travelled when each channel last read dark. An array is "wide" when
+                    at least n_wide of its sensors have read dark within the last w_bar of
+                    travel, which catches a bar at any angle a line can be followed at.
+
+        @details    Features are matched against distance, not time, so they do not depend on
+                    speed:
+
+                        Crossbar:   The front array goes wide, and the axial array goes wide
+                                    L_arr later (within s_tol). Confidence is the fraction of
+                                    sensors that saw the bar on both arrays, times how well the
+                                    spacing matched. If the axial array never confirms, the
+                                    crossbar is still reported at the end of the window, on the
+                                    front array alone at half confidence.
+                        Gap:        The front array loses the line and finds it again within
+                                    gap_max. Confidence is higher when the axial array kept the
+                                    line the whole way, which a dashed line does and a turn
+                                    does not.
+                        Lost:       The front array has lost the line for longer than gap_max.
+                                    Confidence is higher when the axial array has lost it
+                                    too.
+
+        @details    Each classification is published as an event: the event code on
+                    Feat_shares[0], its confidence (0~1) on Feat_shares[1], and a raised trash
+                    flag on Feat_shares[2] so a consumer sees every event once. If nothing has
+                    cleared the flag since the last event, it stays raised and the event code
+                    is simply updated, so LineFeat never blocks on it. Distance comes
+                    from the encoder position Shares, so LineFeat keeps working through encoder
+                    resets.
+    '''
+
+    ## No event
+    NONE = 0
+    ## Crossbar (finish line or cross-hatch)
+    CROSSBAR = 1
+    ## Dashed line gap
+    GAP = 2
+    ## Line lost
+    LOST = 3
+
+    def __init__(self, Feat_shares, pos_L, pos_R, r, L_arr = 75.0, dark = 1551, n_wide = 4,
+                 w_bar = 40.0, s_tol = 25.0, gap_max = 60.0):
+        '''!@brief      Initializes and returns a LineFeat object.
+            @details    Feat_shares contains three Shares:
+
+                            Feat_shares[0] = event code         [--]    (uint8)
+                            Feat_shares[1] = event confidence   [--]    (float)
+                            Feat_shares[2] = new event flag     [trash] (flag)
+
+            @param      Feat_shares A tuple containing all of LineFeat's Shares objects.
+            @param      pos_L       Left encoder position Share [rad].
+            @param      pos_R       Right encoder position Share [rad].
+            @param      r           Wheel radius [m].
+            @param      L_arr       Front array distance ahead of the axial array [mm].
+                                    Default 75
+            @param      dark        Normalized count above which a sensor reads dark.
+                                    Default halfway between LineCal.WHITE and LineCal.BLACK
+            @param      n_wide      Sensors of five that must read dark for a wide array.
+                                    Default 4
+            @param      w_bar       Travel window for a wide array [mm]. Default 40
+            @param      s_tol       Crossbar spacing tolerance [mm]. Default 25
+            @param      gap_max     Longest gap in a dashed line [mm]. Default 60
+        '''
+        # Shares
+        self.event_share = Feat_shares[0]       # event code Share
+        self.event_share.put(self.NONE)         # Initialize event code
+        self.conf_share = Feat_shares[1]        # event confidence Share
+        self.conf_share.put(0)                  # Initialize confidence
+        self.event_flag = Feat_shares[2]        # new event trash flag Queue
+        self.event_flag.clear()                 # clear just in case
+        self.pos_L = pos_L                      # [rad] left encoder position Share
+        self.pos_R = pos_R                      # [rad] right encoder position Share
+
+        # Parameters
+        self.k_s = 1000*r                       # [mm/rad] mean wheel angle to distance
+        self.L_arr = L_arr
+        self.dark = dark
+        self.n_wide = n_wide
+        self.w_bar = w_bar
+        self.s_tol = s_tol
+        self.gap_max = gap_max
+        self.ds_max = 50.0                      # [mm] bigger steps are encoder resets
+
+        # Distance tracking
+        self.s = 0.0                            # [mm] distance travelled
+        self.th_prev = None                     # [rad] last mean wheel angle
+        self.s_dark = array('f', [-1e6]*10)     # [mm] distance each channel last read dark
+
+        # Feature tracking
+        self.s_bar = None               # [mm] distance the front array went wide
+        self.cov_bar = 0                # front sensors that saw the bar
+        self.bar_cool = -1e6            # [mm] no new bar before this distance
+        self.s_lost = None              # [mm] distance the front array lost the line
+        self.ax_kept = True             # True if the axial array kept the line in the gap
+        self.lost = False               # True once a lost line has been reported
+        self.event = self.NONE          # last event
+        self.conf = 0.0                 # last event confidence
+
+
+
+    def distance(self):
+        '''!@brief      Update the distance travelled from the encoder positions.
+            @return     Distance travelled [mm].
+        '''
+        th = 0.5*(self.pos_L.get() + self.pos_R.get())
+        if self.th_prev is not None:
+            ds = (th - self.th_prev)*self.k_s
+            if -self.ds_max < ds < self.ds_max:
+                self.s += ds if ds > 0 else -ds
+        self.th_prev = th
+        return self.s
+
+
+
+    def cover(self, i0):
+        '''!@brief      Count an array's sensors that read dark within the travel window.
+            @param      i0      Index of the array's far left sensor.
+            @return     Number of sensors of five.
+        '''
+        s_min = self.s - self.w_bar
+        n = 0
+        for ch in range(i0, i0 + 5):
+            if self.s_dark[ch] >= s_min:
+                n += 1
+        return n
+
+
+
+    def publish(self, event, conf):
+        '''!@brief      Publish an event to the Shares.
+            @param      event   Event code.
+            @param      conf    Confidence, 0~1.
+            @return     The event code.
+        '''
+        self.event = event
+        self.conf = conf
+        self.event_share.put(event)
+        self.conf_share.put(conf)
+        if self.event_flag.empty():
+            self.event_flag.put(1)      # a full flag would block; it is already raised
+        return event
+
+
+
+    def update(self, vals, front_ok, axial_ok):
+        '''!@brief      Track both arrays for one tick and classify any feature.
+            @param      vals        Normalized counts for all ten channels, axial first.
+            @param      front_ok    True if the front array sees the line.
+            @param      axial_ok    True if the axial array sees the line.
+            @return     Event code of the feature classified this tick, or NONE.
+        '''
+        s = self.distance()
+        for ch in range(10):
+            if vals[ch] > self.dark:
+                self.s_dark[ch] = s
+        cov_f = self.cover(5)
+        cov_a = self.cover(0)
+
+        # Crossbar: front wide, then axial wide one array spacing later
+        if self.s_bar is None:
+            if cov_f >= self.n_wide and s > self.bar_cool:
+                self.s_bar = s
+                self.cov_bar = cov_f
+        else:
+            if cov_f > self.cov_bar:
+                self.cov_bar = cov_f
+            ds = s - self.s_bar
+            if cov_a >= self.n_wide and ds > self.L_arr - self.s_tol:
+                match = 1 - abs(ds - self.L_arr)/self.s_tol
+                conf = (self.cov_bar + cov_a)/10*(match if match > 0 else 0)
+                self.s_bar = None
+                self.bar_cool = s + self.w_bar
+                self.s_lost = None          # the dark-then-light of a bar is no gap
+                return self.publish(self.CROSSBAR, conf)
+            if ds > self.L_arr + self.s_tol:
+                self.s_bar = None
+                self.bar_cool = s
+                return self.publish(self.CROSSBAR, 0.5*self.cov_bar/5)
+
+        # Gap & lost line: front array loses the line
+        if not front_ok:
+            if self.s_lost is None:
+                self.s_lost = s
+                self.ax_kept = True
+            if not axial_ok:
+                self.ax_kept = False
+            if not self.lost and self.s_bar is None and s - self.s_lost > self.gap_max:
+                self.lost = True
+                return self.publish(self.LOST, 0.6 if axial_ok else 1.0)
+        elif self.s_lost is not None:
+            gap = s - self.s_lost
+            self.s_lost = None
+            if self.lost:
+                self.lost = False
+            elif gap > 0:
+                return self.publish(self.GAP, 1.0 if self.ax_kept else 0.7)
+
+        return self.NONE
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+'''!@file       LineFilt.py
+    @brief      Romi line sensor fixed-point filter stage
+    @details    LineFilt.py contains the class that filters every line sensor channel between
+                sampling and line position estimation, with a median-of-3 spike reject and a
+                first-order IIR low-pass, all in integer arithmetic.
+    @author     Joseph Penrose & Paolo Navarro
+    @date       October 18, 2026
+'''
+from array import array
+try:
+    import micropython
+except ImportError:
+    micropython = None      # off the robot, the plain Python filter runs instead
+
+class LineFilt():
+    '''!@brief      Per-channel median-of-3 and IIR filter for the line sensors.
+        @details    Motor PWM couples onto the line sensor wiring, and a single bad conversion
+                    shows up as a jump in the line position that LineCL then acts on. Each
+                    channel first goes through a median of its last three samples, which
+                    removes a single-sample spike completely, and then through a first-order
+                    IIR low-pass,
+
+                        y += (m - y)*2^-k
+
+                    with the gain a power of two so it is a shift. The IIR state is kept in Q4
+                    (sixteenths of a count) so small steps are not lost to truncation.
+
+        @details    Filtering costs delay, and delay costs stability margin in the line
+                    follower. The added group delay at low frequency is 1 sample for the median
+                    and 2^k - 1 samples for the IIR; it is kept in self.delay [samples] and
+                    printed at startup. Either stage can be turned off: med = False skips the
+                    median and k = 0 passes the median straight through.
+
+        @details    All state lives in preallocated arrays and the per-tick work is a viper
+                    function, so filtering ten channels allocates nothing and costs no floating
+                    point. Off the robot (no micropython module), a plain Python version of the
+                    same integer arithmetic runs instead.
+    '''
+
+    def __init__(self, n_ch = 10, k = 1, med = True):
+        '''!@brief      Initializes and returns a LineFilt object.
+            @param      n_ch    Number of channels. Default 10
+            @param      k       IIR shift; the IIR gain is 2^-k, 0 turns the IIR off. Default 1
+            @param      med     True to run the median-of-3 spike reject. Default True
+        '''
+        if k < 0 or k > 8:
+            raise ValueError("IIR shift must be 0~8")
+        self.n_ch = n_ch
+        self.k = k
+        self.med = med
+        self.hist = array('H', [0]*(3*n_ch))    # two past samples per channel, then the output
+        self.y = array('i', [0]*n_ch)           # [Q4 counts] IIR state
+        self.cfg = array('i', [n_ch, k, 1 if med else 0])
+        self.out = memoryview(self.hist)[2*n_ch:]   # filtered counts
+        self.delay = (1 if med else 0) + (1 << k) - 1   # [samples] added group delay
+        self.primed = False
+
+
+
+    def reset(self):
+        '''!@brief      Restart the filter from the next sample, with no transient.
+        '''
+        self.primed = False
+
+
+
+    def run(self, vals):
+        '''!@brief      Filter one set of readings.
+            @param      vals    Counts for each channel, as an array('H').
+            @return     self.out, the filtered counts for each channel.
+        '''
+        if not self.primed:
+            # Start every stage at the first sample
+            n = self.n_ch
+            for ch in range(n):
+                self.hist[ch] = vals[ch]
+                self.hist[n + ch] = vals[ch]
+                self.y[ch] = vals[ch] << 4
+            self.primed = True
+        _filt(vals, self.hist, self.y, self.cfg)
+        return self.out
+
+
+
+def _filt_py(x, h, y, cfg):
+    '''!@brief      Median-of-3 and IIR filter pass, plain Python.
+        @param      x       Input counts, n entries.
+        @param      h       History, 3n entries: last sample, sample before, output.
+        @param      y       IIR state [Q4 counts], n entries.
+        @param      cfg     n, k, and 1 to run the median.
+    '''
+    n = cfg[0]
+    k = cfg[1]
+    med = cfg[2]
+    for ch in range(n):
+        a = x[ch]
+        if med:
+            b = h[ch]
+            c = h[n + ch]
+            h[n + ch] = b
+            h[ch] = a
+            # median of a, b, c
+            lo = a if a < b else b
+            hi = b if a < b else a
+            a = hi if hi < c else (lo if lo > c else c)
+        s = y[ch] + (((a << 4) - y[ch]) >> k)
+        y[ch] = s
+        h[2*n + ch] = (s + 8) >> 4
+
+
+
+if micropython is not None:
+    @micropython.viper
+    def _filt(x: ptr16, h: ptr16, y: ptr32, cfg: ptr32):
+        '''!@brief      Median-of-3 and IIR filter pass, viper. Same as _filt_py().
+        '''
+        n = cfg[0]
+        k = cfg[1]
+        med = cfg[2]
+        ch = 0
+        while ch < n:
+            a = x[ch]
+            if med:
+                b = h[ch]
+                c = h[n + ch]
+                h[n + ch] = b
+                h[ch] = a
+                # median of a, b, c
+                lo = a
+                hi = b
+                if b < a:
+                    lo = b
+                    hi = a
+                if hi < c:
+                    a = hi
+                elif lo > c:
+                    a = lo
+                else:
+                    a = c
+            s = y[ch] + (((a << 4) - y[ch]) >> k)
+            y[ch] = s
+            h[2*n + ch] = (s + 8) >> 4
+            ch += 1
+else:
+    _filt = _filt_py
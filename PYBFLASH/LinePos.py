@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+'''!@file       LinePos.py
+    @brief      Romi sub-sensor line position estimator
+    @details    LinePos.py contains the class that estimates the lateral position of the line
+                under one of Romi's five-sensor arrays to sub-millimetre resolution.
+    @author     Joseph Penrose & Paolo Navarro
+    @date       October 18, 2026
+'''
+from array import array
+import struct
+
+class LinePos():
+    '''!@brief      Peak-fit line position estimator for a line sensor array.
+        @details    The weighted sensor sum has dead zones between sensors, where the line
+                    straddles two sensors and the signal dips. LinePos instead finds the
+                    strongest channel and fits a parabola through it and its two neighbours;
+                    the vertex of the parabola is the line centre, interpolated between
+                    sensors. When the strongest channel is an end sensor, the centroid of it
+                    and its neighbour is used instead, so the estimate saturates at the outer
+                    sensors. Readings are taken above the nominal white level, so paper reads
+                    as zero.
+
+        @details    A parabola is not the true shape of a 19 mm line seen by sensors 17 mm
+                    apart, so the raw peak position bends a little between sensors. A lookup
+                    table generated on the host by tools/linepos_lut.py (from a sensor model or
+                    from measured data) maps the raw position back to the true position. The
+                    table is evenly spaced in raw position, so applying it is one indexed
+                    linear interpolation. Without a table the raw position is used as is.
+
+        @details    Positions are in [mm] from the centre sensor, positive to Romi's right
+                    (the same sign as the weighted sensor value). The peak height is kept in
+                    self.amp as a confidence measure; below amp_min the estimate is marked
+                    invalid and the last valid position is held.
+
+        @details    The table file 'linepos_lut.bin' is b'LP', then '<Hff' (point count, raw
+                    position of the first and last points in [mm]), then the true positions as
+                    little-endian int16 in hundredths of a mm.
+    '''
+
+    def __init__(self, pitch = 17.0, n = 5, base = 248, amp_min = 400, fname = 'linepos_lut.bin'):
+        '''!@brief      Initializes and returns a LinePos object.
+            @param      pitch       Sensor spacing [mm]. Default 17 mm
+            @param      n           Sensors in the array. Default 5
+            @param      base        White level [counts] subtracted from each reading.
+                                    Default LineCal.WHITE
+            @param      amp_min     Smallest peak height [counts] for a valid estimate.
+                                    Default 400
+            @param      fname       Lookup table file name, or None for no table.
+                                    Default 'linepos_lut.bin'
+        '''
+        self.pitch = pitch
+        self.n = n
+        self.base = base
+        self.amp_min = amp_min
+        self.y = array('i', [0]*n)      # readings above white
+        self.x_raw = 0.0                # [mm] raw peak position
+        self.x = 0.0                    # [mm] linearized position
+        self.amp = 0                    # [counts] peak height
+        self.valid = False              # True if the last estimate was valid
+        self.x_lim = (n - 1)/2*pitch    # [mm] furthest reportable position
+
+        # Lookup table, identity until loaded
+        self.lut = None
+        self.lut_x0 = 0.0
+        self.lut_k = 0.0
+        self.lut_n = 0
+        if fname is not None:
+            self.load(fname)
+
+
+
+    def load(self, fname):
+        '''!@brief      Read a linearization lookup table from flash.
+            @param      fname   Lookup table file name.
+            @return     True if a valid table was read, else False.
+        '''
+        try:
+            with open(fname, 'rb') as file:
+                data = file.read()
+        except OSError:
+            print(f'LinePos: no {fname}, using raw positions')
+            return False
+        if data[0:2] != b'LP':
+            print(f'LinePos: {fname} is not a lookup table, ignoring it')
+            return False
+        n, x0, x1 = struct.unpack('<Hff', data[2:12])
+        if len(data) != 12 + 2*n or n < 2 or x1 <= x0:
+            print(f'LinePos: {fname} does not match, ignoring it')
+            return False
+        vals = struct.unpack('<' + 'h'*n, data[12:])
+        self.lut = array('f', [v/100 for v in vals])
+        self.lut_x0 = x0
+        self.lut_k = (n - 1)/(x1 - x0)
+        self.lut_n = n - 1
+        return True
+
+
+
+    def linearize(self, x_raw):
+        '''!@brief      Map a raw peak position to the true line position.
+            @param      x_raw   Raw peak position [mm].
+            @return     Linearized position [mm].
+        '''
+        if self.lut is None:
+            return x_raw
+        f = (x_raw - self.lut_x0)*self.lut_k
+        if f <= 0:
+            return self.lut[0]
+        i = int(f)
+        if i >= self.lut_n:
+            return self.lut[self.lut_n]
+        return self.lut[i] + (f - i)*(self.lut[i + 1] - self.lut[i])
+
+
+
+    def raw(self, vals, i0 = 0):
+        '''!@brief      Raw peak position from one set of readings.
+            @details    Helper for estimate(), also used by the host table generator so both
+                        use exactly the same fit. Leaves the peak height in self.amp.
+            @param      vals    Normalized counts.
+            @param      i0      Index of the array's far left sensor in vals. Default 0
+            @return     Raw peak position [mm].
+        '''
+        n = self.n
+        y = self.y
+        # Readings above white, and the strongest channel
+        i_pk = 0
+        for i in range(n):
+            v = vals[i0 + i] - self.base
+            y[i] = v if v > 0 else 0
+            if y[i] > y[i_pk]:
+                i_pk = i
+        self.amp = y[i_pk]
+
+        # Peak on an end sensor: centroid with its one neighbour
+        if i_pk == 0:
+            s = y[0] + y[1]
+            f = y[1]/s if s > 0 else 0.0
+        elif i_pk == n - 1:
+            s = y[n - 1] + y[n - 2]
+            f = n - 1 - y[n - 2]/s
+        # Otherwise the vertex of the parabola through the peak and its neighbours
+        else:
+            ym = y[i_pk - 1]
+            y0 = y[i_pk]
+            yp = y[i_pk + 1]
+            den = ym - 2*y0 + yp
+            f = i_pk + (0.5*(ym - yp)/den if den < 0 else 0.0)
+
+        x = (f - (n - 1)/2)*self.pitch
+        return x
+
+
+
+    def estimate(self, vals, i0 = 0):
+        '''!@brief      Estimate the line position under the array.
+            @details    Updates self.x_raw, self.x, self.amp and self.valid. If the peak is too
+                        weak to trust, the last valid position is held.
+            @param      vals    Normalized counts.
+            @param      i0      Index of the array's far left sensor in vals. Default 0
+            @return     Line position [mm], positive to Romi's right.
+        '''
+        x_raw = self.raw(vals, i0)
+        if self.amp < self.amp_min:
+            self.valid = False
+            return self.x
+        self.valid = True
+        self.x_raw = x_raw
+        self.x = self.linearize(x_raw)
+        return self.x
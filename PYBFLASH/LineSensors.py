@@ -6,6 +6,7 @@
     @author     Joseph Penrose & Paolo Navarro
     @date       December 1, 2023
 '''
+import math
 
 class LineSensors():
     '''!@brief      A driver class for Romi's line sensors.
@@ -24,7 +25,8 @@ class LineSensors():
                     It constantly updates the line sensor reading measurement Share.                        
     '''
     
-    def __init__(self, LS_shares, Pins): 
+    def __init__(self, LS_shares, Pins, Burst = None, Cal = None, Pos = None, PosAx = None,
+                 Filt = None, Feat = None): 
         '''!@brief      Initializes and returns an object associated with a Romi LineSensors.
             @details    LineSensors unpacks its shares and builds all of the variables needed
                         for line sensing.
@@ -34,10 +36,39 @@ class LineSensors():
                             LS_shares[0] = sensor value     [--]    (float)
                             LS_shares[1] = finish line flag [trash] (flag)
                             LS_shares[2] = sensor sum       [--]    (float)
+                            LS_shares[3] = line position    [mm]    (float, with Pos)
+                            LS_shares[4] = line offset      [mm]    (float, with PosAx)
+                            LS_shares[5] = line angle       [rad]   (float, with PosAx)
+                            LS_shares[6] = line seen        [--]    (uint8, with Pos)
+                            LS_shares[7] = sensors ready    [trash] (flag)
                             
             @param      LS_shares   A tuple containing all of LineSensor's Shares objects.
             @param      Pins        A tuple containing all of the ADC objects associated with
                                     each line sensor.
+            @param      Burst       Optional ADCBurst (or ADCReplay) built on the same ten
+                                    channels, in the same order as Pins. When given, all ten
+                                    sensors are sampled together in one oversampled burst
+                                    instead of five separate ADC reads. Default none
+            @param      Cal         Optional LineCal object. When given along with Burst, every
+                                    channel is normalized to its own white and black levels
+                                    before any thresholds are applied. Default none
+            @param      Pos         Optional LinePos object for the front array. When given
+                                    along with Burst, the sensor value comes from the
+                                    interpolated line position instead of the weighted sum, and
+                                    the position is published on LS_shares[3], with whether
+                                    the front array sees the line on LS_shares[6]. Default none
+            @param      PosAx       Optional LinePos object for the axial array. When given
+                                    along with Pos, the two line positions give the line's
+                                    offset at the wheel axis and its angle to the chassis,
+                                    published on LS_shares[4] and LS_shares[5]. Default none
+            @param      Filt        Optional LineFilt object. When given along with Burst, every
+                                    channel is filtered after normalization and before any
+                                    thresholds or position estimates. Default none
+            @param      Feat        Optional LineFeat object. When given along with Burst, Pos,
+                                    and PosAx, track features are classified from both arrays
+                                    and the finish line flag is raised by a confident crossbar
+                                    with no line past it, instead of the all dark then all light
+                                    check. Default none
         '''
         # Set up access to line sensor Shares
         self.sens_val_share = LS_shares[0]      # Final sensor value Share
@@ -46,6 +77,20 @@ class LineSensors():
         self.sens_sum_share = LS_shares[2]      # Sensor sum Share
         self.sens_sum_share.put(0)              # Initialize sensor sum
         self.finish_flag.clear()                # clear just in case
+        self.ready_flag = LS_shares[7]          # calibrated & sensing trash flag Queue
+        self.ready_flag.clear()                 # not until state 4
+        self.pos = Pos                          # front array line position estimator
+        if self.pos is not None:
+            self.line_pos_share = LS_shares[3]  # Line position Share
+            self.line_pos_share.put(0)          # Initialize line position
+            self.line_ok_share = LS_shares[6]   # Line seen Share
+            self.line_ok_share.put(0)           # Initialize line seen
+        self.pos_ax = PosAx                     # axial array line position estimator
+        if self.pos_ax is not None:
+            self.line_off_share = LS_shares[4]  # Line offset Share
+            self.line_off_share.put(0)          # Initialize line offset
+            self.line_ang_share = LS_shares[5]  # Line angle Share
+            self.line_ang_share.put(0)          # Initialize line angle
         
         # Create ADC references
         # Axial
@@ -60,6 +105,11 @@ class LineSensors():
         self.FC = Pins[7]           # Center
         self.FR1 = Pins[8]          # Mid right
         self.FR2 = Pins[9]          # Far right
+        self.burst = Burst          # burst sampler, all ten channels
+        self.cal = Cal              # per-channel calibration
+        self.filt = Filt            # per-channel spike reject & low-pass
+        self.feat = Feat            # crossbar, gap & lost line detector
+        self.k_adc = 1/4095         # counts to fraction of max reading
         
         # Internal variables
         self.sens_val = 0.0      # weighted sensor value
@@ -70,6 +120,20 @@ class LineSensors():
         self.midoff = 0.20         # summid when seeing white
         self.whsens = 0.065         # one sensor val when it sees white
         self.midweak = 0.60         # summid when just going into deadzone
+        self.mm_per_val = 20.0      # [mm] line position per unit of sensor value
+        self.line_pos = 0.0         # [mm] interpolated line position
+        self.L_arr = 75.0           # [mm] front array ahead of axial array, measure on Romi
+        self.line_off = 0.0         # [mm] line offset at the wheel axis
+        self.line_ang = 0.0         # [rad] line angle to the chassis
+        self.pose_valid = 0         # True if both arrays see the line
+        self.feat_ev = 0            # track feature found this tick
+        self.finish_conf = 0.5      # crossbar confidence needed for the finish
+        
+        # Calibration state, only needed with a calibration & burst sampler
+        if self.cal is not None and self.burst is not None:
+            self.state = 1          # go find a calibration
+        else:
+            self.state = 4          # straight to sensing
         
         # Useful line sensing flags
         self.offline_flag = 0       # True if no sensors detecting line
@@ -98,11 +162,35 @@ class LineSensors():
         # R2val = self.R2.read()/4095
         
         # Get sensor values as a fraction of the max reading (4095)
-        L2val = self.FL2.read()/4095
-        L1val = self.FL1.read()/4095
-        Cval  = self.FC.read() /4095
-        R1val = self.FR1.read()/4095
-        R2val = self.FR2.read()/4095
+        if self.burst is not None:
+            # One timed burst samples every channel at the same moment
+            vals = self.burst.sample()
+            # Map each channel onto the nominal white/black levels
+            if self.cal is not None:
+                vals = self.cal.normalize(vals)
+            # Knock out PWM spikes & noise
+            if self.filt is not None:
+                vals = self.filt.run(vals)
+            L2val = vals[5]*self.k_adc
+            L1val = vals[6]*self.k_adc
+            Cval  = vals[7]*self.k_adc
+            R1val = vals[8]*self.k_adc
+            R2val = vals[9]*self.k_adc
+            # Sub-sensor line position from the front array
+            if self.pos is not None:
+                self.line_pos = self.pos.estimate(vals, 5)
+            # Line offset & angle from both arrays
+            if self.pos_ax is not None:
+                self.get_line_pose(vals)
+            # Track features from both arrays against distance
+            if self.feat is not None:
+                self.feat_ev = self.feat.update(vals, self.pos.valid, self.pos_ax.valid)
+        else:
+            L2val = self.FL2.read()/4095
+            L1val = self.FL1.read()/4095
+            Cval  = self.FC.read() /4095
+            R1val = self.FR1.read()/4095
+            R2val = self.FR2.read()/4095
         
         # Save Cval
         self.Cval = Cval
@@ -143,6 +231,10 @@ class LineSensors():
             # print('off line to the left')
             self.sens_val = -1.5
             self.offline_flag = 1
+        # Normal, on line condition, interpolated position
+        elif self.pos is not None and self.pos.valid:
+            # Scaled so the far sensors read about the same as the weighted sum
+            self.sens_val = self.line_pos/self.mm_per_val
         # Normal, on line condition
         else:
             # Weighted sum. Don't add center so it adds up to zero
@@ -153,16 +245,25 @@ class LineSensors():
             # print('you are back on the line')
             self.offline_flag = 0
             
+        # Finish line detection from track features
+        if self.feat is not None:
+            # A crossbar with no line past it is the finish, not a cross-hatch
+            if self.feat_ev == self.feat.CROSSBAR and self.feat.conf >= self.finish_conf \
+                    and not self.pos.valid and self.finish_flag.empty():
+                # print('finish line detected')
+                self.finish_flag.put(1)
+                
         # Finish line detection
-        if self.finish_flag.empty() and self.sumall > 1.7:
-            # print('all sensors high. potentially on the finish line')
-            self.finish_maybe = 1
-            
-        # Confirm finish line when sensor value falls
-        if self.finish_maybe == 1 and self.sumall < self.offline:
-            # print('finish line detected')
-            self.finish_maybe = 0
-            self.finish_flag.put(1)
+        else:
+            if self.finish_flag.empty() and self.sumall > 1.7:
+                # print('all sensors high. potentially on the finish line')
+                self.finish_maybe = 1
+                
+            # Confirm finish line when sensor value falls
+            if self.finish_maybe == 1 and self.sumall < self.offline:
+                # print('finish line detected')
+                self.finish_maybe = 0
+                self.finish_flag.put(1)
             
         # print(f'L2: {L2val}; L1: {L1val}; C: {Cval}; R1: {R1val}; R2: {R2val}')
         # print(f'L2: {L2val}; summid: {self.summid}; R2: {R2val}')
@@ -172,12 +273,47 @@ class LineSensors():
         
         
         
+    def get_line_pose(self, vals):
+        '''!@brief      Estimate the line's offset and angle from both sensor arrays.
+            @details    The axial array sits on the wheel axis and the front array L_arr ahead
+                        of it, so the two interpolated line positions are two points on the line
+                        in Romi's frame. The axial position is the line's offset from the
+                        chassis centre, and the slope between the two points is the line's
+                        angle to the chassis, positive when the line heads off to Romi's right.
+                        On a curve, the angle shows up before the offset does, which lets the
+                        follower turn in early instead of reacting to the error.
+                        
+            @details    Both arrays have to see the line for a new estimate. If either one loses
+                        it (a gap, a sharp corner, or the line leaving the front array first),
+                        the last offset and angle are held and pose_valid is cleared.
+            @param      vals    Normalized counts for all ten channels, axial first.
+        '''
+        x_ax = self.pos_ax.estimate(vals, 0)
+        if self.pos.valid and self.pos_ax.valid:
+            self.line_off = x_ax
+            self.line_ang = math.atan2(self.pos.x - x_ax, self.L_arr)
+            self.pose_valid = 1
+        else:
+            self.pose_valid = 0
+        
+        
+        
     def MainTask(self):
         '''!@brief      Main cotask task for LineSensors.
             @details    The LineSensors main task has states:
                 
-                            1:  Normal operation state. Continuously compute sensor data and push
-                                all data to Shares.
+                            1:  Check for calibration file state. If a LineCal calibration is
+                                found on flash, load it and go to state 4. If not, go to state 2.
+                            2:  Calibration sweep state. Run the LineCal sweep until every
+                                channel has seen white and black, then go to state 3.
+                            3:  Save calibration state. Save the new calibration and go to
+                                state 4.
+                            4:  Normal operation state. Continuously compute sensor data and push
+                                all data to Shares. The ready flag is raised, so MasterMind knows
+                                the calibration sweep is over and the readings are good.
+                                
+            @details    Without a calibration object and burst sampler, the task starts in
+                        state 4.
                             
             @details    Like all of Romi's cooperative multitasking tasks, MainTask is written
                         as a generator function with an infinite loop. Each pass through the
@@ -186,25 +322,45 @@ class LineSensors():
         ''' 
         # Remember, tasks are infinite generators
         while True:
+            # State 1: Check for calibration file
+            if self.state == 1:
+                if self.cal.load():
+                    print(f'{self.cal.fname} found!')
+                    self.state = 4
+                else:
+                    self.curr_man = self.cal.Sweep(self.burst)
+                    self.state = 2
+                yield self.state
+                
+            # State 2: Calibration sweep
+            elif self.state == 2:
+                if next(self.curr_man):
+                    self.state = 3
+                yield self.state
+                
+            # State 3: Save calibration
+            elif self.state == 3:
+                self.cal.save()
+                self.state = 4
+                yield self.state
             
-            # Trash flag if center sensor reads black, else clear flag
-            # if self.Cval > 0.5:
-            #     self.c_flag.put(1)
-            # else:
-            #     self.c_flag.clear()
-                    
-            # Read sensors and push weighted reading
-            self.get_sens_val()                         # read sensors
-            self.sens_val_share.put(self.sens_val)      # push weighted val to Share
-            self.sens_sum_share.put(self.sumall)      # push weighted val to Share
-            
-            # print(f'sumall: {self.sumall}')
-            
-            # if self.finish_flag.full():
-            #     print('~~~~~~~~~~~~~~~~~~~~~~~~~~')
-            
-            # DEBUG
-            # print(f'Sensor reading: {sens_val}')
-            # DEBUG
-            
-            yield 1                         # end of task
\ No newline at end of file
+            # State 4: Normal operation
+            elif self.state == 4:
+                # Read sensors and push weighted reading
+                self.get_sens_val()                         # read sensors
+                self.sens_val_share.put(self.sens_val)      # push weighted val to Share
+                self.sens_sum_share.put(self.sumall)      # push weighted val to Share
+                if self.pos is not None:
+                    self.line_pos_share.put(self.line_pos)  # push line position to Share
+                    self.line_ok_share.put(self.pos.valid)  # push line seen to Share
+                if self.pos_ax is not None:
+                    self.line_off_share.put(self.line_off)  # push line offset to Share
+                    self.line_ang_share.put(self.line_ang)  # push line angle to Share
+                if self.ready_flag.empty():
+                    self.ready_flag.put(1)                  # calibrated & sensing
+                
+                yield self.state
+                
+            # RED ALERT, RED ALERT, INVALID STATE VARIABLE!!!  
+            else:
+                raise ValueError("Invalid state variable in task LineSensors")  
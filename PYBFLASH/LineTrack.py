@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+'''!@file       LineTrack.py
+    @brief      Romi line tracker for bridging dashed line gaps
+    @details    LineTrack.py contains the class that remembers where Romi has seen the line in
+                world coordinates, and extrapolates it across gaps in a dashed line.
+    @author     Joseph Penrose & Paolo Navarro
+    @date       October 18, 2026
+'''
+from array import array
+import math
+
+class LineTrack():
+    '''!@brief      World frame line history and gap extrapolation.
+        @details    When the front array runs off the end of a dash, LineSensors has nothing to
+                    go on and clamps the sensor value to full lock, so Romi swerves across the
+                    gap. On a dashed curve that is often enough to miss the next dash. But the
+                    line Romi has just followed says a lot about where the next dash is.
+
+        @details    While the front array sees the line, every tick the point under it is put
+                    into world coordinates with Romi's dead-reckoned pose, and stored in a
+                    preallocated ring buffer whenever it is at least ds_min from the last one.
+                    When the line is lost, the points from the last s_fit of line are fitted
+                    with a parabola in a frame lined up with the end of the line, so the fit
+                    captures the line's curvature. Until the line comes back, the fit is
+                    evaluated at the front array and at the axle every tick to give a
+                    synthetic line position, offset, and angle, in the same units and signs as
+                    LineSensors, and the follower steers on those instead.
+
+        @details    Extrapolation gets worse the further it goes, so bridging gives up after
+                    s_max of travel and leaves the follower to its usual lost line handling.
+    '''
+
+    def __init__(self, N = 32, L_arr = 0.075, ds_min = 0.008, s_fit = 0.15, s_max = 0.15,
+                 k_max = 12.0):
+        '''!@brief      Initializes and returns a LineTrack object.
+            @param      N       Line points kept. Default 32
+            @param      L_arr   Front array distance ahead of the axle [m]. Default 0.075
+            @param      ds_min  Spacing between stored line points [m]. Default 0.008
+            @param      s_fit   Length of line fitted [m]. Default 0.15
+            @param      s_max   Longest gap bridged [m]. Default 0.15
+            @param      k_max   Largest curvature the fit may extrapolate [1/m]. Default 12
+        '''
+        self.N = N
+        self.L_arr = L_arr
+        self.ds_min = ds_min
+        self.s_fit = s_fit
+        self.s_max = s_max
+        self.k_max = k_max
+
+        # Line point ring buffer, world frame
+        self.px = array('f', [0.0]*N)   # [m] X
+        self.py = array('f', [0.0]*N)   # [m] Y
+        self.idx = 0                    # next slot
+        self.n = 0                      # points stored
+
+        # Fit: w = a + b u + c u^2 in the frame at the last point
+        self.ox = 0.0           # [m]   frame origin X
+        self.oy = 0.0           # [m]   frame origin Y
+        self.oc = 1.0           # frame direction cosine
+        self.os = 0.0           # frame direction sine
+        self.a = 0.0
+        self.b = 0.0
+        self.c = 0.0
+
+        # Bridging
+        self.bridging = False   # True while synthetic values are in use
+        self.gX = 0.0           # [m] X where the line was lost
+        self.gY = 0.0           # [m] Y where the line was lost
+        self.x = 0.0            # [mm]  synthetic front array line position
+        self.off = 0.0          # [mm]  synthetic line offset at the axle
+        self.ang = 0.0          # [rad] synthetic line angle to the chassis
+
+
+
+    def reset(self):
+        '''!@brief      Forget the line history, for a new line following run.
+        '''
+        self.idx = 0
+        self.n = 0
+        self.bridging = False
+
+
+
+    def update(self, X, Y, phi, x_line, ok):
+        '''!@brief      Record or extrapolate the line for one tick.
+            @param      X       Romi's world X [m].
+            @param      Y       Romi's world Y [m].
+            @param      phi     Romi's heading [rad].
+            @param      x_line  Front array line position [mm], positive to Romi's right.
+            @param      ok      True if the front array sees the line.
+            @return     True if the line is being bridged, with the synthetic values in x,
+                        off, and ang.
+        '''
+        c = math.cos(phi)
+        s = math.sin(phi)
+        if ok:
+            # Point under the front array; Romi's right is (sin phi, -cos phi)
+            x = x_line/1000
+            lx = X + self.L_arr*c + x*s
+            ly = Y + self.L_arr*s - x*c
+            last = self.idx - 1 if self.idx > 0 else self.N - 1
+            if self.n == 0 or (lx - self.px[last])**2 + (ly - self.py[last])**2 >= self.ds_min**2:
+                self.px[self.idx] = lx
+                self.py[self.idx] = ly
+                self.idx = self.idx + 1 if self.idx < self.N - 1 else 0
+                if self.n < self.N:
+                    self.n += 1
+            self.bridging = False
+            return False
+
+        # Line lost: fit once, then extrapolate until it is back or too far
+        if not self.bridging:
+            if self.n < 3 or not self.fit():
+                return False
+            self.bridging = True
+            self.gX = X
+            self.gY = Y
+        elif (X - self.gX)**2 + (Y - self.gY)**2 > self.s_max**2:
+            return False
+
+        w_f = self.lateral(X + self.L_arr*c, Y + self.L_arr*s)
+        w_a = self.lateral(X, Y)
+        self.x = 1000*w_f
+        self.off = 1000*w_a
+        self.ang = math.atan2(w_f - w_a, self.L_arr)
+        return True
+
+
+
+    def fit(self):
+        '''!@brief      Fit a parabola to the end of the stored line.
+            @return     True if there were enough points for a fit, else False.
+        '''
+        # Frame at the last point, along the chord from the oldest point within s_fit
+        i_last = self.idx - 1 if self.idx > 0 else self.N - 1
+        ox = self.px[i_last]
+        oy = self.py[i_last]
+        m = 1
+        i = i_last
+        while m < self.n:
+            j = i - 1 if i > 0 else self.N - 1
+            if (self.px[j] - ox)**2 + (self.py[j] - oy)**2 > self.s_fit**2:
+                break
+            i = j
+            m += 1
+        if m < 3:
+            return False
+        dx = ox - self.px[i]
+        dy = oy - self.py[i]
+        d = math.sqrt(dx*dx + dy*dy)
+        if d < 1e-6:
+            return False
+        self.ox = ox
+        self.oy = oy
+        self.oc = dx/d
+        self.os = dy/d
+
+        # Least squares on the normal equations
+        S0 = S1 = S2 = S3 = S4 = T0 = T1 = T2 = 0.0
+        for k in range(m):
+            ex = self.px[i] - ox
+            ey = self.py[i] - oy
+            u = ex*self.oc + ey*self.os
+            w = -ex*self.os + ey*self.oc
+            uu = u*u
+            S0 += 1
+            S1 += u
+            S2 += uu
+            S3 += uu*u
+            S4 += uu*uu
+            T0 += w
+            T1 += w*u
+            T2 += w*uu
+            i = i + 1 if i < self.N - 1 else 0
+        det = S0*(S2*S4 - S3*S3) - S1*(S1*S4 - S3*S2) + S2*(S1*S3 - S2*S2)
+        if abs(det) < 1e-18:
+            # Too short to bend, keep it straight
+            self.a = T0/S0
+            self.b = 0.0
+            self.c = 0.0
+            return True
+        self.a = (T0*(S2*S4 - S3*S3) - S1*(T1*S4 - S3*T2) + S2*(T1*S3 - S2*T2))/det
+        self.b = (S0*(T1*S4 - T2*S3) - T0*(S1*S4 - S3*S2) + S2*(S1*T2 - T1*S2))/det
+        self.c = (S0*(S2*T2 - S3*T1) - S1*(S1*T2 - S2*T1) + T0*(S1*S3 - S2*S2))/det
+        # Curvature is about 2c; do not extrapolate tighter than k_max
+        if self.c > self.k_max/2:
+            self.c = self.k_max/2
+        elif self.c < -self.k_max/2:
+            self.c = -self.k_max/2
+        return True
+
+
+
+    def lateral(self, X, Y):
+        '''!@brief      Distance from a world point across to the fitted line.
+            @param      X       World X [m].
+            @param      Y       World Y [m].
+            @return     Distance [m], positive when the line is off to the point's right.
+        '''
+        ex = X - self.ox
+        ey = Y - self.oy
+        u = ex*self.oc + ey*self.os
+        w = -ex*self.os + ey*self.oc
+        return w - (self.a + self.b*u + self.c*u*u)
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+'''!@file       Logger.py
+    @brief      Romi buffered binary telemetry logger
+    @details    Logger.py contains the class that records telemetry into a preallocated binary
+                ring buffer and drains it to USB or flash from its own task.
+    @author     Joseph Penrose & Paolo Navarro
+    @date       October 18, 2026
+'''
+import struct
+import utime
+
+class Logger():
+    '''!@brief      Non-blocking binary telemetry logger.
+        @details    Printing Romi's pose every tick builds a new string every time and then
+                    waits on the USB VCP to take it, and with the cable unplugged the wait is
+                    the longest of all. Logger takes all of that out of the control loop. A
+                    sample is packed straight into a preallocated ring buffer as a fixed-layout
+                    record, which costs about as much as a Share put, and the buffer is emptied
+                    by Logger's own task, a chunk at a time, with a write that never waits.
+
+        @details    Every record is REC bytes, packed as '<BBIf':
+
+                        sync    0xA5, to find record boundaries in a stream
+                        ch      channel number, in the order channels were added
+                        t       [ms] time stamp, utime.ticks_ms()
+                        value   sample, float32
+
+                    Each channel has a decimation: only every decim-th sample offered on it is
+                    recorded, so fast and slow signals can share the buffer. Channels added
+                    with a Share are sampled by the Logger task; others are logged by their
+                    owner with log(). When the buffer is full, new records are dropped and
+                    counted in self.dropped rather than waiting for room.
+
+        @details    The sink is the USB VCP or a file on flash. Before the first record, the
+                    sink gets a header: b'TL', the channel count, and the channel names
+                    separated by commas, ending in a newline. On USB, nothing is sent while no
+                    host is connected, and each write sends only what the VCP can take right
+                    away. Flash writes do block, but only for one chunk per run of the task.
+    '''
+
+    ## Record size [bytes]
+    REC = struct.calcsize('<BBIf')
+
+    def __init__(self, sink, N = 256, chunk = 32):
+        '''!@brief      Initializes and returns a Logger object.
+            @param      sink    pyb.USB_VCP object, or a file name on flash.
+            @param      N       Records the ring buffer holds. Default 256
+            @param      chunk   Most records drained per run of the task. Default 32
+        '''
+        if isinstance(sink, str):
+            self.file = open(sink, 'wb')
+            self.vcp = None
+        else:
+            self.file = None
+            self.vcp = sink
+        self.size = N*self.REC
+        self.buf = bytearray(self.size)     # ring buffer
+        self.mv = memoryview(self.buf)
+        self.chunk = chunk*self.REC
+        self.head = 0                       # [bytes] next write position
+        self.tail = 0                       # [bytes] next drain position
+        self.fill = 0                       # [bytes] waiting to be drained
+        self.dropped = 0                    # records dropped on a full buffer
+
+        # Channels
+        self.names = []                     # channel names
+        self.srcs = []                      # Share for each sampled channel, else None
+        self.dec = []                       # decimation per channel
+        self.cnt = []                       # samples left until the next record
+        self.hdr = None                     # header still to be sent, or None once sent
+
+
+
+    def channel(self, name, src = None, decim = 1):
+        '''!@brief      Add a channel.
+            @param      name    Channel name, for the header.
+            @param      src     Share sampled by the Logger task. Default none, logged with
+                                log() by its owner
+            @param      decim   Record every decim-th sample. Default 1
+            @return     Channel number.
+        '''
+        if len(self.names) >= 255:
+            raise Exception("Logger has no room for more channels")
+        if decim < 1:
+            raise ValueError("Decimation must be at least 1")
+        self.names.append(name)
+        self.srcs.append(src)
+        self.dec.append(decim)
+        self.cnt.append(1)
+        self.hdr = b'TL' + bytes((len(self.names),)) + ','.join(self.names).encode() + b'\n'
+        return len(self.names) - 1
+
+
+
+    def log(self, ch, val):
+        '''!@brief      Offer one sample on a channel.
+            @details    Recorded if its decimation is due and the buffer has room.
+            @param      ch      Channel number.
+            @param      val     Sample.
+        '''
+        c = self.cnt[ch] - 1
+        if c > 0:
+            self.cnt[ch] = c
+            return
+        self.cnt[ch] = self.dec[ch]
+        if self.fill + self.REC > self.size:
+            self.dropped += 1
+            return
+        struct.pack_into('<BBIf', self.buf, self.head, 0xA5, ch, utime.ticks_ms(), val)
+        self.head += self.REC
+        if self.head >= self.size:
+            self.head = 0
+        self.fill += self.REC
+
+
+
+    def write(self, data):
+        '''!@brief      Write to the sink without waiting.
+            @param      data    Bytes to write.
+            @return     Number of bytes written.
+        '''
+        if self.vcp is not None:
+            if not self.vcp.isconnected():
+                return 0
+            return self.vcp.send(data, timeout = 0)
+        n = self.file.write(data)
+        return n if n is not None else len(data)
+
+
+
+    def drain(self):
+        '''!@brief      Drain up to one chunk of the buffer to the sink.
+        '''
+        if self.hdr is not None:
+            n = self.write(self.hdr)
+            if n < len(self.hdr):
+                self.hdr = self.hdr[n:]
+                return
+            self.hdr = None
+        if self.fill == 0:
+            return
+        k = self.size - self.tail           # contiguous bytes to the end of the ring
+        if k > self.fill:
+            k = self.fill
+        if k > self.chunk:
+            k = self.chunk
+        n = self.write(self.mv[self.tail:self.tail + k])
+        self.tail += n
+        if self.tail >= self.size:
+            self.tail = 0
+        self.fill -= n
+
+
+
+    def close(self):
+        '''!@brief      Drain everything and close a flash log.
+        '''
+        while self.file is not None and (self.fill or self.hdr is not None):
+            self.drain()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+
+    def MainTask(self):
+        '''!@brief      Main cotask task for Logger.
+            @details    The Logger main task has states:
+
+                            1:  Normal operation state. Sample the Share channels, then drain
+                                one chunk to the sink.
+
+            @details    Like all of Romi's cooperative multitasking tasks, MainTask is written
+                        as a generator function with an infinite loop. Each pass through the
+                        program runs through the MainTask while loop once, until it reaches a
+                        yield.
+        '''
+        while True:
+            # State 1: Sample & drain
+            for ch in range(len(self.srcs)):
+                if self.srcs[ch] is not None:
+                    self.log(ch, self.srcs[ch].get())
+            if self.file is not None or self.vcp is not None:
+                self.drain()
+            yield 1
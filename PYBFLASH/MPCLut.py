@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+'''!@file       MPCLut.py
+    @brief      Romi explicit MPC line follower lookup table
+    @details    MPCLut.py contains the class that evaluates the piecewise-affine line following
+                control law that tools/mpc_lut.py solves offline on the host.
+    @author     Joseph Penrose & Paolo Navarro
+    @date       October 18, 2026
+'''
+import struct
+
+class MPCLut():
+    '''!@brief      Explicit MPC line follower law, read from a lookup table.
+        @details    A model predictive controller plans Romi's yaw rate over a short horizon
+                    ahead, trading line tracking against steering effort and respecting the
+                    yaw rate limit, which lets it turn in early and hard without overshooting.
+                    Solving that optimization every tick is far too slow for the robot, but for
+                    a given line offset e, line angle psi, and speed v the answer never changes,
+                    so tools/mpc_lut.py solves it on the host over a grid of all three and
+                    stores the result.
+
+        @details    The constrained MPC law is piecewise affine in (e, psi). For every grid
+                    node the table holds the first planned yaw rate and its slopes in e and psi
+                    at that node, which is the affine law of the region the node is in. On
+                    Romi, eval() finds the grid cell around (e, psi, v), evaluates the affine
+                    law of each of its eight corner nodes at (e, psi),
+
+                        r_k = r0 + g_e*(e - e_i) + g_psi*(psi - psi_j)
+
+                    and blends them by trilinear weights, clamped to the yaw rate limit.
+                    Blending keeps the command continuous across region boundaries and
+                    between speed slices, where one node's law alone can be far off, and a
+                    tick still costs only eight small table reads.
+
+        @details    The file 'mpc_lut.bin' is b'MP', then a header packed as '<3H10f' (grid
+                    sizes n_e, n_psi, n_v; first node and step for e [m], psi [rad], and v
+                    [m/s]; yaw rate limit [rad/s]; and the scales of r0, g_e, and g_psi), then
+                    n_v*n_e*n_psi triples of int16 (r0, g_e, g_psi), speed slowest, psi fastest.
+                    The table stays packed in RAM and is read with struct.unpack_from.
+    '''
+
+    ## Header size [bytes]
+    HEAD = 2 + struct.calcsize('<3H10f')
+
+    def __init__(self, fname = 'mpc_lut.bin'):
+        '''!@brief      Initializes and returns an MPCLut object.
+            @param      fname   Lookup table file name on flash. None to start without one.
+                                Default 'mpc_lut.bin'
+        '''
+        self.fname = fname
+        self.ready = False      # True once a table is loaded
+        self.r_cmd = 0.0        # [rad/s] last yaw rate command
+        if fname is not None:
+            self.load()
+
+
+
+    def load(self):
+        '''!@brief      Read the lookup table from flash.
+            @return     True if a valid table was read, else False.
+        '''
+        try:
+            with open(self.fname, 'rb') as file:
+                data = file.read()
+        except OSError:
+            print(f'MPCLut: no {self.fname}, MPC follower unavailable')
+            return False
+        if len(data) < self.HEAD or data[0:2] != b'MP':
+            print(f'MPCLut: {self.fname} is not an MPC table, ignoring it')
+            return False
+        head = struct.unpack('<3H10f', data[2:self.HEAD])
+        n_e, n_p, n_v = head[0:3]
+        if len(data) != self.HEAD + 6*n_e*n_p*n_v or n_e < 2 or n_p < 2 or n_v < 1:
+            print(f'MPCLut: {self.fname} does not match, ignoring it')
+            return False
+        self.n_e, self.n_p, self.n_v = n_e, n_p, n_v
+        self.e0, self.de, self.p0, self.dp, self.v0, self.dv = head[3:9]
+        self.r_max, self.s_r, self.s_e, self.s_p = head[9:13]
+        self.data = data
+        self.ready = True
+        return True
+
+
+
+    def eval(self, e, psi, v):
+        '''!@brief      Evaluate the MPC law.
+            @param      e       Line offset at the wheel axis [m], positive to Romi's right.
+            @param      psi     Line angle to the chassis [rad], positive to Romi's right.
+            @param      v       Forward speed [m/s].
+            @return     Yaw rate command [rad/s], positive turns left.
+        '''
+        # Cell on each axis and the fraction across it, held at the table edges
+        x = (e - self.e0)/self.de
+        i, fx = self.cell(x, self.n_e)
+        y = (psi - self.p0)/self.dp
+        j, fy = self.cell(y, self.n_p)
+        if self.n_v > 1:
+            k, fz = self.cell((v - self.v0)/self.dv, self.n_v)
+        else:
+            k, fz = 0, 0.0
+
+        # Blend the affine laws of the cell's corner nodes, each evaluated at (e, psi)
+        r = 0.0
+        for dk in (0, 1):
+            wz = fz if dk else 1 - fz
+            if wz == 0:
+                continue
+            for di in (0, 1):
+                wx = wz*(fx if di else 1 - fx)
+                if wx == 0:
+                    continue
+                for dj in (0, 1):
+                    w = wx*(fy if dj else 1 - fy)
+                    if w == 0:
+                        continue
+                    r0, g_e, g_p = struct.unpack_from('<3h', self.data, self.HEAD
+                                    + 6*(((k + dk)*self.n_e + i + di)*self.n_p + j + dj))
+                    r += w*(r0*self.s_r + g_e*self.s_e*(x - i - di)*self.de
+                            + g_p*self.s_p*(y - j - dj)*self.dp)
+        if r > self.r_max:
+            r = self.r_max
+        elif r < -self.r_max:
+            r = -self.r_max
+        self.r_cmd = r
+        return r
+
+
+
+    @staticmethod
+    def cell(x, n):
+        '''!@brief      Grid cell holding a point, in node steps from the first node.
+            @param      x       Point [node steps].
+            @param      n       Nodes on the axis, at least 2.
+            @return     Tuple (first node of the cell, fraction across it 0~1).
+        '''
+        if x <= 0:
+            return 0, 0.0
+        if x >= n - 1:
+            return n - 2, 1.0
+        i = int(x)
+        return i, x - i
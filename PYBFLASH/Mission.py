@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+'''!@file       Mission.py
+    @brief      Romi mission tables
+    @details    Mission.py contains the maneuver and end condition codes that make up a Romi
+                mission, the built-in term project mission, and the reader for mission files on
+                flash.
+    @author     Joseph Penrose & Paolo Navarro
+    @date       October 18, 2026
+'''
+import math
+
+class Mission():
+    '''!@brief      Romi mission codes, default mission, and mission file reader.
+        @details    A mission is a list of steps that MasterMind runs in order. Each step is a
+                    record (op, a, b, end, e): a maneuver op with its parameters a and b, and an
+                    end condition with its parameter e. The step runs until its end condition
+                    is met, or its maneuver finishes, then the next one starts. Both codes index straight into
+                    MasterMind's dispatch tables, so picking the maneuver and checking the end
+                    condition each tick take one lookup each. Speeds are wheel speeds, which
+                    MasterMind turns into motor commands with the feed-forward gain it gets
+                    from the motor map, so a mission drives the same whatever the motors' top
+                    speed.
+
+                        Op          a                   b
+                        MOVE        distance [m]        speed [m/s]
+                        FACE        heading [rad]       --
+                        TURN        angle [rad]         --
+                        FOLLOW      speed [m/s]         --
+
+                        End         e
+                        DONE        --                  the maneuver finishes on its own
+                        LIDAR       --                  obstacle inside the stopping distance
+                        LINE        sensor sum          line found (sensor sum above e)
+                        FINISH      --                  finish line flag raised
+                        DIST        distance [m]        e travelled in this step
+                        HEAD        heading [rad]       heading within h_tol of e
+
+        @details    Mission files are plain text on flash, one step per line, so a mission can
+                    be changed without touching the code. Each line is the op name, its
+                    numbers, and then optionally the end name and its number; anything after a
+                    '#' is a comment. Angles in files are in degrees. For example:
+
+                        MOVE    0.100   0.17            # leave the start box
+                        FOLLOW  0.19    LIDAR           # follow to the wall
+                        FACE    90                      # turn left
+                        MOVE    0.300   0.17 LINE 0.6   # drive until the line
+    '''
+
+    ## Maneuver op codes
+    MOVE = 0
+    FACE = 1
+    TURN = 2
+    FOLLOW = 3
+    ## End condition codes
+    DONE = 0
+    LIDAR = 1
+    LINE = 2
+    FINISH = 3
+    DIST = 4
+    HEAD = 5
+
+    ## Names in mission files
+    OPS = ('MOVE', 'FACE', 'TURN', 'FOLLOW')
+    ENDS = ('DONE', 'LIDAR', 'LINE', 'FINISH', 'DIST', 'HEAD')
+
+    ## The term project course
+    TERM_PROJECT = ((MOVE, 0.100, 0.17, DONE, 0),           # clear the start square
+                    (FOLLOW, 0.19, 0, LIDAR, 0),            # line follow to the wall
+                    (FACE, math.pi/2, 0, DONE, 0),          # turn left 90 degrees
+                    (MOVE, 0.250, 0.17, DONE, 0),           # out beside the obstacle
+                    (FACE, 0, 0, DONE, 0),                  # turn back right
+                    (MOVE, 0.450, 0.17, DONE, 0),           # past the obstacle
+                    (FACE, 3*math.pi/2, 0, DONE, 0),        # turn right, back towards the line
+                    (MOVE, 0.100, 0.17, DONE, 0),           # clear the wrong part of the track
+                    (MOVE, 0.300, 0.17, LINE, 0.6),         # until we find the line again
+                    (MOVE, 0.050, 0.17, DONE, 0),           # center Romi on the line
+                    (FACE, 0, 0, DONE, 0),                  # turn back left
+                    (FOLLOW, 0.17, 0, FINISH, 0),           # line follow to the finish
+                    (MOVE, 0.200, 0.14, DONE, 0))           # center up in the finish square
+
+    @staticmethod
+    def load(fname):
+        '''!@brief      Read a mission file from flash.
+            @param      fname   Mission file name.
+            @return     Tuple of step records, or None if the file is missing or bad.
+        '''
+        try:
+            with open(fname, 'r') as file:
+                lines = file.readlines()
+        except OSError:
+            print(f'Mission: no {fname}, using the built-in mission')
+            return None
+        steps = []
+        for n, line in enumerate(lines):
+            words = line.split('#')[0].split()
+            if not words:
+                continue
+            try:
+                op = Mission.OPS.index(words[0].upper())
+                nums = []
+                i = 1
+                while i < len(words) and words[i][0] in '0123456789.-+':
+                    nums.append(float(words[i]))
+                    i += 1
+                end = Mission.ENDS.index(words[i].upper()) if i < len(words) else Mission.DONE
+                e = float(words[i + 1]) if i + 1 < len(words) else 0.0
+            except (ValueError, IndexError):
+                print(f'Mission: {fname} line {n + 1} is not a mission step, using the built-in mission')
+                return None
+            nums += [0.0]*(2 - len(nums))
+            # Angles are in degrees in files
+            if op == Mission.FACE or op == Mission.TURN:
+                nums[0] *= math.pi/180
+            if end == Mission.HEAD:
+                e *= math.pi/180
+            steps.append((op, nums[0], nums[1], end, e))
+        if not steps:
+            print(f'Mission: {fname} is empty, using the built-in mission')
+            return None
+        return tuple(steps)
@@ -0,0 +1,294 @@
+# -*- coding: utf-8 -*-
+'''!@file       MotorMap.py
+    @brief      Romi motor deadband and friction compensation map
+    @details    MotorMap.py contains the class that characterizes Romi's two drive motors and
+                builds the inverse-model lookup tables RomiMot uses to linearize them.
+    @author     Joseph Penrose & Paolo Navarro
+    @date       October 18, 2026
+'''
+from array import array
+import struct
+import utime
+
+class MotorMap():
+    '''!@brief      Romi drive motor characterization and compensation map.
+        @details    A Romi gearmotor does not turn at all until the duty cycle is large enough
+                    to break static friction (the breakaway duty, around 12%), and above that
+                    its steady-state speed is not quite proportional to duty. This makes slow,
+                    precise motions impossible with a plain duty command. MotorMap measures
+                    both effects for each motor and hands RomiMot an inverse model, so that a
+                    command becomes a fraction of top speed instead of a raw duty cycle.
+
+        @details    Like BNO calibration, the map is measured once and saved to flash. On
+                    startup MotorMap looks for 'motor_map.bin'. If it exists, the map is
+                    loaded; if not, the characterization routine runs with Romi's wheels off
+                    the ground:
+
+                        1.  Slowly ramp both motors up from zero and record the duty at which
+                            each wheel starts to turn (breakaway).
+                        2.  Step both motors through duty cycles 0, 10, ... 100% and record the
+                            steady-state encoder speed at each step.
+
+        @details    The file is a compact binary table: a 3-byte header (b'RM' and the number
+                    of duty steps N) followed by, for each motor, the breakaway duty and N
+                    steady-state speeds as unsigned 16-bit integers in hundredths of a % and
+                    hundredths of a rad/s.
+
+        @details    The inverse table maps a linearized command u, 0~100% of the common top
+                    speed (the slower motor's speed at 100% duty), to the duty cycle that
+                    produces it. Both motors share the same top speed, so equal commands give
+                    equal wheel speeds. The table is evaluated in RomiMot every tick with a
+                    single indexed linear interpolation. Once the map is applied, every motor
+                    duty Share is in these units, % of top speed, rather than % duty. The top
+                    speed is put in a Share when the map is applied, so MasterMind can turn
+                    wheel speeds into commands.
+    '''
+
+    def __init__(self, mot_L, mot_R, spd_L, spd_R, duty_L, duty_R, EN_L, EN_R, map_flag,
+                 top, n_inv = 21, fname = 'motor_map.bin'):
+        '''!@brief      Initializes and returns a MotorMap object.
+            @param      mot_L       Left RomiMot object, receives the left inverse table.
+            @param      mot_R       Right RomiMot object, receives the right inverse table.
+            @param      spd_L       Left encoder speed Share [rad/s].
+            @param      spd_R       Right encoder speed Share [rad/s].
+            @param      duty_L      Left motor duty Share [%].
+            @param      duty_R      Right motor duty Share [%].
+            @param      EN_L        Left motor enable Share.
+            @param      EN_R        Right motor enable Share.
+            @param      map_flag    Trash flag Queue, raised when the map is applied.
+            @param      top         Common top speed Share [rad/s], put when the map is applied.
+            @param      n_inv       Number of points in the inverse tables. Default 21
+            @param      fname       Map file name on flash. Default 'motor_map.bin'
+        '''
+        # Motors & Shares
+        self.mot_L = mot_L
+        self.mot_R = mot_R
+        self.spd_L = spd_L
+        self.spd_R = spd_R
+        self.duty_L = duty_L
+        self.duty_R = duty_R
+        self.EN_L = EN_L
+        self.EN_R = EN_R
+        self.map_flag = map_flag
+        self.map_flag.clear()
+        self.top = top
+        self.fname = fname
+
+        # Characterization settings
+        self.duties = (0, 10, 20, 30, 40, 50, 60, 70, 80, 90, 100)  # [%] curve duty steps
+        self.N = len(self.duties)
+        self.ramp_rate = 5.0    # [%/s]     breakaway ramp rate
+        self.w_brk = 0.5        # [rad/s]   speed that counts as moving
+        self.t_settle = 400     # [ms]      settle time at each duty step
+        self.t_avg = 200        # [ms]      averaging time at each duty step
+
+        # Measured map
+        self.brk = [0.0, 0.0]                       # [%] breakaway duty, L & R
+        self.spd = [[0.0]*self.N, [0.0]*self.N]     # [rad/s] steady-state speeds, L & R
+
+        # Inverse tables, u = 0~100% in n_inv steps
+        self.n_inv = n_inv
+        self.inv_L = array('f', [0.0]*n_inv)
+        self.inv_R = array('f', [0.0]*n_inv)
+        self.w_top = 0.0        # [rad/s] common top speed
+
+        self.state = 1
+
+
+
+    def load(self):
+        '''!@brief      Read the map from flash.
+            @return     True if a valid map was read, else False.
+        '''
+        try:
+            with open(self.fname, 'rb') as file:
+                data = file.read()
+        except OSError:
+            return False
+
+        if len(data) != 3 + 4*(self.N + 1) or data[0:2] != b'RM' or data[2] != self.N:
+            print(f'MotorMap: {self.fname} does not match, ignoring it')
+            return False
+
+        vals = struct.unpack('<' + 'H'*(2*(self.N + 1)), data[3:])
+        for m in range(2):
+            base = m*(self.N + 1)
+            self.brk[m] = vals[base]/100
+            for i in range(self.N):
+                self.spd[m][i] = vals[base + 1 + i]/100
+        return True
+
+
+
+    def save(self):
+        '''!@brief      Write the map to flash as a compact binary table.
+        '''
+        vals = []
+        for m in range(2):
+            vals.append(int(self.brk[m]*100))
+            for w in self.spd[m]:
+                vals.append(min(int(w*100), 65535))
+        with open(self.fname, 'wb') as file:
+            file.write(b'RM' + bytes([self.N]))
+            file.write(struct.pack('<' + 'H'*len(vals), *vals))
+        print(f'MotorMap: new map saved as "{self.fname}"')
+
+
+
+    def build_inv(self, m, inv):
+        '''!@brief      Build one motor's inverse table from its measured map.
+            @details    The forward model is the breakaway point (brk, 0) followed by every
+                        measured step above breakaway, with speed forced non-decreasing. The
+                        inverse is found by linear interpolation for each evenly spaced
+                        command u.
+            @param      m       Motor index, 0 for left or 1 for right.
+            @param      inv     Inverse table to fill, array('f') of length n_inv.
+        '''
+        # Forward model points
+        D = [self.brk[m]]
+        W = [0.0]
+        for i in range(self.N):
+            if self.duties[i] > self.brk[m]:
+                D.append(self.duties[i])
+                W.append(max(self.spd[m][i], W[-1]))
+
+        # Invert at each command, zero command sits right at breakaway
+        inv[0] = D[0]
+        j = 0
+        for k in range(1, self.n_inv):
+            w = self.w_top*k/(self.n_inv - 1)
+            while j < len(W) - 2 and W[j + 1] < w:
+                j += 1
+            dw = W[j + 1] - W[j]
+            if dw > 0:
+                inv[k] = D[j] + (w - W[j])*(D[j + 1] - D[j])/dw
+            else:
+                inv[k] = D[j + 1]
+
+
+
+    def apply(self):
+        '''!@brief      Build both inverse tables and hand them to the motors.
+        '''
+        self.w_top = min(self.spd[0][-1], self.spd[1][-1])
+        if self.w_top <= 0 or max(self.brk) >= self.duties[-1]:
+            print('MotorMap: no motor speed in map, compensation off')
+            return
+        self.build_inv(0, self.inv_L)
+        self.build_inv(1, self.inv_R)
+        self.mot_L.SetMap(self.inv_L)
+        self.mot_R.SetMap(self.inv_R)
+        self.top.put(self.w_top)
+        print(f'MotorMap: breakaway L {self.brk[0]}%, R {self.brk[1]}%; top speed {self.w_top} rad/s')
+
+
+
+    def Characterize(self):
+        '''!@brief      Motor characterization routine.
+            @details    Ramps both motors together and records breakaway duty and the
+                        steady-state speed curve. Romi's wheels must be off the ground. This
+                        works as a GENERATOR, a SUB-TASK within a STATE in the MainTask, and
+                        it finishes with both motors stopped.
+        '''
+        # Wait for the motors to be enabled (blue button)
+        print('MotorMap: lift Romi wheels-up and press the blue button to characterize motors')
+        while not (self.EN_L.get() and self.EN_R.get()):
+            yield 0
+
+        # Breakaway: slow ramp until each wheel moves
+        self.brk = [0.0, 0.0]
+        moving = [False, False]
+        t0 = utime.ticks_ms()
+        while not (moving[0] and moving[1]):
+            d = self.ramp_rate*utime.ticks_diff(utime.ticks_ms(), t0)/1000
+            if d > 100:
+                break
+            if not moving[0]:
+                if abs(self.spd_L.get()) > self.w_brk:
+                    moving[0] = True
+                    self.brk[0] = d
+                self.duty_L.put(d if not moving[0] else 0)
+            if not moving[1]:
+                if abs(self.spd_R.get()) > self.w_brk:
+                    moving[1] = True
+                    self.brk[1] = d
+                self.duty_R.put(d if not moving[1] else 0)
+            yield 0
+        self.duty_L.put(0)
+        self.duty_R.put(0)
+
+        # Steady-state speed curve
+        for i in range(self.N):
+            self.duty_L.put(self.duties[i])
+            self.duty_R.put(self.duties[i])
+            t0 = utime.ticks_ms()
+            while utime.ticks_diff(utime.ticks_ms(), t0) < self.t_settle:
+                yield 0
+            sum_L = 0.0
+            sum_R = 0.0
+            n = 0
+            t0 = utime.ticks_ms()
+            while utime.ticks_diff(utime.ticks_ms(), t0) < self.t_avg:
+                sum_L += self.spd_L.get()
+                sum_R += self.spd_R.get()
+                n += 1
+                yield 0
+            self.spd[0][i] = sum_L/n
+            self.spd[1][i] = sum_R/n
+
+        # Stop
+        self.duty_L.put(0)
+        self.duty_R.put(0)
+        yield 1
+
+
+
+    def MainTask(self):
+        '''!@brief      Main cotask task for MotorMap.
+            @details    The MotorMap main task has states:
+
+                            1:  Check for map file state. If the map file is found and valid,
+                                load it and go to state 3. If not, go to state 2.
+                            2:  Characterization state. Run the characterization routine until
+                                it finishes, then save the new map and go to state 3.
+                            3:  Apply state. Build the inverse tables, give them to the motors,
+                                raise the map flag, and go to state 4.
+                            4:  Idle state. The map is in use; nothing left to do.
+
+            @details    Like all of Romi's cooperative multitasking tasks, MainTask is written
+                        as a generator function with an infinite loop. Each pass through the
+                        program runs through the MainTask while loop once, until it reaches a
+                        yield.
+        '''
+        while True:
+            # State 1: Check for map file
+            if self.state == 1:
+                if self.load():
+                    print(f'{self.fname} found!')
+                    self.state = 3
+                else:
+                    self.curr_man = self.Characterize()
+                    self.state = 2
+                yield self.state
+
+            # State 2: Characterize motors
+            elif self.state == 2:
+                if next(self.curr_man):
+                    self.save()
+                    self.state = 3
+                yield self.state
+
+            # State 3: Apply map
+            elif self.state == 3:
+                self.apply()
+                self.map_flag.put(1)
+                self.state = 4
+                yield self.state
+
+            # State 4: Idle
+            elif self.state == 4:
+                yield self.state
+
+            # RED ALERT, RED ALERT, INVALID STATE VARIABLE!!!
+            else:
+                raise ValueError("Invalid state variable in task MotorMap")
@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+'''!@file       PID.py
+    @brief      Romi discrete PID engine
+    @details    PID.py contains the lean discrete PID engine used inside Romi's closed-loop
+                controllers, and a benchmark to measure what one update costs on the robot.
+    @author     Joseph Penrose & Paolo Navarro
+    @date       October 18, 2026
+'''
+from array import array
+import utime
+try:
+    import micropython
+except ImportError:
+    class micropython():    # off the robot, update() runs as plain Python
+        @staticmethod
+        def native(f):
+            return f
+
+class PID():
+    '''!@brief      Discrete PID engine with filtered derivative and anti-windup.
+        @details    The controller runs every line following tick, so everything that does not
+                    change between ticks is worked out ahead of time. The gains are turned into
+                    discrete coefficients for the sample period Ts once, when they are set:
+
+                        P[k] = Kp e[k]
+                        I[k] = I[k-1] + Ki Ts e[k]
+                        D[k] = ad D[k-1] - bd (y[k] - y[k-1])
+                        u[k] = P[k] + I[k] + D[k]
+
+                    with ad = Tf/(Tf + Ts) and bd = Kd/(Tf + Ts) for a first-order derivative
+                    filter of time constant Tf = Kd/(N Kp). The derivative acts on the
+                    measurement y, not the error, so a step in the reference does not kick the
+                    output, and the filter keeps sensor noise from being amplified.
+
+        @details    Anti-windup is by conditional integration: when the output is saturated,
+                    the integrator only takes a step that pulls the output back inside the
+                    limits. The output can also be rate limited to du_max per second, which
+                    keeps the motors from being slammed when the line jumps.
+
+        @details    By default the engine assumes it is called every Ts, which is what cotask
+                    gives it. With measured_dt, it times each call instead and builds the
+                    coefficients on the fly, with dt clamped to (0, dt_max] so a stalled or
+                    repeated call cannot divide by zero or wind up.
+
+        @details    Coefficients and state live in preallocated float arrays, update() does no
+                    input validation and no attribute lookups per term, and it is compiled
+                    with the native emitter. Run bench() on the robot to see the cost of a call.
+    '''
+
+    def __init__(self, Kp, Ki = 0.0, Kd = 0.0, Ts = 0.010, N = 10.0, u_min = None, u_max = None,
+                 du_max = None, measured_dt = False, dt_max = 0.050):
+        '''!@brief      Initializes and returns a PID object.
+            @param      Kp          Proportional gain.
+            @param      Ki          Integral gain. Default off
+            @param      Kd          Derivative gain. Default off
+            @param      Ts          Sample period [s]. Default 0.010
+            @param      N           Derivative filter ratio; the filter time constant is
+                                    Kd/(N Kp). Default 10
+            @param      u_min       Lower output limit. Default none
+            @param      u_max       Upper output limit. Default none
+            @param      du_max      Output rate limit [units/s]. Default none
+            @param      measured_dt True to time each call instead of assuming Ts. Default
+                                    False
+            @param      dt_max      Longest measured dt used [s]. Default 0.050
+        '''
+        if (u_min is None) != (u_max is None):
+            raise Exception("Control saturation requires both upper and lower limits to be defined")
+        if u_min is not None and u_min >= u_max:
+            raise Exception("Lower output limit must be below the upper limit")
+        if Ts <= 0:
+            raise Exception("Sample period must be positive")
+        self.Ts = Ts
+        self.N = N
+        self.measured = measured_dt
+        self.dt_max = dt_max
+
+        # Coefficients: Kp, Ki Ts, ad, bd, u_min, u_max, du, Ki, Kd, Tf
+        self.c = array('f', [0.0]*10)
+        self.c[4] = -3e38 if u_min is None else u_min
+        self.c[5] = 3e38 if u_max is None else u_max
+        self.c[6] = 3e38 if du_max is None else du_max*Ts
+        self.du_max = du_max
+
+        # State: I, D, y[k-1], u[k-1], primed
+        self.s = array('f', [0.0]*5)
+        self.t0 = utime.ticks_us()
+        self.set_gains(Kp, Ki, Kd)
+
+
+
+    def set_gains(self, Kp, Ki = None, Kd = None):
+        '''!@brief      Set the gains and precompute the discrete coefficients.
+            @details    Gains left as None keep their current value. The integrator holds the
+                        integral term itself, so changing Ki does not make the output jump.
+            @param      Kp      Proportional gain.
+            @param      Ki      Integral gain. Default unchanged
+            @param      Kd      Derivative gain. Default unchanged
+        '''
+        c = self.c
+        if Ki is None:
+            Ki = c[7]
+        if Kd is None:
+            Kd = c[8]
+        Ts = self.Ts
+        Tf = Kd/(self.N*Kp) if Kd > 0 and Kp > 0 else 0.0
+        c[0] = Kp
+        c[1] = Ki*Ts
+        c[2] = Tf/(Tf + Ts)
+        c[3] = Kd/(Tf + Ts)
+        c[7] = Ki
+        c[8] = Kd
+        c[9] = Tf
+
+
+
+    def set_limits(self, u_min, u_max):
+        '''!@brief      Change the output limits.
+            @param      u_min   Lower output limit.
+            @param      u_max   Upper output limit.
+        '''
+        self.c[4] = u_min
+        self.c[5] = u_max
+
+
+
+    def reset(self, u0 = 0.0):
+        '''!@brief      Clear the integrator, derivative filter, and history.
+            @details    The output rate limit starts from u0, so the first update after a
+                        reset is rate limited like any other.
+            @param      u0      Output the rate limit starts from. Default 0
+        '''
+        s = self.s
+        s[0] = 0.0
+        s[1] = 0.0
+        s[2] = 0.0
+        s[3] = u0
+        s[4] = 0.0
+        self.t0 = utime.ticks_us()
+
+
+
+    @micropython.native
+    def update(self, r, y):
+        '''!@brief      Run one controller update.
+            @param      r       Reference.
+            @param      y       Measurement.
+            @return     Controller output.
+        '''
+        c = self.c
+        s = self.s
+
+        # Coefficients, fixed or from the measured period
+        kiT = c[1]
+        ad = c[2]
+        bd = c[3]
+        du = c[6]
+        if self.measured:
+            t = utime.ticks_us()
+            dt = utime.ticks_diff(t, self.t0)/1000000
+            self.t0 = t
+            if dt <= 0 or dt > self.dt_max:
+                dt = self.dt_max
+            kiT = c[7]*dt
+            ad = c[9]/(c[9] + dt)
+            bd = c[8]/(c[9] + dt)
+            if self.du_max is not None:
+                du = self.du_max*dt
+
+        # First call: no derivative history yet; the rate limit starts from the reset output
+        if s[4] == 0.0:
+            s[2] = y
+            s[4] = 1.0
+
+        e = r - y
+        P = c[0]*e
+        D = ad*s[1] - bd*(y - s[2])
+        I = s[0] + kiT*e
+        u = P + I + D
+
+        # Saturation with conditional integration
+        if u > c[5]:
+            u = c[5]
+            if e > 0:
+                I = s[0]
+        elif u < c[4]:
+            u = c[4]
+            if e < 0:
+                I = s[0]
+
+        # Output rate limit
+        if u - s[3] > du:
+            u = s[3] + du
+        elif s[3] - u > du:
+            u = s[3] - du
+
+        s[0] = I
+        s[1] = D
+        s[2] = y
+        s[3] = u
+        return u
+
+
+
+def bench(n = 2000):
+    '''!@brief      Time PID.update() on the robot.
+        @details    Run from the REPL with "import PID; PID.bench()". Prints the time and heap
+                    used per call, with the loop overhead taken out, for fixed and measured dt.
+        @param      n       Number of calls to time. Default 2000
+    '''
+    import gc
+    def loop(pid, n):
+        for i in range(n):
+            pid.update(0.0, 0.01*(i & 63))
+
+    for measured in (False, True):
+        pid = PID(0.5, 0.2, 0.02, u_min = -1, u_max = 1, du_max = 50, measured_dt = measured)
+        # Empty loop for the overhead
+        gc.collect()
+        t0 = utime.ticks_us()
+        for i in range(n):
+            0.01*(i & 63)
+        t_loop = utime.ticks_diff(utime.ticks_us(), t0)
+        gc.collect()
+        m0 = gc.mem_free()
+        t0 = utime.ticks_us()
+        loop(pid, n)
+        t = utime.ticks_diff(utime.ticks_us(), t0)
+        m1 = gc.mem_free()
+        print(f'PID.update, {"measured" if measured else "fixed"} dt: '
+              f'{(t - t_loop)/n:.1f} us/call, {(m0 - m1)/n:.1f} bytes/call')
@@ -8,6 +8,8 @@
 # Required modules
 import utime
 import math
+from TrajGen import TrajGen
+from Mission import Mission
 class RomiMM():
     '''!@brief      A Romi robot MasterMind brain object.
         @details    Class creates and contains Romi MasterMind object. It contains all of
@@ -43,7 +45,8 @@ class RomiMM():
                     fixed maneuver, etc).
     '''
     
-    def __init__(self, dict_L, dict_R, BNO_shares, LS_shares, LidarDist, W, r, LineController): 
+    def __init__(self, dict_L, dict_R, BNO_shares, LS_shares, LidarDist, W, r, LineController, HeadingController, MapFlag, MapTop, StopDist,
+                 TuneRule = None, Geo = False, MPC = None, Gov = None, Track = None, Plan = None, Log = None): 
         '''!@brief      Initializes and returns a Romi Brain object.
             @details    RomiMM's init method creates references to essentially all of Romi's
                         Shares and Queues. MasterMind is the "central office" of Romi, so all
@@ -71,6 +74,28 @@ class RomiMM():
             @param      W           Romi's wheelbase width in [m].
             @param      r           Romi's wheel radius in [m].
             @param      LineController  LineCL line following closed-loop controller object.
+            @param      HeadingController   HeadingCL cascaded heading controller object.
+            @param      MapFlag     MotorMap trash flag Queue, full once the motor map is applied.
+            @param      MapTop      MotorMap top speed Share [rad/s], put when the motor map is
+                                    applied.
+            @param      StopDist    StopDist object, gives the obstacle trigger distance at
+                                    Romi's current speed.
+            @param      TuneRule    LineCL tuning rule name. When given, Romi relay-tunes the
+                                    line follower instead of running the term project. Default
+                                    none
+            @param      Geo         True to follow the line with the geometric (Stanley)
+                                    follower instead of the sensor value PID. Default False
+            @param      MPC         MPCLut object. When given with a table loaded, Romi follows
+                                    the line with the explicit MPC follower. Default none
+            @param      Gov         SpeedGov object. When given, the line followers' base speed
+                                    is governed every tick instead of fixed. Default none
+            @param      Track       LineTrack object. When given, the line followers steer on
+                                    the extrapolated line through gaps in a dashed line.
+                                    Default none
+            @param      Plan        Mission steps to run in state 4 (see Mission). Default the
+                                    term project course, Mission.TERM_PROJECT
+            @param      Log         Logger or Telemetry object. When given, Romi's pose is
+                                    logged to it every tick. Default none
         '''
         # Store a reference to ALL SHARES. ULTIMATE KNOWLEDGE, ULTIMATE POWER
         self.dict_L = dict_L                    # left side drive data
@@ -79,10 +104,18 @@ class RomiMM():
         self.BNO_eul_x = BNO_shares[2]          # BNO compass Share
         self.BNO_cal_flag = BNO_shares[1]       # BNO cal flag Queue
         self.BNO_z_flag = BNO_shares[8]         # BNO zero flag Queue
+        self.BNO_zav = BNO_shares[7]            # BNO yaw rate Share
         self.sens_val_share = LS_shares[0]      # Axial sensor value Share
         self.finish_flag = LS_shares[1]         # finish line trash flag Queue
         self.sens_sum_share = LS_shares[2]      # Axial sensor value Share
+        self.line_pos_share = LS_shares[3]      # [mm] front array line position Share
+        self.line_off_share = LS_shares[4]      # [mm] line offset at the wheel axis Share
+        self.line_ang_share = LS_shares[5]      # [rad] line angle to the chassis Share
+        self.line_ok_share = LS_shares[6]       # front array sees the line Share
+        self.LS_ready_flag = LS_shares[7]       # line sensors calibrated trash flag Queue
         self.LidarDist = LidarDist              # [mm] distance sensor Share
+        self.map_flag = MapFlag                 # motor map ready trash flag Queue
+        self.map_top = MapTop                   # [rad/s] motor map top speed Share
         
         # Store Romi attributes
         self.W = W              # Romi wheelbase width, on tire centers
@@ -107,11 +140,56 @@ class RomiMM():
         self.d_c = 0            # little delta
         self.dist = 0.0         # maneuver distance storage
         self.halfcirc_flag = 0  # half-circle marker flag, for Lab 0x04
-        self.nin = 83*(3.14/180)# corrected "90 degrees" for Turn
         self.ogdir = 0.0        # recorded heading before hitting obstacle
+        self.tune = TuneRule    # line follower tuning rule, or None
+        self.geo = Geo          # True to line follow with GeoFollow
+        self.mpc = MPC          # MPCLut table for MPCFollow, or None
+        self.gov = Gov          # SpeedGov line following speed governor, or None
+        self.track = Track      # LineTrack dashed line gap bridging, or None
+        self.plan = Plan if Plan is not None else Mission.TERM_PROJECT  # mission steps
+        self.log = Log          # Logger telemetry logger, or None
+        if Log is not None:
+            self.ch_X = Log.channel('X')        # pose channels
+            self.ch_Y = Log.channel('Y')
+            self.ch_phi = Log.channel('phi')
+        
+        # Maneuver motion profile limits & tracking gains
+        self.v_whl = 0.30       # [m/s]     wheel speed limit for profiled maneuvers
+        self.a_whl = 0.80       # [m/s^2]   wheel acceleration limit for profiled maneuvers
+        self.w_nom = 16.0       # [rad/s]   top wheel speed until the motor map gives it
+        self.v_move = 0.17      # [m/s]     straight move speed outside of missions
+        self.v_tune = 0.19      # [m/s]     line follower tuning speed
+        self.Kp_d = 500.0       # [%/m]     LineMove position error gain
+        self.d_tol = 0.003      # [m]       LineMove final position tolerance
+        self.t_settle = 0.3     # [s]       extra time allowed past the profile to settle
+        self.k_st = 1.0         # [1/s]     Stanley cross-track gain
+        self.k_soft = 0.05      # [m/s]     Stanley low speed softening
+        self.L_st = 0.10        # [m]       Stanley virtual wheelbase
+        self.d_max = 1.2        # [rad]     Stanley steering angle limit
+        self.v_st = 0.05        # [m/s]     lowest speed used for steering
+        self.L_arr = 0.075      # [m]       front sensor array ahead of the axle
+        self.mm_per_val = 20.0  # [mm]      line position per unit of sensor value, as LineSensors
+        self.h_tol = 0.05       # [rad]     mission heading end condition tolerance
+        self.m_dist = 0.0       # [m]       distance travelled in the current mission step
         
         # Closed-loop control objects
         self.LCL = LineController   # LineCL object used for line following control
+        self.HCL = HeadingController    # HeadingCL object used for turns
+        self.traj = TrajGen(self.v_whl, self.a_whl, 'scurve')  # maneuver profile generator
+        self.SD = StopDist          # StopDist object used for the obstacle trigger
+        self.SetKff(self.w_nom)     # wheel speed to duty feed-forward, self.Kff
+        
+        # Mission dispatch tables, indexed by the Mission op & end codes
+        self.man_tab = (lambda a, b: self.LineMove(a, self.Kff*b),  # MOVE
+                        lambda a, b: self.Face(a),                  # FACE
+                        lambda a, b: self.Turn(a),                  # TURN
+                        lambda a, b: self.Follower(self.Kff*a))     # FOLLOW
+        self.end_tab = (lambda e: not self.man_flag,                            # DONE
+                        lambda e: self.LidarDist.get() <= self.SD.trigger(self.V_c),  # LIDAR
+                        lambda e: self.sens_sum_share.get() > e,                # LINE
+                        lambda e: self.finish_flag.full(),                      # FINISH
+                        lambda e: self.m_dist >= e,                             # DIST
+                        lambda e: abs(self.AngWrap(e - self.phi)) < self.h_tol) # HEAD
 
 
 
@@ -167,11 +245,26 @@ class RomiMM():
         # Update wheel speeds and deltas, for control purposes:
         self.w_L = self.dict_L["Encoder"][2].get()  # [rad/s] Left encoder angular speed
         self.w_R = self.dict_R["Encoder"][2].get()  # [rad/s] Right encoder angular speed
+        self.V_c = 0.5*self.r*(self.w_L + self.w_R) # [m/s] Romi's center point speed
         self.l_L = l_L                              # [m] Left wheel delta
         self.l_L = l_R                              # [m] Right wheel delta
 
 
 
+    def Telemetry(self):
+        '''!@brief      Log Romi's pose.
+            @details    Called by Drive, so once every tick of every maneuver. Printing the
+                        pose would build a string and wait on the USB VCP; logging it packs
+                        three records into the Logger's buffer, which the Logger's own task
+                        sends on.
+        '''
+        if self.log is not None:
+            self.log.log(self.ch_X, self.X)
+            self.log.log(self.ch_Y, self.Y)
+            self.log.log(self.ch_phi, self.phi)
+        
+        
+        
     def Drive(self, duty_L, duty_R): 
         '''!@brief      Romi drive command.
             @details    Helper method used to send motor efforts out to Romi's motors. Simply
@@ -185,26 +278,75 @@ class RomiMM():
         ''' 
         # Update dead reckoning
         self.Dead_Reck()    # first of all, where are we?
+        self.Telemetry()    # ...and tell the logger
         
         # ...and pass them to the motors!
-        self.dict_L["Motor"][1].put(duty_L * 1.15)            # Left motor duty
-        self.dict_R["Motor"][1].put(duty_R * 1)            # Right motor duty
+        self.dict_L["Motor"][1].put(duty_L)            # Left motor duty
+        self.dict_R["Motor"][1].put(duty_R)            # Right motor duty
         
         
 
-    def LineMove(self, target, speed): 
+    def AngWrap(self, angle):
+        '''!@brief      Wrap an angle into the range -pi < angle <= pi.
+            @details    Romi's heading lives in 0 < phi < 2pi, so the difference of two headings
+                        can be off by a full turn. Wrapping the difference gives the shortest
+                        signed rotation between them.
+            @param      angle       Angle in [rad].
+            @return     Equivalent angle in [rad], between -pi and pi.
+        '''
+        while angle > math.pi:
+            angle -= 2*math.pi
+        while angle <= -math.pi:
+            angle += 2*math.pi
+        return angle
+        
+        
+        
+    def LineMove(self, target, speed, hold = True): 
         '''!@brief      Romi straight line move.
-            @details    Romi moves in a straight line at a target speed for a set
-                        distance. Romi will end the move when it has moved at least
-                        distance ln. This move task works as a GENERATOR, a SUB-TASK within
-                        a STATE in the MainTask.
+            @details    Romi moves in a straight line for a set distance along a time-optimal
+                        motion profile. The profile is planned once from the wheel speed and
+                        acceleration limits, and then tracked every pass using a speed
+                        feed-forward plus a position error correction. Romi will end the move
+                        when the profile is complete and it is within d_tol of the target, or
+                        when the settle time runs out. This move task works as a GENERATOR, a
+                        SUB-TASK within a STATE in the MainTask.
+                        
+            @details    With heading-hold on, the heading at the start of the move is captured
+                        and the cascaded heading controller corrects the wheel duty differential
+                        every pass to hold it, so Romi does not drift off a straight line due
+                        to mismatched motors.
             @param      target      Target distance in [m].
-            @param      speed       Target forward speed, as a duty cycle percentage.
+            @param      speed       Maximum forward speed, as a duty cycle percentage. It is
+                                    converted to a speed limit using the feed-forward gain.
+            @param      hold        True to hold the starting heading with IMU feedback.
+                                    Default on
         '''                 
-        # While we have not yet crossed the target distance:
-        while self.dist < target:
-            # Keep driving forward
-            self.Drive(speed, speed)
+        # Plan the move
+        T = self.traj.plan(target, speed/self.Kff)
+        phi0 = self.phi     # heading to hold
+        u = 0.0             # heading-hold differential duty
+        self.HCL.reset()
+        t0 = utime.ticks_us()
+        
+        while True:
+            # Where should we be right now?
+            t = utime.ticks_diff(utime.ticks_us(), t0)/(10**6)     # [s] time into move
+            done = self.traj.sample(t)
+            err = self.traj.p - self.dist                           # [m] tracking error
+            
+            # End of the move
+            if done and (abs(err) < self.d_tol or t > T + self.t_settle):
+                break
+            
+            # Track the profile
+            duty = self.Kff*self.traj.v + self.Kp_d*err
+            
+            # Hold the starting heading, positive u steers left
+            if hold:
+                u = self.HCL.controller(phi0, self.phi, self.BNO_zav.get())
+            
+            self.Drive(duty - u, duty + u)
             # Calculate distance travelled during move:
             self.dist += self.d_c   # [m] distance travelled by Romi
             yield 0                 # not done!
@@ -215,38 +357,40 @@ class RomiMM():
         
         
 
-    def Turn(self, angle): 
+    def Turn(self, angle, tol = 0.03): 
         '''!@brief      Romi turn move through an angle.
-            @details    Romi turns on a dime through an angle. It checks which turning
-                        direction is faster to get to the target heading. Then, it turns in
-                        that direction until Romi is facing the target angle. This move task 
-                        works as a GENERATOR, a SUB-TASK within a STATE in the MainTask.
-            @param      angle       Target angle in [rad]. Signed.
+            @details    Romi turns on a dime through an angle along a time-optimal motion
+                        profile. The angular speed and acceleration limits come from the wheel
+                        limits, since each wheel travels W/2 per radian of turn. Every pass, the
+                        profile heading and rate are handed to the cascaded heading controller,
+                        which closes an outer loop on BNO heading and an inner loop on BNO yaw
+                        rate. The move ends when the profile is complete and the controller
+                        reports it has settled within tol, or when the settle time runs out.
+                        This move task works as a GENERATOR, a SUB-TASK within a STATE in the
+                        MainTask.
+            @param      angle       Target angle in [rad]. Signed, positive turns left.
+            @param      tol         Final heading tolerance in [rad]. Default 0.03 rad
         '''     
-        # Calculate target
-        target = self.phi + angle
-        
-        # Saturation: Romi reads only 0 < phi < 6.28 (2pi)
-        if target > 6.28:
-            target -= 6.28
-        elif target < 0:
-            target += 6.28
+        # Plan the turn
+        phi0 = self.phi
+        T = self.traj.plan(angle, 2*self.v_whl/self.W, 2*self.a_whl/self.W)
+        self.HCL.SetSettle(tol, self.HCL.r_tol, self.HCL.n_settle)
+        self.HCL.reset()
+        t0 = utime.ticks_us()
+        
+        while True:
+            # Where should we be pointing right now?
+            t = utime.ticks_diff(utime.ticks_us(), t0)/(10**6)     # [s] time into turn
+            done = self.traj.sample(t)
             
-        # Which way to turn?    
-        if angle > 0:
-            # Turn left:
-            w_L = -12
-            w_R = 12         
-        else:
-            # Turn right:
-            w_L = 12
-            w_R = -12
-        
-        # While we have not yet found the target angle:
-        while abs(target - self.phi) > 0.03:
-            # print(f'target: {target}')
-            # Keep turning
-            self.Drive(w_L, w_R)
+            # Cascaded heading / yaw rate control, positive duty turns left
+            duty = self.HCL.controller(phi0 + self.traj.p, self.phi, self.BNO_zav.get(), self.traj.v)
+            
+            # End of the turn
+            if done and (self.HCL.settled() or t > T + self.t_settle):
+                break
+            
+            self.Drive(-duty, duty)
             yield 0         # not done!
                 
         self.man_flag = 0   # lower maneuver flag
@@ -256,37 +400,83 @@ class RomiMM():
 
     def Face(self, heading): 
         '''!@brief      Romi turn move to face a certain direaction.
-            @details    Romi turns on a dime to face a specific direction. It checks which turning
-                        direction is faster to get to the target heading. Then, it turns in
-                        that direction until Romi is facing the target angle. This move task 
-                        works as a GENERATOR, a SUB-TASK within a STATE in the MainTask.
+            @details    Romi turns on a dime to face a specific direction. It finds the shortest
+                        signed rotation from the current heading to the target heading, and then
+                        runs it as a profiled Turn. This move task works as a GENERATOR, a
+                        SUB-TASK within a STATE in the MainTask.
             @param      heading         Target heading in [rad].
         '''     
-        # Calculate target
-        target = heading - self.phi
+        # Shortest way around, then turn through it
+        yield from self.Turn(self.AngWrap(heading - self.phi), 0.02)
         
-        if target < -3.14:
-            target += 6.28
         
-        # Which way to turn? 
-        if target < 0 or target > 3.14:
-            # Turn right:
-            w_L = 13
-            w_R = -13     
-        else:
-            # Turn left:
-            w_L = -13
-            w_R = 13    
-        
-        # While we have not yet found the target angle:
-        while abs(heading - self.phi) > 0.02:
-            # print(f'target: {heading}')
-            # Keep turning
-            self.Drive(w_L, w_R)
-            yield 0         # not done!
-                
-        self.man_flag = 0   # lower maneuver flag
-        yield 1             # done!
+        
+    def SetKff(self, w_top):
+        '''!@brief      Set the wheel speed to duty feed-forward from Romi's top speed.
+            @details    Once the motor map is applied, a duty command is a percentage of the
+                        top wheel speed, so a wheel speed v takes a command of Kff*v with
+                        Kff = 100/(w_top*r). The heading controller's yaw rate feed-forward,
+                        Kff*W/2, and the speed governor follow from the same gain.
+            @param      w_top       Top wheel speed [rad/s].
+        '''
+        self.Kff = 100/(w_top*self.r)   # [%/(m/s)]
+        self.HCL.SetKff(self.Kff*self.W/2)
+        if self.gov is not None:
+            self.gov.SetKff(self.Kff)
+        
+        
+        
+    def FollowStart(self, speed):
+        '''!@brief      Reset the line following helpers for a new run.
+            @param      speed       Starting base speed in duty cycle percent.
+        '''
+        if self.gov is not None:
+            self.gov.reset(speed)
+        if self.track is not None:
+            self.track.reset()
+        
+        
+        
+    def Bridge(self):
+        '''!@brief      Update the line tracker for this tick.
+            @details    Call once per line following tick. While the front array sees the line,
+                        the tracker records it; in a gap, it extrapolates the line from Romi's
+                        pose.
+            @return     True if the follower should steer on the tracker's synthetic values.
+        '''
+        if self.track is None:
+            return False
+        return self.track.update(self.X, self.Y, self.phi, self.line_pos_share.get(),
+                                 self.line_ok_share.get())
+        
+        
+        
+    def LinePose(self):
+        '''!@brief      Line offset and angle for the geometric followers.
+            @return     Tuple (offset [mm], angle [rad]), from the sensor arrays, or from the
+                        line tracker through a gap.
+        '''
+        if self.Bridge():
+            return self.track.off, self.track.ang
+        return self.line_off_share.get(), self.line_ang_share.get()
+        
+        
+        
+    def Govern(self, speed):
+        '''!@brief      Base duty for this line following tick.
+            @details    Without a speed governor this is just the fixed speed. With one, the
+                        governor is handed the front array line error and the larger of the
+                        measured path curvature (yaw rate over speed) and the curvature ahead,
+                        2 psi/L_arr for a line at angle psi over the L_arr between the arrays.
+            @param      speed       Fixed base speed in duty cycle percent.
+            @return     Base duty cycle percent.
+        '''
+        if self.gov is None:
+            return speed
+        v = self.V_c if self.V_c > self.v_st else self.v_st
+        k_m = abs(self.BNO_zav.get()/v)                         # [1/m] measured curvature
+        k_a = abs(2*self.line_ang_share.get()/self.L_arr)       # [1/m] curvature ahead
+        return self.gov.update(self.line_pos_share.get(), k_m if k_m > k_a else k_a)
         
         
         
@@ -306,17 +496,27 @@ class RomiMM():
                         of Romi's corrections, and integral and derivative controls can be applied to
                         smooth out Romi's motions.
             @param      sensor      Weighted sensor value from the line sensors.
-            @param      speed       Base speed in duty cycle percent.
+            @param      speed       Base speed in duty cycle percent, or the starting speed
+                                    with a speed governor.
         '''     
         # Initial duty cycles            
         w_L_0 = speed
         w_R_0 = speed
+        self.LCL.reset()            # nothing carried over from the last run
+        self.FollowStart(speed)
         
         while True:
             # Update duty cycles by weight
             sensor_val = sensor.get()
+            if self.Bridge():
+                sensor_val = self.track.x/self.mm_per_val   # through a gap, extrapolated
+            
+            # Schedule gains on speed & curvature (yaw rate over speed)
+            v = self.V_c if self.V_c > 0.05 else 0.05
+            self.LCL.Schedule(self.V_c, self.BNO_zav.get()/v)
             
             CS = self.LCL.controller(0, sensor_val)
+            w_L_0 = w_R_0 = self.Govern(speed)
             
             # print(f'Sensor: {sensor_val}; Control: {CS}')
             # print(f'Sensor: {sensor_val}')
@@ -332,12 +532,182 @@ class RomiMM():
         
         
         
+    def GeoFollow(self, speed):
+        '''!@brief      Romi geometric (Stanley) line follower.
+            @details    LineFollow steers on a single sensor value, so the correction it makes
+                        is tied to the base speed and it only sees Romi's offset from the line,
+                        not which way the line is heading. GeoFollow uses the line pose from
+                        both sensor arrays instead, the offset e at the wheel axis and the
+                        line's angle psi to the chassis (both positive when the line is off to
+                        Romi's right), and steers like the Stanley path tracker:
+                        
+                            delta = psi + atan(k_st*e/(v + k_soft))
+                            r_cmd = -v*tan(delta)/L_st
+                        
+                        where v is Romi's measured speed. The heading term lines Romi up with
+                        the line, and the cross-track term steers back onto it at an angle that
+                        shrinks as Romi speeds up, so the response stays well damped over the
+                        whole speed range instead of oscillating when fast.
+                        
+            @details    The yaw rate command goes to the inner yaw rate loop of the heading
+                        controller, which closes it on the BNO gyro and gives a differential
+                        duty about the base speed. If a sensor array loses the line, the last
+                        pose is held. Like all Romi maneuvers, this function is a generator
+                        sub-task.
+            @param      speed       Base speed in duty cycle percent, or the starting speed
+                                    with a speed governor.
+        '''
+        self.HCL.reset()            # nothing carried over from the last maneuver
+        self.FollowStart(speed)
+        
+        while True:
+            v = self.V_c if self.V_c > self.v_st else self.v_st
+            
+            # Stanley steering angle from the line pose, limited
+            off, psi = self.LinePose()
+            e = off/1000                            # [m] line offset
+            delta = psi + math.atan2(self.k_st*e, v + self.k_soft)
+            if delta > self.d_max:
+                delta = self.d_max
+            elif delta < -self.d_max:
+                delta = -self.d_max
+            
+            # Yaw rate to differential duty, positive turns left
+            r_cmd = -v*math.tan(delta)/self.L_st
+            u = self.HCL.controller(self.phi, self.phi, self.BNO_zav.get(), r_cmd)
+            
+            u0 = self.Govern(speed)
+            self.Drive(u0 - u, u0 + u)          # send duty cycles to motors
+            
+            yield 1                 # exit subtask
+        
+        
+        
+    def MPCFollow(self, speed):
+        '''!@brief      Romi explicit MPC line follower.
+            @details    Like GeoFollow, MPCFollow steers on the line pose from both sensor
+                        arrays, but the yaw rate command comes from a model predictive
+                        controller solved offline (see MPCLut and tools/mpc_lut.py). The
+                        controller plans the yaw rate over a short horizon at Romi's current
+                        speed, so it turns in as hard as the yaw rate limit allows when far off
+                        and eases onto the line without overshoot. Evaluating the table is a
+                        few index calculations and reads per tick. The yaw rate command goes to
+                        the heading controller's yaw rate loop, as in GeoFollow. Like all Romi
+                        maneuvers, this function is a generator sub-task.
+            @param      speed       Base speed in duty cycle percent, or the starting speed
+                                    with a speed governor.
+        '''
+        self.HCL.reset()            # nothing carried over from the last maneuver
+        self.FollowStart(speed)
+        
+        while True:
+            off, psi = self.LinePose()
+            e = off/1000                            # [m] line offset
+            r_cmd = self.mpc.eval(e, psi, self.V_c)
+            
+            # Yaw rate to differential duty, positive turns left
+            u = self.HCL.controller(self.phi, self.phi, self.BNO_zav.get(), r_cmd)
+            
+            u0 = self.Govern(speed)
+            self.Drive(u0 - u, u0 + u)          # send duty cycles to motors
+            
+            yield 1                 # exit subtask
+        
+        
+        
+    def Follower(self, speed):
+        '''!@brief      Pick the line follower maneuver.
+            @param      speed       Base speed in duty cycle percent.
+            @return     MPCFollow generator if an MPC table is loaded, else GeoFollow if Geo
+                        was set, else LineFollow.
+        '''
+        if self.mpc is not None and self.mpc.ready:
+            return self.MPCFollow(speed)
+        if self.geo:
+            return self.GeoFollow(speed)
+        return self.LineFollow(self.sens_val_share, speed)
+        
+        
+        
+    def RunMission(self, plan):
+        '''!@brief      Romi mission engine.
+            @details    Runs each step of a mission in turn: it creates the step's maneuver,
+                        then keeps maneuvering until the step's end condition is met. The
+                        maneuver and the end condition are both looked up by their codes, so
+                        every step runs the same few lines no matter what it does. A step that
+                        ends before its maneuver does (for example, a move that stops on
+                        finding the line) just drops the maneuver, and a maneuver that finishes
+                        before its end condition is met (the line is not found within the
+                        move) ends the step too, so the mission carries on with the next one. Like all Romi maneuvers, this
+                        function is a generator sub-task.
+            @param      plan        Tuple of mission step records (see Mission).
+            @return     Yields False while the mission runs, then True when it is done.
+        '''
+        for n, (op, a, b, end, e) in enumerate(plan):
+            print(f'Mission step {n}: {Mission.OPS[op]} until {Mission.ENDS[end]}')
+            self.finish_flag.clear()    # only a finish seen during the step counts
+            self.curr_man = self.man_tab[op](a, b)  # Create maneuver
+            self.man_flag = 1                       # raise maneuver flag. we got one!
+            self.m_dist = 0.0
+            done = self.end_tab[end]
+            
+            # Keep maneuvering until the end condition is met, or the maneuver runs out
+            # without meeting it (e.g. no line found within the move), then move on
+            while self.man_flag and not done(e):
+                next(self.curr_man)
+                self.m_dist += abs(self.d_c)
+                yield False
+            
+            self.man_flag = 0       # drop the maneuver if it is still going
+            self.dist = 0.0         # reset distance var
+            self.finish_flag.clear()
+        
+        yield True
+        
+        
+        
+    def RelayTune(self, sensor, speed, rule):
+        '''!@brief      Romi line follower relay auto-tune.
+            @details    Romi follows the line with LineCL's relay in place of the PID, which
+                        makes it weave about the line in a small, steady oscillation. Once
+                        enough cycles are measured, the PID gains are worked out with the given
+                        tuning rule, applied, and saved to flash. If Romi strays too far from
+                        the line, the test is called off and the gains are left alone. Start
+                        Romi on a long straight. Like all Romi maneuvers, this function is a
+                        generator sub-task.
+            @param      sensor      Weighted sensor value from the line sensors.
+            @param      speed       Base speed in duty cycle percent.
+            @param      rule        LineCL tuning rule name.
+        '''
+        self.LCL.RelayStart()
+        v_sum = 0.0         # [m/s] summed speed, for the tuning speed
+        n = 0
+        
+        while not self.LCL.relay_done:
+            CS = self.LCL.Relay(sensor.get())
+            self.Drive(speed*(1 - CS), speed*(1 + CS))
+            v_sum += self.V_c
+            n += 1
+            yield 1                 # exit subtask
+        
+        self.Drive(0, 0)
+        if self.LCL.Tune(rule, v_sum/n if n else 0.0) is not None:
+            self.LCL.save()
+        else:
+            print('RomiMM: relay test called off, line follower gains unchanged')
+        self.man_flag = 0
+        yield 0
+        
+        
+        
     def MainTask(self):
         '''!@brief      Main cotask task for RomiMM.
             @details    The RomiMM main task has states:
                 
                             0:  Init state. Romi waits without moving until BNO has reported that
-                                the sensors are calibrated and have begun transmitting data. Once
+                                the sensors are calibrated and have begun transmitting data,
+                                LineSensors has finished its calibration sweep, and MotorMap
+                                has applied the motor compensation map. Once
                                 BNO reports it is ready, MasterMind zeros out its world coordinates
                                 before kicking into the first motion state.
                             1:  Chill state. Romi sends stop commands to motors and waits here 
@@ -350,15 +720,18 @@ class RomiMM():
                                 the term project, and stop in the same spot it started. It detects
                                 when Romi has passed through a half-circle, then watches for when X
                                 returns to Home 0 to stop.
-                            4:  Do Term Project. This state is a list of the required maneuvers to
-                                complete the term project track. It includes line following at the
-                                start, then a programmed object avoidance when the wall is detected,
-                                then another line follow until the finish line is found. Then, Romi
-                                goes to state 5, "Go Home".
+                            4:  Run Mission. Romi runs the steps of its mission with the mission
+                                engine (RunMission). By default this is the term project track:
+                                line following at the start, then a programmed object avoidance
+                                when the wall is detected, then another line follow until the
+                                finish line is found. Then, Romi goes to state 5, "Go Home".
                             5:  Go Home. Romi determines a path Home using its current world position,
                                 turns in that direction, and travels half the distance back Home.
                                 Then it reevaluates the path Home, and repeats the half travel until
                                 Romi is within a small window of distance from Home.
+                            6:  Auto-tune. Romi relay-tunes the line follower on a straight, saves
+                                the gains, and goes to Chill. Entered instead of state 4 when a
+                                tuning rule is given.
                             
             @details    Like all of Romi's cooperative multitasking tasks, MainTask is written
                         as a generator function with an infinite loop. Each pass through the
@@ -367,15 +740,19 @@ class RomiMM():
         ''' 
         # Romi has some more complex init state work than other labs have had
         while self.state == 0:
-            # Wait for BNO to finish calibrating        
-            if self.BNO_cal_flag.full() and self.BNO_eul_x.get() != 0:
+            # Wait for BNO & line sensors to finish calibrating and the motor map to be ready
+            if (self.BNO_cal_flag.full() and self.BNO_eul_x.get() != 0 and self.map_flag.full()
+                    and self.LS_ready_flag.full()):
                 self.BNO_cal_flag.clear()   # ack flag, lower
                 self.BNO_z_flag.put(1)      # ask BNO to zero phi
-                self.LCL.ChangeKp(0.4)        # set controller P gain
+                if self.map_top.get() > 0:
+                    self.SetKff(self.map_top.get())  # command scale from the motor map
+                if not self.LCL.tuned:
+                    self.LCL.ChangeKp(0.4)    # set controller P gain
                 # self.state = 1              # go to state 1
                 
-                # Go to Term Project
-                self.state = 4      # Start following line
+                # Go to Term Project, or tune the line follower
+                self.state = 6 if self.tune else 4
             
             yield self.state        # exit task
         
@@ -401,24 +778,22 @@ class RomiMM():
                 
                     
                 # Go straight 200 mm (~8").
-                self.curr_man = self.LineMove(0.200, 30)    # Create line maneuver
+                self.curr_man = self.LineMove(0.200, self.Kff*self.v_move)  # Create line maneuver
                 self.man_flag = 1                           # raise maneuver flag. we got one!
                 
                 # Keep maneuvering until we've gone out beyond the obstacle.
                 while self.man_flag:
                     next(self.curr_man)
-                    print(f' X = {self.X}; Y = {self.Y}; phi = {self.phi}')
                     yield self.state
                     
                         
                 # Go straight 200 mm (~8").
-                self.curr_man = self.LineMove(0.200, 30)    # Create line maneuver
+                self.curr_man = self.LineMove(0.200, self.Kff*self.v_move)  # Create line maneuver
                 self.man_flag = 1                           # raise maneuver flag. we got one!
                 
                 # Keep maneuvering until we've gone out beyond the obstacle.
                 while self.man_flag:
                     next(self.curr_man)
-                    print(f' X = {self.X}; Y = {self.Y}; phi = {self.phi}')
                     yield self.state
                     
                 self.state = 1      # Go back to Chill
@@ -431,7 +806,6 @@ class RomiMM():
                 
                 if self.man_flag:
                     next(self.curr_man)
-                    print(f' X = {self.X}; Y = {self.Y}; phi = {self.phi}')
                     yield self.state
                     
                     # check for circle startpoint
@@ -447,169 +821,12 @@ class RomiMM():
                     
                     yield self.state    # done
                     
-            # State 4: Do Term Project
+            # State 4: Run Mission
             elif self.state == 4:
-                # Set control gain!!
-                self.LCL.ChangeKp(0.45)        # set controller P gain
-            
-                # Go straight 100 mm to clear the start square.
-                self.curr_man = self.LineMove(0.100, 30)    # Create line maneuver
-                self.man_flag = 1                           # raise maneuver flag. we got one!
+                self.curr_mission = self.RunMission(self.plan)
                 
-                # Keep maneuvering until we've reached the line again.
-                while self.man_flag:
-                    next(self.curr_man)
-                    print(f' X = {self.X}; Y = {self.Y}; phi = {self.phi}')
-                    yield self.state
-                
-                
-                # First, line follow until obstacle detected.
-                self.curr_man = self.LineFollow(self.sens_val_share, 35) # Create line follower gen
-                self.man_flag = 1                           # raise maneuver flag. we got one!
-
-                # Until the wall gets within 30mm of Romi's face...
-                while self.LidarDist.get() > 70:
-                    # ...continue line following
-                    next(self.curr_man)
-                    print(f' X = {self.X}; Y = {self.Y}; phi = {self.phi}')
-                    yield self.state
-                
-                
-                # Next, handle obstacle avoidance.
-                # Turn left 90 degrees.
-                self.curr_man = self.Face(self.nin)         # Create turn maneuver
-                self.man_flag = 1                           # raise maneuver flag. we got one!
-                
-                # Keep maneuvering until we've turned.
-                while self.man_flag:
-                    next(self.curr_man)
-                    print(f' X = {self.X}; Y = {self.Y}; phi = {self.phi}')
-                    yield self.state
-                    
-                    
-                # Go straight 250 mm (~8").
-                self.curr_man = self.LineMove(0.250, 30)    # Create line maneuver
-                self.man_flag = 1                           # raise maneuver flag. we got one!
-                
-                # Keep maneuvering until we've gone out beyond the obstacle.
-                while self.man_flag:
-                    next(self.curr_man)
-                    print(f' X = {self.X}; Y = {self.Y}; phi = {self.phi}')
-                    yield self.state
-                
-                
-                # Turn back to the right 90 degrees.
-                self.curr_man = self.Face(0.08)                # Create turn maneuver
-                self.man_flag = 1                           # raise maneuver flag. we got one!
-                
-                # Keep maneuvering until we've turned.
-                while self.man_flag:
-                    next(self.curr_man)
-                    print(f' X = {self.X}; Y = {self.Y}; phi = {self.phi}')
-                    yield self.state
-                    
-                    
-                # Go straight 450 mm (~16+").
-                self.curr_man = self.LineMove(0.450, 30)    # Create line maneuver
-                self.man_flag = 1                           # raise maneuver flag. we got one!
-                
-                # Keep maneuvering until we've passed the obstacle.
-                while self.man_flag:
-                    next(self.curr_man)
-                    print(f' X = {self.X}; Y = {self.Y}; phi = {self.phi}')
-                    yield self.state
-                
-                
-                # Turn back to the right 90 degrees.
-                self.curr_man = self.Face(6.28-self.nin)    # Create turn maneuver
-                self.man_flag = 1                           # raise maneuver flag. we got one!
-                
-                # Keep maneuvering until we've turned.
-                while self.man_flag:
-                    next(self.curr_man)
-                    print(f' X = {self.X}; Y = {self.Y}; phi = {self.phi}')
-                    yield self.state
-                    
-                    
-                # Go straight 100 mm to clear the wrong part of the track, just in case of drift.
-                self.curr_man = self.LineMove(0.100, 30)    # Create line maneuver
-                self.man_flag = 1                           # raise maneuver flag. we got one!
-                
-                # Keep maneuvering until we've passed the obstacle.
-                while self.man_flag:
-                    next(self.curr_man)
-                    print(f' X = {self.X}; Y = {self.Y}; phi = {self.phi}')
-                    yield self.state
-                    
-                    
-                # Go straight 300 mm (~8") until we get back to the line.
-                self.curr_man = self.LineMove(0.300, 30)    # Create line maneuver
-                self.man_flag = 1                           # raise maneuver flag. we got one!
-                
-                # Keep maneuvering until we've reached the line again.
-                # This requires man_flag and dist to be reset manually in the if
-                # block because it breaks the rules of LineMove
-                while self.man_flag:
-                    next(self.curr_man)
-                    print(f' X = {self.X}; Y = {self.Y}; phi = {self.phi}')
-                    # print(f'sumall: {self.sens_sum_share.get()}')
-                    
-                    # Watch for the line, and stop moving forward when we find it 
-                    if self.sens_sum_share.get() > 0.6:
-                        self.dist = 0.0     # reset distance var
-                        self.man_flag = 0
-                        
-                    yield self.state
-                    
-                    
-                # Scooch up 50mm to center Romi on the line.
-                self.curr_man = self.LineMove(0.050, 30)    # Create line maneuver
-                self.man_flag = 1                           # raise maneuver flag. we got one!
-                
-                # Keep maneuvering until we've reached the line again.
-                while self.man_flag:
-                    next(self.curr_man)
-                    print(f' X = {self.X}; Y = {self.Y}; phi = {self.phi}')
-                    yield self.state
-                
-                
-                # Turn back to the left 90 degrees.
-                self.curr_man = self.Face(0)           # Create turn maneuver
-                self.man_flag = 1                           # raise maneuver flag. we got one!
-                
-                # Keep maneuvering until we've turned.
-                while self.man_flag:
-                    next(self.curr_man)
-                    print(f' X = {self.X}; Y = {self.Y}; phi = {self.phi}')
-                    yield self.state
-                    
-                    
-                # Set control gain!!
-                self.LCL.ChangeKp(0.4)        # set controller P gain
-                
-                # Next, resume line following until reaching the finish.
-                self.curr_man = self.LineFollow(self.sens_val_share, 30) # Create line follower gen
-                self.man_flag = 1                           # raise maneuver flag. we got one!
-                self.finish_flag.clear()    # clear finish line flag just in case
-
-                # Until the finish line is detected...
-                while not self.finish_flag.full():
-                    # ...continue line following
-                    next(self.curr_man)
-                    # print(f' X = {self.X}; Y = {self.Y}; phi = {self.phi}')
-                    yield self.state
-                    
-                self.finish_flag.clear()    # clear finish line flag
-                
-                
-                # Go straight 200 mm to center up in the finish square.
-                self.curr_man = self.LineMove(0.200, 25)    # Create line maneuver
-                self.man_flag = 1                           # raise maneuver flag. we got one!
-                
-                # Keep maneuvering until we've reached the line again.
-                while self.man_flag:
-                    next(self.curr_man)
-                    print(f' X = {self.X}; Y = {self.Y}; phi = {self.phi}')
+                # Run the steps until the mission is done
+                while not next(self.curr_mission):
                     yield self.state
                 
                 
@@ -634,17 +851,15 @@ class RomiMM():
                     # Keep maneuvering until we've turned.
                     while self.man_flag:
                         next(self.curr_man)
-                        print(f' X = {self.X}; Y = {self.Y}; phi = {self.phi}')
                         yield self.state
                         
                     # Go straight towards Home
-                    self.curr_man = self.LineMove(self.HomeDist/2, 30)  # Create line maneuver
+                    self.curr_man = self.LineMove(self.HomeDist/2, self.Kff*self.v_move)    # Create line maneuver
                     self.man_flag = 1                                   # raise maneuver flag. we got one!
                     
                     # Keep maneuvering until we've reached the line again.
                     while self.man_flag:
                         next(self.curr_man)
-                        print(f' X = {self.X}; Y = {self.Y}; phi = {self.phi}')
                         
                         self.HomeDist = math.sqrt(self.X**2 + self.Y**2)   
                         # Watch for Home, and stop moving forward if we find it 
@@ -665,6 +880,19 @@ class RomiMM():
                 self.state = 1      # Go to "Chill"
                 yield self.state    # done
                 
+            # State 6: Auto-tune line follower
+            elif self.state == 6:
+                self.curr_man = self.RelayTune(self.sens_val_share, self.Kff*self.v_tune, self.tune)
+                self.man_flag = 1                           # raise maneuver flag. we got one!
+                
+                # Keep tuning until the relay test is done.
+                while self.man_flag:
+                    next(self.curr_man)
+                    yield self.state
+                    
+                self.state = 1      # Go to "Chill"
+                yield self.state    # done
+                
                 
                 
                 
@@ -27,9 +27,20 @@ class RomiMot():
             @details    Motor PWM timer is initialized and pin references are stored. It also
                         initalizes the motor direction to be enabled forward, and zero effort.
                         
-                            ShareTuple contains two Shares. Each one is used to pass in commands.
+                            ShareTuple contains three Shares. Each one is used to pass in commands.
                             ShareTuple[0] = enable      [bool]  (bool)
                             ShareTuple[1] = duty        [%]     (float)
+                            ShareTuple[2] = duty scale  [--]    (float)
+                            
+            @details    Until a motor map is set the duty Share is a raw duty cycle. Once
+                        MotorMap calls SetMap(), it is a linearized command in % of Romi's top
+                        wheel speed instead (see SetMap), so callers that want a given duty
+                        must command the speed that produces it.
+                        
+            @details    The duty scale Share is written by BattMon. It is the ratio of the
+                        nominal battery voltage to the measured battery voltage, so scaling
+                        every duty command by it keeps the motor voltage the same as the
+                        batteries discharge.
                         
             @param      PWM_tim         Timer object to use for motor duty cycle PWM.
             @param      EFF_pin         A Pin object corresponding to the effort pin on the
@@ -43,6 +54,7 @@ class RomiMot():
         self.EN_share.put(0)                    # Initialize enable bool
         self.duty_share = ShareTuple[1]         # motor duty cycle Share
         self.duty_share.put(0)                  # Initialize duty cycle
+        self.scale_share = ShareTuple[2]        # battery compensation duty scale Share
         
         # Create PWM object for effort control, startup 0
         self.EFF = PWM_tim.channel(1, pin=EFF_pin, mode=Timer.PWM, pulse_width_percent=0)
@@ -53,6 +65,70 @@ class RomiMot():
         
         # Internal enable bool, startup on
         self.EN = True
+        
+        # Inverse motor model (see MotorMap), startup off
+        self.inv = None         # inverse table, duty vs. command
+        self.inv_k = 0.0        # table steps per % command
+        self.inv_n = 0          # last table index
+        self.u_db = 0.0         # [%] command deadband
+        self.u_ramp = 0.0       # [%] command where the ramp from zero meets the table
+        self.d_ramp = 0.0       # [%] duty at u_ramp
+
+
+
+    def SetMap(self, inv, u_db = 0.5, u_ramp = 5.0):
+        '''!@brief      Turn on motor linearization using an inverse model table.
+            @details    Once a map is set, duty commands are treated as linearized commands,
+                        a percentage of Romi's common top wheel speed, and converted to the
+                        duty cycle that produces that speed (including the breakaway duty
+                        needed to overcome static friction). This changes the units of the
+                        duty Share for every caller: a command of 30 means 30% of top speed,
+                        not 30% duty. Pass None to turn it off.
+            @details    Jumping straight to the breakaway duty for any command above zero
+                        would turn the tiny corrections of a heading hold into a chatter
+                        between about +/-12% duty. So commands inside the deadband u_db give
+                        zero duty, and up to u_ramp the duty ramps linearly from zero to the
+                        table's duty at u_ramp, reaching breakaway partway up.
+            @param      inv     Evenly spaced inverse table from MotorMap, array('f') of
+                                duty cycles for commands 0~100%, or None.
+            @param      u_db    Command deadband [%]. Default 0.5
+            @param      u_ramp  Command below which the duty ramps up from zero [%].
+                                Default 5
+        '''
+        self.inv = inv
+        if inv is not None:
+            self.inv_n = len(inv) - 1
+            self.inv_k = self.inv_n/100
+            self.u_db = u_db
+            self.u_ramp = u_ramp
+            self.d_ramp = self.Linearize(u_ramp) if u_ramp > 0 else 0.0
+        
+        
+        
+    def Linearize(self, u):
+        '''!@brief      Convert a linearized command into a duty cycle.
+            @details    Looks up the duty cycle for command u in the inverse table using one
+                        linear interpolation. The sign of u sets the direction, so the table
+                        is used for both directions. Commands inside the deadband give zero,
+                        and commands below u_ramp ramp linearly up from zero (see SetMap).
+            @param      u       Signed linearized command, % of top speed.
+            @return     Signed duty cycle in [%].
+        '''
+        if self.inv is None:
+            return u
+        a = abs(u)
+        if a <= self.u_db:
+            return 0.0
+        if a < self.u_ramp:
+            d = self.d_ramp*a/self.u_ramp           # small commands ramp up from zero
+            return d if u > 0 else -d
+        x = a*self.inv_k
+        i = int(x)
+        if i >= self.inv_n:
+            d = self.inv[self.inv_n]*x/self.inv_n   # past the table, extrapolate
+        else:
+            d = self.inv[i] + (x - i)*(self.inv[i + 1] - self.inv[i])
+        return d if u > 0 else -d
 
 
 
@@ -71,13 +147,13 @@ class RomiMot():
             # forward motion
             if duty > 0:
                 if duty > 100:
-                    self.duty = 100
+                    duty = 100
                 self.EFF.pulse_width_percent(duty)
                 self.DIR.low()
             # reverse motion
             else:
                 if duty < -100:
-                    self.duty = -100
+                    duty = -100
                 self.EFF.pulse_width_percent(-1*duty)
                 self.DIR.high()
         # If motor disabled, set zero
@@ -91,7 +167,8 @@ class RomiMot():
             @details    The RomiMot main task has states:
                 
                             1:  Normal operation state. Continuously retrieve motor commands from
-                                Shares and set motor signals accordingly.
+                                Shares, linearize them if a motor map is set, compensate them for
+                                battery voltage, and set motor signals accordingly.
                             
             @details    Like all of Romi's cooperative multitasking tasks, MainTask is written
                         as a generator function with an infinite loop. Each pass through the
@@ -103,7 +180,7 @@ class RomiMot():
             # Check enabled from Share
             self.EN = self.EN_share.get()
             
-            # Control motor. aka set duty
-            self.set_duty(self.duty_share.get())
+            # Control motor. aka set duty, linearized and scaled to the nominal battery voltage
+            self.set_duty(self.Linearize(self.duty_share.get())*self.scale_share.get())
             
             yield 1                     # end of task
\ No newline at end of file
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+'''!@file       SpeedGov.py
+    @brief      Romi line following speed governor
+    @details    SpeedGov.py contains the class that sets Romi's base speed while line
+                following, from how well the line is being tracked, how sharply it curves, and
+                whether it was recently lost.
+    @author     Joseph Penrose & Paolo Navarro
+    @date       October 18, 2026
+'''
+import math
+
+class SpeedGov():
+    '''!@brief      Adaptive base speed governor for Romi's line followers.
+        @details    A fixed base duty has to be slow enough for the sharpest curve on the
+                    course, so Romi crawls down every straight. SpeedGov picks the base duty
+                    every tick instead, as the lowest of three limits:
+
+                        Curvature:  The speed at which the curve ahead needs no more than a_lat
+                                    of lateral acceleration, v = sqrt(a_lat/kappa). The caller
+                                    passes the larger of the measured path curvature and the
+                                    curvature ahead seen by the sensor arrays, so Romi slows
+                                    before the curve instead of in it.
+                        Tracking:   The top speed, scaled down by the recent spread of the line
+                                    error, u_max/(1 + (std/e_ref)^2). Sensor noise barely
+                                    registers, but a follower that is weaving or struggling
+                                    gets slowed until it settles.
+                        Line lost:  After a gap or lost line event from LineFeat, the speed is
+                                    held at u_min for t_hold, so Romi does not charge off the
+                                    track while it finds the line again. With gap_hold off,
+                                    only a lost line counts, for when gaps are bridged.
+
+        @details    The result goes through acceleration limits, a_up speeding up and a_dn
+                    slowing down, so the wheels do not slip and the follower sees smooth speed
+                    changes. The error spread is an exponentially weighted variance with
+                    weight alpha per tick. Speeds are turned into duty with the same speed
+                    feed-forward gain MasterMind uses, which MasterMind hands over with SetKff()
+                    once the motor map gives Romi's top speed.
+    '''
+
+    def __init__(self, Feat_shares = None, u_min = 25.0, u_max = 60.0, a_lat = 0.5, a_up = 0.4,
+                 a_dn = 1.5, e_ref = 4.0, t_hold = 0.5, alpha = 0.05, Ts = 0.010, gap_hold = True):
+        '''!@brief      Initializes and returns a SpeedGov object.
+            @param      Feat_shares LineFeat Shares tuple (event code, confidence, new event
+                                    flag). The governor consumes the new event flag. Default
+                                    none, no line lost limit
+            @param      u_min       Lowest base duty [%]. Default 25
+            @param      u_max       Highest base duty [%]. Default 60
+            @param      a_lat       Lateral acceleration limit in curves [m/s^2]. Default 0.5
+            @param      a_up        Speeding up acceleration limit [m/s^2]. Default 0.4
+            @param      a_dn        Slowing down acceleration limit [m/s^2]. Default 1.5
+            @param      e_ref       Line error spread that halves the top speed [mm]. Default 4
+            @param      t_hold      Time held at u_min after the line is lost [s]. Default 0.5
+            @param      alpha       Error statistics weight per tick, 0~1. Default 0.05
+            @param      Ts          Calling period [s]. Default 0.010
+            @param      gap_hold    True to hold at u_min after a gap as well as a lost line.
+                                    Turn off when gaps are bridged by LineTrack. Default True
+        '''
+        if u_min <= 0 or u_max < u_min:
+            raise Exception("Speed limits must be positive with u_max >= u_min")
+        # Shares
+        if Feat_shares is not None:
+            self.event_share = Feat_shares[0]   # track feature event code Share
+            self.event_flag = Feat_shares[2]    # new track feature trash flag Queue
+        else:
+            self.event_flag = None
+
+        # Parameters
+        self.u_min = u_min
+        self.u_max = u_max
+        self.a_lat = a_lat
+        self.a_up = a_up
+        self.a_dn = a_dn
+        self.Ts = Ts
+        self.SetKff(0.0)                    # until MasterMind sets it
+        self.e_ref = e_ref
+        self.n_hold = int(t_hold/Ts)        # [ticks]   line lost hold
+        self.alpha = alpha
+        self.gap_hold = gap_hold
+
+        # State
+        self.u = u_min          # [%]   governed base duty
+        self.e_m = 0.0          # [mm]  error mean
+        self.e_v = 0.0          # [mm^2] error variance
+        self.hold = 0           # ticks left at u_min
+        self.limit = 0          # which limit is active: 0 top, 1 curve, 2 tracking, 3 lost
+
+
+
+    def SetKff(self, Kff):
+        '''!@brief      Set the speed to duty feed-forward, and the limits that depend on it.
+            @param      Kff     Speed to duty feed-forward [%/(m/s)].
+        '''
+        self.Kff = Kff
+        self.du_up = self.a_up*Kff*self.Ts  # [%/tick]  speeding up limit
+        self.du_dn = self.a_dn*Kff*self.Ts  # [%/tick]  slowing down limit
+
+
+
+    def reset(self, u0):
+        '''!@brief      Restart the governor for a new line following run.
+            @param      u0      Starting base duty [%].
+        '''
+        self.u = min(max(u0, self.u_min), self.u_max)
+        self.e_m = 0.0
+        self.e_v = 0.0
+        self.hold = 0
+        if self.event_flag is not None:
+            self.event_flag.clear()     # old events are stale
+
+
+
+    def update(self, err, kappa):
+        '''!@brief      Work out the base duty for this tick.
+            @param      err     Line error [mm].
+            @param      kappa   Path curvature, measured or ahead [1/m], either sign.
+            @return     Base duty [%].
+        '''
+        # Line lost or gap events
+        if self.event_flag is not None and self.event_flag.full():
+            self.event_flag.clear()
+            ev = self.event_share.get()
+            if ev == 3 or (ev == 2 and self.gap_hold):  # LineFeat.LOST, LineFeat.GAP
+                self.hold = self.n_hold
+
+        # Error statistics
+        d = err - self.e_m
+        self.e_m += self.alpha*d
+        self.e_v += self.alpha*(d*d - self.e_v)
+
+        # Lowest of the limits
+        u_tgt = self.u_max
+        self.limit = 0
+        if kappa < 0:
+            kappa = -kappa
+        if kappa > 0:
+            u_c = self.Kff*math.sqrt(self.a_lat/kappa)
+            if u_c < u_tgt:
+                u_tgt = u_c
+                self.limit = 1
+        u_e = self.u_max/(1 + self.e_v/(self.e_ref*self.e_ref))
+        if u_e < u_tgt:
+            u_tgt = u_e
+            self.limit = 2
+        if self.hold > 0:
+            self.hold -= 1
+            u_tgt = self.u_min
+            self.limit = 3
+        if u_tgt < self.u_min:
+            u_tgt = self.u_min
+
+        # Acceleration limits
+        if u_tgt > self.u + self.du_up:
+            u_tgt = self.u + self.du_up
+        elif u_tgt < self.u - self.du_dn:
+            u_tgt = self.u - self.du_dn
+        self.u = u_tgt
+        return u_tgt
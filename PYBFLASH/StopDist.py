@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+'''!@file       StopDist.py
+    @brief      Romi speed-dependent obstacle stopping distance
+    @details    StopDist.py contains the class that computes how far ahead Romi has to react to
+                an obstacle at its current speed, from a braking model measured on the robot.
+    @author     Joseph Penrose & Paolo Navarro
+    @date       October 18, 2026
+'''
+from array import array
+import struct
+import utime
+
+class StopDist():
+    '''!@brief      Romi obstacle trigger distance calculator and braking test.
+        @details    A fixed LIDAR trigger distance only stops Romi in time at the speed it was
+                    tuned for. StopDist computes the trigger distance from Romi's speed v every
+                    tick instead:
+
+                        d_trig = d_stop + v*(t_sens + t_act) + v^2/(2*a_brk)
+
+                    where d_stop is the standoff Romi should end up at, t_sens is the sensing
+                    delay (LIDAR filtering and task periods), t_act is the time between cutting
+                    the motors and the wheels starting to slow, and a_brk is Romi's braking
+                    deceleration. At low speed the trigger is close to d_stop, so Romi can run
+                    the approach much faster and still stop at the same place.
+
+        @details    t_act and a_brk are measured by a braking test, run as a cotask task in
+                    place of MasterMind when BRAKE_TEST is set in main.py. With Romi on the
+                    floor and a clear stretch of about 0.5 m ahead:
+
+                        1.  Wait for the motors to be enabled (blue button) and the motor
+                            map to be applied.
+                        2.  Drive straight at u_test for t_run and record the speed v0.
+                        3.  Cut both motors and log speed until Romi stops.
+                        4.  t_act is the time for the speed to drop 5% from v0, and a_brk the
+                            deceleration that explains the distance covered after that.
+
+                    The result and the whole log are saved to 'brake.bin': a header packed as
+                    '<2sffH' (b'BK', a_brk [m/s^2], t_act [s], sample count), then the time
+                    stamps since the cut (uint32, [us]) and speeds (float32, [m/s]). On startup
+                    StopDist loads the result if the file exists, and uses defaults if not.
+    '''
+
+    def __init__(self, enc_L_shares, enc_R_shares, mot_L_shares, mot_R_shares, map_flag, r,
+                 t_sens = 0.05, d_stop = 40.0, fname = 'brake.bin'):
+        '''!@brief      Initializes and returns a StopDist object.
+            @param      enc_L_shares    Left encoder Shares tuple.
+            @param      enc_R_shares    Right encoder Shares tuple.
+            @param      mot_L_shares    Left motor Shares tuple.
+            @param      mot_R_shares    Right motor Shares tuple.
+            @param      map_flag        Motor map ready trash flag Queue.
+            @param      r               Wheel radius [m].
+            @param      t_sens          Sensing delay [s]. Default 0.05
+            @param      d_stop          Standoff distance from the obstacle [mm]. Default 40
+            @param      fname           Braking test file name on flash. Default 'brake.bin'
+        '''
+        # Shares
+        self.spd_L = enc_L_shares[2]        # [rad/s] left encoder speed Share
+        self.spd_R = enc_R_shares[2]        # [rad/s] right encoder speed Share
+        self.EN_L = mot_L_shares[0]         # left motor enable Share
+        self.EN_R = mot_R_shares[0]         # right motor enable Share
+        self.duty_L = mot_L_shares[1]       # left motor duty Share
+        self.duty_R = mot_R_shares[1]       # right motor duty Share
+        self.map_flag = map_flag            # motor map ready trash flag Queue
+        self.r = r
+        self.fname = fname
+
+        # Braking model, defaults until measured
+        self.t_sens = t_sens    # [s]       sensing delay
+        self.d_stop = d_stop    # [mm]      standoff distance
+        self.a_brk = 1.0        # [m/s^2]   braking deceleration
+        self.t_act = 0.02       # [s]       motor cut to deceleration delay
+        self.load()
+
+        # Braking test
+        self.u_test = 50.0      # [%]   test duty
+        self.t_run = 1.5        # [s]   run-up time
+        self.t_brk = 1.0        # [s]   longest braking log
+        self.v_still = 0.01     # [m/s] speed that counts as stopped
+        self.N = int(self.t_brk*100) + 10
+        self.t_buf = array('I', [0]*self.N)
+        self.v_buf = array('f', [0.0]*self.N)
+        self.n = 0
+        self.state = 1
+
+
+
+    def load(self):
+        '''!@brief      Read the braking model from flash.
+            @return     True if a valid braking test was read, else False.
+        '''
+        try:
+            with open(self.fname, 'rb') as file:
+                data = file.read(12)
+        except OSError:
+            print(f'StopDist: no {self.fname}, using default braking model')
+            return False
+        if len(data) < 12 or data[0:2] != b'BK':
+            print(f'StopDist: {self.fname} is not a braking test, ignoring it')
+            return False
+        magic, a_brk, t_act, n = struct.unpack('<2sffH', data)
+        if a_brk <= 0 or t_act < 0:
+            print(f'StopDist: {self.fname} has a bad braking model, ignoring it')
+            return False
+        self.a_brk = a_brk
+        self.t_act = t_act
+        return True
+
+
+
+    def save(self):
+        '''!@brief      Write the braking model and log to flash.
+        '''
+        with open(self.fname, 'wb') as file:
+            file.write(struct.pack('<2sffH', b'BK', self.a_brk, self.t_act, self.n))
+            file.write(memoryview(self.t_buf)[:self.n])
+            file.write(memoryview(self.v_buf)[:self.n])
+        print(f'StopDist: a_brk = {self.a_brk:.2f} m/s^2, t_act = {self.t_act*1000:.0f} ms, saved as "{self.fname}"')
+
+
+
+    def speed(self):
+        '''!@brief      Romi's forward speed from the encoders.
+            @return     Speed [m/s].
+        '''
+        return 0.5*self.r*(self.spd_L.get() + self.spd_R.get())
+
+
+
+    def trigger(self, v):
+        '''!@brief      Obstacle trigger distance at speed v.
+            @param      v       Romi's forward speed [m/s].
+            @return     Distance [mm] at which Romi has to start stopping.
+        '''
+        if v < 0:
+            v = 0
+        return self.d_stop + 1000*(v*(self.t_sens + self.t_act) + v*v/(2*self.a_brk))
+
+
+
+    def fit(self):
+        '''!@brief      Fit the braking model to the logged stop.
+            @return     True if the log gave a usable model, else False.
+        '''
+        if self.n < 3 or self.v0 <= self.v_still:
+            return False
+        # Delay: first sample 5% below the run-up speed
+        i_act = 0
+        while i_act < self.n - 1 and self.v_buf[i_act] > 0.95*self.v0:
+            i_act += 1
+        t_act = self.t_buf[i_act]/10**6
+        # Distance covered once slowing, by trapezoids
+        d = 0.0
+        for i in range(i_act + 1, self.n):
+            dt = (self.t_buf[i] - self.t_buf[i - 1])/10**6
+            d += 0.5*(self.v_buf[i] + self.v_buf[i - 1])*dt
+        v_act = self.v_buf[i_act]
+        if d <= 0:
+            return False
+        self.t_act = t_act
+        self.a_brk = v_act*v_act/(2*d)
+        return True
+
+
+
+    def MainTask(self):
+        '''!@brief      Main cotask task for the StopDist braking test.
+            @details    The braking test main task has states:
+
+                            1:  Wait state. Wait for the motors to be enabled (blue button)
+                                and the motor map to be applied, so MotorMap is done with the
+                                duty Shares, then start the clock and go to state 2.
+                            2:  Run-up state. Drive straight at the test duty for t_run, then
+                                record the speed, cut the motors, and go to state 3.
+                            3:  Braking state. Log the speed until Romi stops or the log is
+                                full, then go to state 4.
+                            4:  Fit state. Fit and save the braking model, and go to state 5.
+                            5:  Done state. Hold the motors stopped.
+
+            @details    Like all of Romi's cooperative multitasking tasks, MainTask is written
+                        as a generator function with an infinite loop. Each pass through the
+                        program runs through the MainTask while loop once, until it reaches a
+                        yield.
+        '''
+        while True:
+            # State 1: Wait for motors
+            if self.state == 1:
+                if self.EN_L.get() and self.EN_R.get() and self.map_flag.full():
+                    print('StopDist: braking test started')
+                    self.t0 = utime.ticks_ms()
+                    self.state = 2
+                yield self.state
+
+            # State 2: Run-up
+            elif self.state == 2:
+                self.duty_L.put(self.u_test)
+                self.duty_R.put(self.u_test)
+                if utime.ticks_diff(utime.ticks_ms(), self.t0) >= self.t_run*1000:
+                    self.v0 = self.speed()
+                    self.duty_L.put(0)
+                    self.duty_R.put(0)
+                    self.t0 = utime.ticks_us()
+                    self.n = 0
+                    self.state = 3
+                yield self.state
+
+            # State 3: Braking
+            elif self.state == 3:
+                v = self.speed()
+                self.t_buf[self.n] = utime.ticks_diff(utime.ticks_us(), self.t0)
+                self.v_buf[self.n] = v
+                self.n += 1
+                if (v < self.v_still and self.n > 1) or self.n >= self.N:
+                    self.state = 4
+                yield self.state
+
+            # State 4: Fit & save
+            elif self.state == 4:
+                if self.fit():
+                    self.save()
+                else:
+                    print('StopDist: braking test did not give a usable model, not saved')
+                self.state = 5
+                yield self.state
+
+            # State 5: Done
+            elif self.state == 5:
+                self.duty_L.put(0)
+                self.duty_R.put(0)
+                yield self.state
+
+            # RED ALERT, RED ALERT, INVALID STATE VARIABLE!!!
+            else:
+                raise ValueError("Invalid state variable in task StopDist")
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+'''!@file       SysID.py
+    @brief      Romi drive system identification capture
+    @details    SysID.py contains the class that excites Romi's drive motors with step and
+                chirp duty sequences and records the encoder response for model fitting on
+                the host (see tools/sysid_fit.py).
+    @author     Joseph Penrose & Paolo Navarro
+    @date       October 18, 2026
+'''
+from array import array
+import struct
+import math
+import utime
+
+class SysID():
+    '''!@brief      Romi drive system identification capture object.
+        @details    SysID runs as a cotask task in place of MasterMind when Romi is put in
+                    identification mode (SYSID in main.py). It drives both motors through
+                    RomiMot's duty Shares with a scripted excitation, and logs the time stamp,
+                    the commanded duty, and both encoder speeds every pass. Commands go through
+                    the motor map and battery compensation like any other, so the model is of
+                    the drive as Romi's controllers see it. Like all of Romi's firmware, it
+                    initializes with a set of Shares designed to pass important data in and out
+                    to the rest of Romi's program.
+
+        @details    The excitation is, in order:
+
+                        1.  Rest at zero duty for t_rest.
+                        2.  A step to u_step for t_step, then back to zero for t_rest.
+                        3.  A linear chirp from f0 to f1 over t_chirp, amplitude u_amp about
+                            offset u_off, so the motors never sit in the deadband.
+
+        @details    All buffers are preallocated arrays sized for the full sequence, so
+                    nothing is allocated while logging. When the sequence ends, both motors are
+                    stopped and the log is written to flash as 'sysid.bin': a header packed as
+                    '<2sHH' (b'SI', sample count, nominal period in ms) followed by the raw
+                    buffers t (uint32, [us]), u (float32, [%]), w_L and w_R (float32, [rad/s]).
+    '''
+
+    def __init__(self, enc_L_shares, enc_R_shares, mot_L_shares, mot_R_shares, map_flag,
+                 period = 10, fname = 'sysid.bin'):
+        '''!@brief      Initializes and returns a SysID object.
+            @details    Unpacks Shares, sets the default excitation, and preallocates the log.
+            @param      enc_L_shares    Left encoder Shares tuple.
+            @param      enc_R_shares    Right encoder Shares tuple.
+            @param      mot_L_shares    Left motor Shares tuple.
+            @param      mot_R_shares    Right motor Shares tuple.
+            @param      map_flag        Motor map ready trash flag Queue.
+            @param      period          Task period [ms], the nominal sample period. Default 10
+            @param      fname           Log file name on flash. Default 'sysid.bin'
+        '''
+        # Shares
+        self.spd_L = enc_L_shares[2]        # [rad/s] left encoder speed Share
+        self.spd_R = enc_R_shares[2]        # [rad/s] right encoder speed Share
+        self.EN_L = mot_L_shares[0]         # left motor enable Share
+        self.EN_R = mot_R_shares[0]         # right motor enable Share
+        self.duty_L = mot_L_shares[1]       # left motor duty Share
+        self.duty_R = mot_R_shares[1]       # right motor duty Share
+        self.map_flag = map_flag            # motor map ready trash flag Queue
+        self.period = period
+        self.fname = fname
+
+        # Excitation
+        self.t_rest = 0.5       # [s]   rest time around the step
+        self.t_step = 2.0       # [s]   step hold time
+        self.u_step = 40.0      # [%]   step size
+        self.t_chirp = 6.0      # [s]   chirp length
+        self.f0 = 0.2           # [Hz]  chirp start frequency
+        self.f1 = 8.0           # [Hz]  chirp end frequency
+        self.u_off = 40.0       # [%]   chirp offset
+        self.u_amp = 20.0       # [%]   chirp amplitude
+        self.T = 2*self.t_rest + self.t_step + self.t_chirp     # [s] total time
+
+        # Preallocated log, with a little headroom for scheduler jitter
+        self.N = int(self.T*1000/period) + 50
+        self.t_buf = array('I', [0]*self.N)
+        self.u_buf = array('f', [0.0]*self.N)
+        self.wL_buf = array('f', [0.0]*self.N)
+        self.wR_buf = array('f', [0.0]*self.N)
+        self.n = 0
+
+        self.state = 1
+
+
+
+    def excite(self, t):
+        '''!@brief      Excitation duty cycle at time t into the sequence.
+            @param      t       Time since the start of the sequence [s].
+            @return     Duty cycle [%].
+        '''
+        if t < self.t_rest:
+            return 0.0
+        t -= self.t_rest
+        if t < self.t_step:
+            return self.u_step
+        t -= self.t_step
+        if t < self.t_rest:
+            return 0.0
+        t -= self.t_rest
+        # Linear chirp, phase is the integral of frequency
+        ph = 2*math.pi*(self.f0*t + 0.5*(self.f1 - self.f0)*t*t/self.t_chirp)
+        return self.u_off + self.u_amp*math.sin(ph)
+
+
+
+    def save(self):
+        '''!@brief      Write the log to flash.
+        '''
+        with open(self.fname, 'wb') as file:
+            file.write(struct.pack('<2sHH', b'SI', self.n, self.period))
+            file.write(memoryview(self.t_buf)[:self.n])
+            file.write(memoryview(self.u_buf)[:self.n])
+            file.write(memoryview(self.wL_buf)[:self.n])
+            file.write(memoryview(self.wR_buf)[:self.n])
+        print(f'SysID: {self.n} samples saved as "{self.fname}"')
+
+
+
+    def MainTask(self):
+        '''!@brief      Main cotask task for SysID.
+            @details    The SysID main task has states:
+
+                            1:  Wait state. Wait for the motors to be enabled (blue button)
+                                and the motor map to be applied, so MotorMap is done with the
+                                duty Shares, then start the clock and go to state 2.
+                            2:  Capture state. Log the previous pass's response, then apply the
+                                next excitation duty. When the sequence is over or the log is
+                                full, stop the motors and go to state 3.
+                            3:  Save state. Write the log to flash and go to state 4.
+                            4:  Done state. Hold the motors stopped.
+
+            @details    Like all of Romi's cooperative multitasking tasks, MainTask is written
+                        as a generator function with an infinite loop. Each pass through the
+                        program runs through the MainTask while loop once, until it reaches a
+                        yield.
+        '''
+        while True:
+            # State 1: Wait for motors
+            if self.state == 1:
+                if self.n == 0 and self.EN_L.get() and self.EN_R.get() and self.map_flag.full():
+                    print('SysID: capture started')
+                    self.t0 = utime.ticks_us()
+                    self.state = 2
+                yield self.state
+
+            # State 2: Capture
+            elif self.state == 2:
+                t_us = utime.ticks_diff(utime.ticks_us(), self.t0)
+                t = t_us/(10**6)
+                if t >= self.T or self.n >= self.N:
+                    self.duty_L.put(0)
+                    self.duty_R.put(0)
+                    self.state = 3
+                else:
+                    u = self.excite(t)
+                    self.t_buf[self.n] = t_us
+                    self.u_buf[self.n] = u
+                    self.wL_buf[self.n] = self.spd_L.get()
+                    self.wR_buf[self.n] = self.spd_R.get()
+                    self.n += 1
+                    self.duty_L.put(u)
+                    self.duty_R.put(u)
+                yield self.state
+
+            # State 3: Save
+            elif self.state == 3:
+                self.save()
+                self.state = 4
+                yield self.state
+
+            # State 4: Done
+            elif self.state == 4:
+                self.duty_L.put(0)
+                self.duty_R.put(0)
+                yield self.state
+
+            # RED ALERT, RED ALERT, INVALID STATE VARIABLE!!!
+            else:
+                raise ValueError("Invalid state variable in task SysID")
@@ -0,0 +1,412 @@
+# -*- coding: utf-8 -*-
+'''!@file       Telemetry.py
+    @brief      Romi COBS-framed binary telemetry stream
+    @details    Telemetry.py contains the class that streams selected Shares and values over the
+                USB VCP as checked binary frames, and takes channel selection commands back from
+                the host. tools/telemetry.py is the host side.
+    @author     Joseph Penrose & Paolo Navarro
+    @date       October 18, 2026
+'''
+import struct
+from array import array
+try:
+    import micropython
+except ImportError:
+    micropython = None      # off the robot, the plain Python CRC & framing run instead
+try:
+    from utime import ticks_us
+except ImportError:
+    from time import perf_counter_ns
+    def ticks_us():         # off the robot, wrapping like the pyboard's
+        return (perf_counter_ns()//1000) & 0x3FFFFFFF
+
+class Telemetry():
+    '''!@brief      Binary telemetry stream with host-selectable channels.
+        @details    Printed text is slow to build on Romi, slow to send, and ambiguous to parse
+                    back, and one lost character can shift every number after it. Telemetry
+                    sends binary frames instead. Every registered channel is a Share sampled
+                    by the Telemetry task, or a value its owner hands over with log(), so a
+                    Telemetry object can stand in for a Logger. Each channel has a decimation:
+                    it is sent every decim-th run of the task, or not at all when it is 0, and
+                    the host can change any channel's decimation while Romi runs. With all
+                    channels off, a run costs a few comparisons.
+
+        @details    A frame is a payload with its CRC-16/CCITT (poly 0x1021, init 0xFFFF)
+                    appended little-endian, COBS encoded so that it has no zero bytes, and
+                    ended with a zero. A receiver can join the stream anywhere: it waits for a
+                    zero, and every frame after that decodes on its own. A corrupted frame,
+                    including one run into by a stray print() on the same VCP, fails its CRC
+                    and costs only itself. Payloads start with a type byte:
+
+                        'D' data    '<BHHII' type, schema ID, sequence number, time stamp
+                                    [us] (ticks_us, wraps at 2^30), channel mask; then a
+                                    float32 for every channel in the mask, lowest bit first
+                        'S' schema  '<BHB' type, schema ID, channel count; then each
+                                    channel's decimation '<H', then the channel names
+                                    separated by commas
+
+                    The schema ID is the CRC of the channel names, so the host can tell that
+                    the data frames it is getting match the names it has. Gaps in the sequence
+                    number count frames lost anywhere on the way.
+
+        @details    The host sends frames the same way. Their payloads are:
+
+                        '?'         send the schema
+                        'R'         '<BBH' type, channel, decimation: set a channel's rate
+                        'X'         release the VCP's interrupt character (see below)
+
+                    Romi answers '?' and 'R' with a schema frame, which carries the new rates.
+                    Binary commands can hold a 0x03, which would stop the program like a
+                    Ctrl-C at the REPL. So once the first good command frame arrives (a '?',
+                    whose frame holds no 0x03), Telemetry turns the VCP's interrupt character
+                    off, and turns it back on at an 'X' or close(). Until a host has
+                    started talking, and after it says goodbye, Ctrl-C, mpremote, and
+                    pyboard.py can break into the program as usual.
+
+        @details    Frames are built into a preallocated transmit buffer and sent with a zero
+                    timeout, so Romi never waits on the host. Nothing is built while no host is
+                    connected, and a frame that does not fit the buffer is dropped and counted
+                    in self.dropped. The frame rate is the Telemetry task rate, so a 1 ms task
+                    period gives kilohertz telemetry as long as the selected channels fit the
+                    USB bandwidth.
+    '''
+
+    ## Frame and command types
+    DATA = 0x44         # 'D'
+    SCHEMA = 0x53       # 'S'
+    CMD_SCHEMA = 0x3F   # '?'
+    CMD_RATE = 0x52     # 'R'
+    CMD_RELEASE = 0x58  # 'X'
+    ## Most channels, one per channel mask bit
+    N_MAX = 32
+    ## Data frame header
+    HDR = struct.calcsize('<BHHII')
+
+    def __init__(self, vcp, buf = 2048):
+        '''!@brief      Initializes and returns a Telemetry object.
+            @param      vcp     pyb.USB_VCP object, or any object with its send(), any(),
+                                read(), and isconnected() methods.
+            @param      buf     Transmit buffer size [bytes]. Default 2048
+        '''
+        self.vcp = vcp
+        self.held = False                   # interrupt character off for commands
+
+        # Channels
+        self.names = []                                 # channel names
+        self.srcs = []                                  # Share per channel, or None if logged
+        self.vals = array('f', [0.0]*self.N_MAX)        # last value of logged channels
+        self.dec = array('H', [0]*self.N_MAX)           # decimation per channel, 0 off
+        self.cnt = array('H', [0]*self.N_MAX)           # runs left until sent
+        self.schema_id = 0
+        self.schema_due = True                          # send the schema next run
+
+        # Buffers
+        self.raw = bytearray(self.HDR + 4*self.N_MAX + 2)       # payload & CRC
+        self.tx = bytearray(buf)                                # encoded frames to send
+        self.mv = memoryview(self.tx)
+        self.head = 0           # [bytes] end of the frames in tx
+        self.tail = 0           # [bytes] start of the bytes not yet sent
+        self.rx = bytearray(16)                                 # host command being received
+        self.n_rx = 0
+        self.seq = 0            # data frame sequence number
+        self.dropped = 0        # frames dropped on a full buffer
+
+
+
+    def channel(self, name, src = None, decim = 1):
+        '''!@brief      Register a channel.
+            @param      name    Channel name, for the schema.
+            @param      src     Share sampled by the Telemetry task. Default none, logged with
+                                log() by its owner
+            @param      decim   Starting decimation, 0 for off. Default 1
+            @return     Channel number.
+        '''
+        if len(self.names) >= self.N_MAX:
+            raise Exception("Telemetry has no room for more channels")
+        ch = len(self.names)
+        self.names.append(name)
+        self.srcs.append(src)
+        self.select(ch, decim)
+        names = ','.join(self.names).encode()
+        self.schema_id = Telemetry.crc(names, len(names))
+        return ch
+
+
+
+    def select(self, ch, decim):
+        '''!@brief      Set a channel's decimation.
+            @param      ch      Channel number or name.
+            @param      decim   Send every decim-th run of the task, 0 for off.
+        '''
+        if isinstance(ch, str):
+            ch = self.names.index(ch)
+        self.dec[ch] = decim
+        self.cnt[ch] = 1
+        self.schema_due = True
+
+
+
+    def log(self, ch, val):
+        '''!@brief      Hand over a logged channel's latest value.
+            @param      ch      Channel number.
+            @param      val     Value.
+        '''
+        self.vals[ch] = val
+
+
+
+    def frame(self, n):
+        '''!@brief      CRC, encode, and queue the payload in self.raw.
+            @param      n       Payload length [bytes].
+        '''
+        c = Telemetry.crc(self.raw, n)
+        self.raw[n] = c & 0xFF
+        self.raw[n + 1] = c >> 8
+        n += 2
+        if self.head + n + n//254 + 2 > len(self.tx):
+            # Out of room at the end; move the unsent bytes to the front
+            k = self.head - self.tail
+            if k + n + n//254 + 2 > len(self.tx):
+                self.dropped += 1
+                return
+            self.tx[0:k] = self.mv[self.tail:self.head]
+            self.tail = 0
+            self.head = k
+        self.head = Telemetry.encode(self.raw, n, self.tx, self.head)
+
+
+
+    def schema(self):
+        '''!@brief      Queue a schema frame.
+        '''
+        n = len(self.names)
+        names = ','.join(self.names).encode()
+        if 4 + 2*n + len(names) + 2 > len(self.raw):
+            self.raw = bytearray(4 + 2*n + len(names) + 2)
+        struct.pack_into('<BHB', self.raw, 0, self.SCHEMA, self.schema_id, n)
+        for ch in range(n):
+            struct.pack_into('<H', self.raw, 4 + 2*ch, self.dec[ch])
+        self.raw[4 + 2*n:4 + 2*n + len(names)] = names
+        self.frame(4 + 2*n + len(names))
+
+
+
+    def sample(self):
+        '''!@brief      Queue a data frame of the channels due this run, if any.
+        '''
+        mask = 0
+        j = self.HDR
+        for ch in range(len(self.names)):
+            d = self.dec[ch]
+            if d:
+                c = self.cnt[ch] - 1
+                if c:
+                    self.cnt[ch] = c
+                    continue
+                self.cnt[ch] = d
+                src = self.srcs[ch]
+                struct.pack_into('<f', self.raw, j, src.get() if src is not None else self.vals[ch])
+                j += 4
+                mask |= 1 << ch
+        if mask:
+            struct.pack_into('<BHHII', self.raw, 0, self.DATA, self.schema_id, self.seq,
+                             ticks_us(), mask)
+            self.seq = (self.seq + 1) & 0xFFFF
+            self.frame(j)
+
+
+
+    def command(self):
+        '''!@brief      Act on the host command frame in self.rx.
+        '''
+        p = Telemetry.decode(self.rx[:self.n_rx])
+        if p is None or len(p) < 1:
+            return
+        if not self.held and hasattr(self.vcp, 'setinterrupt'):
+            self.vcp.setinterrupt(-1)       # a host is talking; commands are binary, not Ctrl-C
+            self.held = True
+        if p[0] == self.CMD_RELEASE:
+            self.close()
+        elif p[0] == self.CMD_RATE and len(p) == 4:
+            _, ch, decim = struct.unpack('<BBH', p)
+            if ch < len(self.names):
+                self.select(ch, decim)
+        elif p[0] == self.CMD_SCHEMA:
+            self.schema_due = True
+
+
+
+    def close(self):
+        '''!@brief      Give the VCP its interrupt character back.
+        '''
+        if self.held:
+            self.vcp.setinterrupt(3)
+            self.held = False
+
+
+
+    def MainTask(self):
+        '''!@brief      Main cotask task for Telemetry.
+            @details    The Telemetry main task has states:
+
+                            1:  Normal operation state. Read any host commands, queue the
+                                schema if it is due and a data frame if channels are due, then
+                                send what the VCP will take.
+
+            @details    Like all of Romi's cooperative multitasking tasks, MainTask is written
+                        as a generator function with an infinite loop. Each pass through the
+                        program runs through the MainTask while loop once, until it reaches a
+                        yield.
+        '''
+        while True:
+            # State 1: Listen, sample & send
+            if self.vcp.any():
+                for b in self.vcp.read():
+                    if b == 0:
+                        self.command()
+                        self.n_rx = 0
+                    elif self.n_rx < len(self.rx):
+                        self.rx[self.n_rx] = b
+                        self.n_rx += 1
+            if self.vcp.isconnected():
+                if self.schema_due:
+                    self.schema_due = False
+                    self.schema()
+                self.sample()
+                if self.head > self.tail:
+                    self.tail += self.vcp.send(self.mv[self.tail:self.head], timeout = 0)
+                    if self.tail == self.head:
+                        self.tail = 0
+                        self.head = 0
+            yield 1
+
+
+
+    @staticmethod
+    def crc(buf, n):
+        '''!@brief      CRC-16/CCITT of the first n bytes of buf.
+            @return     CRC.
+        '''
+        return _crc(buf, n, _CRC_TAB)
+
+
+
+    @staticmethod
+    def encode(src, n, dst, j):
+        '''!@brief      COBS encode the first n bytes of src into dst at j, with the ending zero.
+            @details    dst needs room for n + n//254 + 2 bytes.
+            @return     Index in dst after the frame.
+        '''
+        return _cobs(src, n, dst, j)
+
+
+
+    @staticmethod
+    def decode(data):
+        '''!@brief      COBS decode one frame, without its ending zero, and check its CRC.
+            @return     Payload, or None if the frame is bad.
+        '''
+        out = bytearray()
+        i = 0
+        while i < len(data):
+            code = data[i]
+            if code == 0 or i + code > len(data):
+                return None
+            out += data[i + 1:i + code]
+            i += code
+            if code < 0xFF and i < len(data):
+                out.append(0)
+        if len(out) < 3 or Telemetry.crc(out, len(out) - 2) != out[-2] | out[-1] << 8:
+            return None
+        return out[:-2]
+
+
+
+def _crc_table():
+    '''!@brief      CRC-16/CCITT lookup table, poly 0x1021.
+    '''
+    tab = array('H', [0]*256)
+    for i in range(256):
+        c = i << 8
+        for _ in range(8):
+            c = ((c << 1) ^ 0x1021 if c & 0x8000 else c << 1) & 0xFFFF
+        tab[i] = c
+    return tab
+
+_CRC_TAB = _crc_table()
+
+
+
+def _crc_py(buf, n, tab):
+    '''!@brief      CRC-16/CCITT, plain Python. Same as _crc().
+    '''
+    c = 0xFFFF
+    for i in range(n):
+        c = ((c << 8) & 0xFFFF) ^ tab[((c >> 8) ^ buf[i]) & 0xFF]
+    return c
+
+
+
+def _cobs_py(src, n, dst, j):
+    '''!@brief      COBS encode, plain Python. Same as _cobs().
+    '''
+    k = j               # where the current block's code byte goes
+    j += 1
+    code = 1
+    for i in range(n):
+        b = src[i]
+        if b:
+            dst[j] = b
+            j += 1
+            code += 1
+            if code < 0xFF:
+                continue
+        dst[k] = code
+        k = j
+        j += 1
+        code = 1
+    dst[k] = code
+    dst[j] = 0
+    return j + 1
+
+
+
+if micropython is not None:
+    @micropython.viper
+    def _crc(buf: ptr8, n: int, tab: ptr16) -> int:
+        '''!@brief      CRC-16/CCITT, viper. Same as _crc_py().
+        '''
+        c = 0xFFFF
+        i = 0
+        while i < n:
+            c = ((c << 8) & 0xFFFF) ^ tab[((c >> 8) ^ buf[i]) & 0xFF]
+            i += 1
+        return c
+
+    @micropython.viper
+    def _cobs(src: ptr8, n: int, dst: ptr8, j: int) -> int:
+        '''!@brief      COBS encode, viper. Same as _cobs_py().
+        '''
+        k = j
+        j += 1
+        code = 1
+        i = 0
+        while i < n:
+            b = src[i]
+            i += 1
+            if b:
+                dst[j] = b
+                j += 1
+                code += 1
+                if code < 0xFF:
+                    continue
+            dst[k] = code
+            k = j
+            j += 1
+            code = 1
+        dst[k] = code
+        dst[j] = 0
+        return j + 1
+else:
+    _crc = _crc_py
+    _cobs = _cobs_py
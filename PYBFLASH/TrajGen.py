@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+'''!@file       TrajGen.py
+    @brief      Romi motion profile trajectory generator
+    @details    TrajGen.py contains the class used by Romi MasterMind to plan time-optimal
+                velocity profiles for distance and angle maneuvers.
+    @author     Joseph Penrose & Paolo Navarro
+    @date       October 18, 2026
+'''
+# Required modules
+import math
+class TrajGen():
+    '''!@brief      A point-to-point motion profile generator.
+        @details    TrajGen plans the fastest velocity profile that moves a signed distance
+                    from rest to rest without exceeding a speed limit and an acceleration
+                    limit. Short moves that never reach the speed limit become triangular
+                    profiles. The profile is unitless: RomiMM uses it for straight moves in
+                    [m] and for turns in [rad], with limits derived from the wheel limits.
+
+        @details    Two shapes are available. 'trap' is the classic trapezoid, with
+                    constant acceleration ramps. 'scurve' replaces each ramp with a
+                    sine-squared acceleration pulse that starts and ends at zero, so there
+                    are no acceleration steps (less wheel slip) at the cost of a slightly
+                    longer ramp for the same peak acceleration.
+
+        @details    The profile is planned once per maneuver with plan(), then sampled every
+                    pass through the maneuver generator with sample(). Neither allocates new
+                    objects, so a single TrajGen can be reused for every maneuver.
+    '''
+
+    def __init__(self, v_max, a_max, shape = 'trap'):
+        '''!@brief      Initializes and returns a TrajGen object.
+            @details    Stores the default limits and the profile shape. The limits can be
+                        overridden on each call to plan().
+            @param      v_max   Default speed limit, in distance units per second.
+            @param      a_max   Default peak acceleration limit, in distance units per second^2.
+            @param      shape   Ramp shape, 'trap' or 'scurve'. Default 'trap'
+        '''
+        if v_max <= 0 or a_max <= 0:
+            raise ValueError("Profile limits must be positive & non-zero")
+        if shape not in ('trap', 'scurve'):
+            raise ValueError("Profile shape must be 'trap' or 'scurve'")
+
+        # Store limits
+        self.v_max = v_max          # default speed limit
+        self.a_max = a_max          # default peak acceleration limit
+        self.scurve = (shape == 'scurve')
+
+        # Planned profile
+        self.sgn = 1.0              # direction of travel
+        self.d = 0.0                # [--]  unsigned move length
+        self.v_pk = 0.0             # [--/s] peak (cruise) speed
+        self.t_a = 0.0              # [s]   ramp time
+        self.t_c = 0.0              # [s]   cruise time
+        self.T = 0.0                # [s]   total profile time
+        self.d_a = 0.0              # [--]  distance covered during one ramp
+
+        # Profile sample outputs
+        self.p = 0.0                # signed reference position
+        self.v = 0.0                # signed reference speed
+
+
+
+    def plan(self, dist, v_max = None, a_max = None):
+        '''!@brief      Plans a rest-to-rest profile for a signed distance.
+            @details    Computes the ramp, cruise, and total times of the time-optimal profile.
+                        A sine-squared ramp averages half of its peak acceleration, so the
+                        S-curve is planned as a trapezoid with half the acceleration.
+            @param      dist    Signed move distance.
+            @param      v_max   Speed limit for this move. Default is the stored limit
+            @param      a_max   Acceleration limit for this move. Default is the stored limit
+            @return     Total profile time in [s].
+        '''
+        if v_max is None or v_max > self.v_max:
+            v_max = self.v_max
+        if a_max is None:
+            a_max = self.a_max
+        if v_max <= 0 or a_max <= 0:
+            raise ValueError("Profile limits must be positive & non-zero")
+
+        # Average ramp acceleration
+        if self.scurve:
+            a_max = a_max/2
+
+        # Split sign and magnitude
+        self.sgn = -1.0 if dist < 0 else 1.0
+        self.d = abs(dist)
+
+        # Trapezoid if we can reach v_max, else triangle
+        if self.d*a_max >= v_max*v_max:
+            self.v_pk = v_max
+            self.t_a = v_max/a_max
+            self.t_c = (self.d - v_max*self.t_a)/v_max
+        else:
+            self.v_pk = math.sqrt(self.d*a_max)
+            self.t_a = self.v_pk/a_max
+            self.t_c = 0.0
+        self.T = 2*self.t_a + self.t_c
+        self.d_a = 0.5*self.v_pk*self.t_a       # both shapes cover v*t/2 per ramp
+
+        # Start at rest
+        self.p = 0.0
+        self.v = 0.0
+
+        return self.T
+
+
+
+    def ramp(self, t):
+        '''!@brief      Computes unsigned position and speed a time t into the ramp-up.
+            @details    Helper for sample(). The ramp-down is the same ramp run backwards.
+                        Results are left in self.p and self.v.
+            @param      t       Time since the start of the ramp in [s], 0 <= t <= t_a.
+        '''
+        if self.t_a <= 0:
+            self.p = 0.0
+            self.v = 0.0
+        elif self.scurve:
+            w = 2*math.pi/self.t_a
+            self.v = self.v_pk*(t/self.t_a - math.sin(w*t)/(2*math.pi))
+            self.p = self.v_pk*(t*t/(2*self.t_a) + (math.cos(w*t) - 1)/(w*w*self.t_a))
+        else:
+            a = self.v_pk/self.t_a
+            self.v = a*t
+            self.p = 0.5*a*t*t
+
+
+
+    def sample(self, t):
+        '''!@brief      Samples the planned profile at time t.
+            @details    Updates the signed reference position self.p and speed self.v. Times
+                        past the end of the profile hold the final position at zero speed.
+            @param      t       Time since the start of the move in [s].
+            @return     True if the profile is complete, else False.
+        '''
+        if t <= 0:
+            self.p = 0.0
+            self.v = 0.0
+        elif t < self.t_a:
+            # Accelerating
+            self.ramp(t)
+        elif t < self.t_a + self.t_c:
+            # Cruising
+            self.p = self.d_a + self.v_pk*(t - self.t_a)
+            self.v = self.v_pk
+        elif t < self.T:
+            # Decelerating, mirror image of the ramp-up
+            self.ramp(self.T - t)
+            self.p = self.d - self.p
+        else:
+            # Done, hold position
+            self.p = self.d
+            self.v = 0.0
+
+        # Apply direction
+        self.p *= self.sgn
+        self.v *= self.sgn
+
+        return t >= self.T
@@ -41,14 +41,67 @@ import cotask
 from RomiEnc import RomiEnc
 from BNO import BNO
 from LineSensors import LineSensors
+from ADCBurst import ADCBurst
+from LineCal import LineCal
+from LineFilt import LineFilt
+from LinePos import LinePos
+from LineFeat import LineFeat
 from LidarSensor import LidarSensor
+from LidarIC import LidarIC
 from LineCL import LineCL
+from HeadingCL import HeadingCL
 from RomiMot import RomiMot
+from BattMon import BattMon
+from MotorMap import MotorMap
 from RomiMM import RomiMM
+from SysID import SysID
+from StopDist import StopDist
+from MPCLut import MPCLut
+from SpeedGov import SpeedGov
+from LineTrack import LineTrack
+from Mission import Mission
+from Logger import Logger
+from Telemetry import Telemetry
 
 # Verbose exceptions:
 micropython.alloc_emergency_exception_buf(100)  # please verbose exceptions
 
+# Drive identification mode: run SysID instead of MasterMind
+SYSID = False
+
+# Lidar pulse width by timer input capture on PC6 instead of the PC0 interrupt
+LIDAR_IC = False
+
+# Braking test mode: run the StopDist braking test instead of MasterMind
+BRAKE_TEST = False
+
+# Line follower auto-tune: a LineCL tuning rule ('p', 'zn', 'tl', 'pessen', 'so', 'no') to
+# relay-tune on a straight instead of running the course, or None
+TUNE = None
+
+# Line follower: geometric (Stanley) follower on the line pose instead of the sensor value PID
+GEO_FOLLOW = False
+
+# Line follower: explicit MPC from 'mpc_lut.bin' (see tools/mpc_lut.py); overrides GEO_FOLLOW
+MPC_FOLLOW = False
+
+# Line follower: govern the base speed on tracking error, curvature, and lost line events
+SPEED_GOV = True
+
+# Line follower: bridge dashed line gaps by extrapolating the line from its recent path
+LINE_TRACK = True
+
+# Mission file on flash; the built-in term project mission is used if it is missing
+MISSION = 'mission.txt'
+
+# Telemetry log sink: 'usb' for the USB VCP, a file name on flash, or None for no logging
+LOG = 'usb'
+
+# Telemetry stream: COBS-framed binary frames over the USB VCP, with channel rates set from the
+# host (see tools/telemetry.py); replaces the LOG sink when on. Ctrl-C is held off only while
+# a telemetry host is talking to Romi
+TELEMETRY = True
+
 
 
 def BlueButtonCB(line):
@@ -108,15 +161,33 @@ if __name__ == '__main__':
     #Lidar Sensor:
     distance = Share('f')
     Lidar_dt = Share('f')
-    LidarShares = (distance, Lidar_dt)
+    Lidar_ttc = Share('f')              # [s] time to collision
+    LidarShares = (distance, Lidar_dt, Lidar_ttc)
     
     ''' Line Sensors '''
     # Line Sensors:
     sens_val_share = Share('f')         # Final sensor value Share
     finish_flag = Queue('B', 1)         # trash flag for finish line detection
     sens_sum_share = Share('f')         # Sensor sum Share
-    LS_shares = (sens_val_share, finish_flag, sens_sum_share)
+    line_pos_share = Share('f')         # [mm] interpolated line position Share
+    line_off_share = Share('f')         # [mm] line offset at the wheel axis Share
+    line_ang_share = Share('f')         # [rad] line angle to the chassis Share
+    line_ok_share = Share('B')          # front array sees the line Share
+    LS_ready_flag = Queue('B', 1)       # trash flag, raised once calibrated & sensing
+    LS_shares = (sens_val_share, finish_flag, sens_sum_share, line_pos_share, line_off_share,
+                 line_ang_share, line_ok_share, LS_ready_flag)
+    # Track features:
+    feat_event = Share('B')             # track feature event code Share
+    feat_conf = Share('f')              # track feature confidence Share
+    feat_flag = Queue('B', 1)           # trash flag, raised on each new feature
+    Feat_shares = (feat_event, feat_conf, feat_flag)
 
+    ''' Battery '''
+    # Battery monitor:
+    batt_V = Share('f')         # battery pack voltage
+    batt_scale = Share('f')     # motor duty scale for battery compensation
+    BattShares = (batt_V, batt_scale)
+    
     ''' Drive L '''
     # Encoder:
     pos_L = Share('f')  # encoder position
@@ -141,7 +212,7 @@ if __name__ == '__main__':
     # Motor signals:
     mot_EN_L = Share('B')   # motor enable flag
     duty_L = Share('f')     # motor duty cycle (signed!)
-    mot_L_shares = (mot_EN_L, duty_L)   # encoder A share tuple
+    mot_L_shares = (mot_EN_L, duty_L, batt_scale)   # encoder A share tuple
     
     # Put all of this stuff into a huge, Drive L dictionary
     dict_L = {"Encoder": enc_L_shares,
@@ -173,13 +244,16 @@ if __name__ == '__main__':
     # Motor signals:
     mot_EN_R = Share('B')   # motor enable flag
     duty_R = Share('f')     # motor duty cycle (signed!)
-    mot_R_shares = (mot_EN_R, duty_R)   # encoder B share tuple
+    mot_R_shares = (mot_EN_R, duty_R, batt_scale)   # encoder B share tuple
     
     # Put all of this stuff into a huge, Drive R dictionary
     dict_R = {"Encoder": enc_R_shares,
               "CL Gains": gains_R_shares,
               "CL Signals": ctrl_R_shares,
               "Motor": mot_R_shares}
+    ''' Motor map '''
+    map_flag = Queue('B', 1)    # trash flag, raised when motor map applied
+    w_top = Share('f')          # [rad/s] motor map common top speed
     ''' End data Shares & Queues setup '''
     
     
@@ -208,7 +282,11 @@ if __name__ == '__main__':
     # Create Lidar object
     Dist_t0 = 0         # Lidar interrupt t0 gloabl
     Dist_dt = 0         # Lidar interrupt dt gloabl
-    Lidar = LidarSensor(LidarShares)
+    if LIDAR_IC:
+        # Both pulse edges timestamped in hardware by TIM8 on PC6
+        Lidar = LidarSensor(LidarShares, LidarIC(8, 'C6'), (spd_L, spd_R), r)
+    else:
+        Lidar = LidarSensor(LidarShares, None, (spd_L, spd_R), r)
     
     # Initialize line sensors
     # Set up Pin objects for axial sensors
@@ -239,8 +317,32 @@ if __name__ == '__main__':
     sens_FR2 = ADC(pin_FR2)
     Pins = (sens_L2, sens_L1, sens_C, sens_R1, sens_R2, sens_FL2, sens_FL1, sens_FC, sens_FR1, sens_FR2)
     
+    # Burst sampler for all ten line sensors, 4x oversampled at 20 kHz
+    LS_burst_tim = Timer(6, freq = 20_000)
+    LS_burst = ADCBurst(Pins, LS_burst_tim, n_os = 4)
+    
+    # Per-channel line sensor calibration
+    LS_cal = LineCal(n_ch = 10)
+    
+    # Median-of-3 & IIR filter on every line sensor channel
+    LS_filt = LineFilt(n_ch = 10, k = 1, med = True)
+    print(f'Line sensor filter adds {LS_filt.delay} tick(s) of delay')
+    
+    # Sub-sensor line position for the front array, 17 mm sensor pitch
+    LS_pos = LinePos(pitch = 17.0, n = 5, base = LineCal.WHITE)
+    # ...and for the axial array, for line offset & angle
+    LS_pos_ax = LinePos(pitch = 17.0, n = 5, base = LineCal.WHITE)
+    
+    # Crossbar, gap & lost line detector on both arrays
+    LS_feat = LineFeat(Feat_shares, pos_L, pos_R, r)
+    
     # Create LineSensor object
-    LineSensors = LineSensors(LS_shares, Pins)
+    LineSensors = LineSensors(LS_shares, Pins, LS_burst, LS_cal, LS_pos, LS_pos_ax, LS_filt,
+                              LS_feat)
+    
+    # Battery monitor on a 10k/4.7k divider
+    pin_batt = Pin(Pin.cpu.A3, mode=Pin.ANALOG)
+    Batt = BattMon(BattShares, ADC(pin_batt), (10 + 4.7)/4.7)
     
     # Set up timers for motor control 
     mot_L_tim = Timer(3, freq = 20_000)
@@ -250,12 +352,57 @@ if __name__ == '__main__':
     mot_L = RomiMot(mot_L_tim, Pin.cpu.B4, Pin.cpu.B5, mot_L_shares)
     mot_R = RomiMot(mot_R_tim, Pin.cpu.A0, Pin.cpu.A1, mot_R_shares)
     
+    # Motor deadband & friction compensation map
+    Map = MotorMap(mot_L, mot_R, spd_L, spd_R, duty_L, duty_R, mot_EN_L, mot_EN_R, map_flag, w_top)
+    
+    # Obstacle stopping distance; sensing delay is the lidar median & gate lag plus a task period
+    t_sens = (Lidar.N//2 + Lidar.n_rej_max + 1)*0.010
+    SD = StopDist(enc_L_shares, enc_R_shares, mot_L_shares, mot_R_shares, map_flag, r, t_sens)
+    
     # Finally, construct Romi's BRAIN!!!
     LineController = LineCL(1)
-    MM = RomiMM(dict_L, dict_R, BNO_shares, LS_shares, distance, W, r, LineController)
+    # Line follower gains by speed [m/s] (rows) & curvature [1/m] (columns). Kp matches the
+    # hand-tuned 0.4~0.45 around 0.2 m/s and falls off as 1/v above, since steering authority
+    # grows with speed; tighter curves get a little more.
+    LineController.SetSchedule((0.10, 0.20, 0.30, 0.40), (0.0, 5.0, 10.0),
+                               ((0.45, 0.52, 0.58),
+                                (0.43, 0.49, 0.56),
+                                (0.32, 0.37, 0.42),
+                                (0.24, 0.28, 0.31)),
+                               Kd_tab = ((0.0,  0.0,  0.0),
+                                         (0.0,  0.0,  0.0),
+                                         (0.01, 0.01, 0.01),
+                                         (0.02, 0.02, 0.02)))
+    LineController.load()       # relay-tuned gains, if Romi has been tuned
+    MPC = MPCLut() if MPC_FOLLOW else None
+    Gov = SpeedGov(Feat_shares, u_min = 25, u_max = 60, gap_hold = not LINE_TRACK) if SPEED_GOV else None
+    Track = LineTrack() if LINE_TRACK else None
+    Plan = Mission.load(MISSION)
+    Log = None
+    if TELEMETRY:
+        Log = Telemetry(vcp)
+    elif LOG is not None:
+        Log = Logger(vcp if LOG == 'usb' else LOG, N = 256, chunk = 32)
+    if Log is not None:
+        Log.channel('sens_val', sens_val_share)
+        Log.channel('distance', distance, decim = 2)
+        Log.channel('spd_L', spd_L)
+        Log.channel('spd_R', spd_R)
+        Log.channel('batt_V', batt_V, decim = 50)
+    if TELEMETRY:
+        # Registered but off, until the host turns them on for tuning
+        for name, src in (('line_pos', line_pos_share), ('line_off', line_off_share),
+                          ('line_ang', line_ang_share), ('zav', BNO_zav), ('phi_BNO', BNO_phi),
+                          ('duty_L', duty_L), ('duty_R', duty_R), ('batt_scale', batt_scale)):
+            Log.channel(name, src, decim = 0)
+    HeadingController = HeadingCL(6.0, 8.0, Ki_r = 20.0, r_max = 0.60/W)     # rate feed-forward set by MasterMind
+    MM = RomiMM(dict_L, dict_R, BNO_shares, LS_shares, distance, W, r, LineController, HeadingController, map_flag, w_top, SD,
+                 TuneRule = TUNE, Geo = GEO_FOLLOW, MPC = MPC,
+                 Gov = Gov, Track = Track, Plan = Plan, Log = Log)
     
     # Create lidar pulse width measurement interrupt
-    lidar_int = ExtInt(Pin.cpu.C0, ExtInt.IRQ_RISING_FALLING, Pin.PULL_NONE, DistInt)
+    if not LIDAR_IC:
+        lidar_int = ExtInt(Pin.cpu.C0, ExtInt.IRQ_RISING_FALLING, Pin.PULL_NONE, DistInt)
     
     # Create blue button motor override interrupt
     blue_int = ExtInt(Pin.cpu.C13, ExtInt.IRQ_FALLING, Pin.PULL_NONE, BlueButtonCB)
@@ -284,15 +431,37 @@ if __name__ == '__main__':
     LS_task = cotask.Task(LineSensors.MainTask, name='LineSensors', priority = 1, period=10)# create Task object
     cotask.task_list.append(LS_task)                                                    # append task to scheduler
     
+    # Battery monitor:
+    Batt_task = cotask.Task(Batt.MainTask, name='Battery', priority = 1, period=100)       # create Task object
+    cotask.task_list.append(Batt_task)                                                  # append task to scheduler
+    
     # Motors:
     mot_L_task = cotask.Task(mot_L.MainTask, name='L Motor', priority = 1, period=10)       # create Task object
     cotask.task_list.append(mot_L_task)                                                 # append task to scheduler
     mot_R_task = cotask.Task(mot_R.MainTask, name='R Motor', priority = 1, period=10)       # create Task object
     cotask.task_list.append(mot_R_task)                                                 # append task to scheduler
     
-    # MasterMind:
-    MM_task = cotask.Task(MM.MainTask, name='MasterMind', priority = 1, period=10)          # create Task object
-    cotask.task_list.append(MM_task)                                                    # append task to scheduler
+    # Motor map:
+    Map_task = cotask.Task(Map.MainTask, name='MotorMap', priority = 1, period=10)          # create Task object
+    cotask.task_list.append(Map_task)                                                   # append task to scheduler
+    
+    # MasterMind, or SysID in identification mode:
+    if SYSID:
+        ID = SysID(enc_L_shares, enc_R_shares, mot_L_shares, mot_R_shares, map_flag, period=10)
+        ID_task = cotask.Task(ID.MainTask, name='SysID', priority = 1, period=10)           # create Task object
+        cotask.task_list.append(ID_task)                                                # append task to scheduler
+    elif BRAKE_TEST:
+        SD_task = cotask.Task(SD.MainTask, name='StopDist', priority = 1, period=10)      # create Task object
+        cotask.task_list.append(SD_task)                                                # append task to scheduler
+    else:
+        MM_task = cotask.Task(MM.MainTask, name='MasterMind', priority = 1, period=10)      # create Task object
+        cotask.task_list.append(MM_task)                                                # append task to scheduler
+    
+    # Telemetry logger, after everything it logs:
+    if Log is not None:
+        Log_task = cotask.Task(Log.MainTask, name='Telemetry' if TELEMETRY else 'Logger',
+                               priority = 0, period=10)                                 # create Task object
+        cotask.task_list.append(Log_task)                                               # append task to scheduler
     ''' End multitasking setup '''
     
     
@@ -304,10 +473,16 @@ if __name__ == '__main__':
     
     
     print('Romi lives!')
-    while True:
-        try:                
-            
-            cotask.task_list.rr_sched()     # run the scheduler forever!
-    
-        except KeyboardInterrupt:
-            break       # unless the user says otherwise!
\ No newline at end of file
+    try:
+        while True:
+            try:                
+                
+                cotask.task_list.rr_sched()     # run the scheduler forever!
+        
+            except KeyboardInterrupt:
+                break       # unless the user says otherwise!
+    finally:
+        # However the program ends, hand Ctrl-C back to the REPL and flush any flash log
+        if Log is not None:
+            Log.close()
+            print(f'Telemetry dropped {Log.dropped} {"frames" if TELEMETRY else "records"}')
\ No newline at end of file
@@ -55,7 +55,10 @@
     non-zero value to determine direction.
     
     A sensor array was also attached to Romi's center along the wheel axis, but it was determined to
-    be a poor location for line sensing and is not used on the final project.
+    be a poor location for line sensing and is not used for the weighted sensor value. Instead,
+    the line position under each array is interpolated between sensors, and the two positions
+    together give the line's offset at the wheel axis and its angle to the chassis, so the
+    follower can see a curve coming before Romi is off-center.
     
     \image{inline-center} html img\sensors.jpg width=60%
     
@@ -84,6 +87,19 @@
     unsigned sensor value, which is used to detect if all sensors go off at once. If they do,
     and then abruptly all go dark, Romi assumes it has crossed the finish line.
     
+    Because that check needs every sensor dark at the same moment, a steep crossing could slip
+    past it. Romi now tracks both sensor arrays against distance travelled instead: a bar that
+    darkens most of the front array within a short stretch of travel, and then the axial array
+    one array spacing later, is a crossbar, and a crossbar with no line beyond it is the finish.
+    The same tracker reports dashed line gaps and a lost line, each with a confidence score.
+    
+    Dashed lines are bridged rather than just reported. While the front array sees the line,
+    MasterMind's line tracker (Class LineTrack) stores the points under it in world coordinates
+    using Romi's dead-reckoned pose. When the front array runs off a dash, the tracker fits a
+    parabola to the last stretch of line and extrapolates it, and the follower steers on the line
+    position, offset, and angle that the fit predicts until the next dash comes into view, instead
+    of swinging to full lock. This lets Romi take dashed curves at speed.
+    
     @subsection ss_dead Dead Reckoning & World Position
     Romi uses a dead reckoning system that blends IMU and encoder data to constantly record
     Romi's position in world coordinates, where the initial position on startup is considered
@@ -353,6 +369,12 @@
     Lidar:
     <ul>
         <li> Lidar:      PC0 (white)
+        <li> Lidar_IC:   PC6             # TIM8_CH1, for LIDAR_IC mode in main.py
+    </ul>
+    
+    Battery:
+    <ul>
+        <li> V_batt:     PA3             # 10k/4.7k divider from VSW
     </ul>
     
     @subsection ss_pybflash PYBFLASH
@@ -391,6 +413,12 @@
     of this, the PWM output is timed with an external interrupt such that the code is not blocked
     while waiting for a falling edge. The interrupt is called in the main.py file.
     
+    The interrupt's own latency lands in the pulse width, though, so Romi can instead time the pulse
+    in hardware. With the LIDAR output wired to PC6 and LIDAR_IC set in main.py, TIM8 runs in PWM
+    input mode: channel 1 captures each rising edge and resets the counter, and channel 2 captures
+    the falling edge, so the capture register holds the pulse width in microseconds and no code
+    runs per pulse.
+    
     @subsection ss_lines Line Sensor Integration
     Each line sensor produces its own analog value corresponding to the reflectance of the surface
     below it. One issue that our strategy runs into is that there are 'dead zones' in-between the
@@ -423,13 +451,41 @@
     We found tuning issues with PI and PID control, and P control was very much sufficient and
     reliable for this project.
     
+    To take the guesswork out of tuning, LineCL can now tune itself on the robot. With TUNE in
+    main.py set to a tuning rule, Romi replaces the controller with a relay on a straight stretch of
+    line, weaves about it in a small, steady oscillation, and measures the ultimate gain and period
+    from the line sensor value. The rule (Ziegler-Nichols, Tyreus-Luyben, Pessen, and others) turns
+    those into PID gains, which are saved to flash and loaded at every boot, rescaling the speed and
+    curvature gain schedule to match.
+    
+    With GEO_FOLLOW set in main.py, MasterMind follows the line with a geometric path tracker instead
+    (RomiMM.GeoFollow). It takes the line's offset and angle from both sensor arrays and steers like
+    the Stanley controller, commanding a yaw rate from the heading error plus a cross-track term that
+    scales with Romi's speed. The yaw rate loop of the heading controller turns that into wheel
+    efforts, so the base speed and the correction are no longer tied together.
+    
+    MPC_FOLLOW goes one step further with an explicit model predictive controller (RomiMM.MPCFollow).
+    The host tool tools/mpc_lut.py solves the constrained MPC problem offline over a grid of line
+    offset, line angle, and speed, and stores the piecewise-affine control law as a small binary table
+    ('mpc_lut.bin'). On Romi, MPCLut looks up the nearest grid node each tick and evaluates its affine
+    law, so the follower plans ahead at about the cost of a P controller.
+    
+    Whichever follower is used, its base speed is set by a speed governor (Class SpeedGov) rather than
+    fixed for the slowest curve. Every tick it takes the lowest of a curve speed limit (from the larger
+    of the measured curvature and the curvature ahead seen by the two sensor arrays), a tracking limit
+    that falls as the line error spreads out, and a crawl after LineFeat reports a gap or a lost line,
+    then applies acceleration limits. Romi runs the straights much faster and slows before the curves.
+    
     @subsection ss_romimm Romi MasterMind & Completing The Term Project Challenge
     Romi MasterMind (Class RomiMM) is the heart and brain of the project. It controls what Romi does,
     how it does it, where it is, and where it's going. The states are detailed in the Class page, but
-    most important to the term project are states 4 and 5: 'Do Term Project' and 'Go Home.'
+    most important to the term project are states 4 and 5: 'Run Mission' and 'Go Home.'
     
-    In 'Do Term Project,' Romi follows a scripted set of maneuvers corresponding to the rules of the
-    term project challenge. They are: 
+    In 'Run Mission,' Romi follows a scripted set of maneuvers corresponding to the rules of the
+    term project challenge. The script is a table of steps, each a maneuver and the condition that
+    ends it, run by MasterMind's mission engine. It is read from 'mission.txt' on PYBFLASH, so the
+    course can be changed without touching the code, and a built-in copy is used if the file is
+    missing. The steps are: 
 	
 	<ol>
         <li> Leave the start box by travelling forward a short distance.
@@ -476,6 +532,14 @@
     often. Unfortunately, the most common error Romi makes is some kind of incorrect calibration with
     BNO. It seems to occur only when the VCP_USB connection to a host PC is unplugged, or if the
     batteries are low. It occurs infrequently on board reset, and resolves itself when reset again.
+    Romi used to print its pose over the VCP every tick, and those prints wait on the USB, so they are
+    now gone from the control loop. Telemetry goes through Logger instead: each sample is packed into
+    a preallocated binary ring buffer, and a low priority Logger task drains it to the USB or a file
+    on flash without ever waiting. If the buffer fills, records are dropped and counted rather than
+    holding up control. For tuning, Telemetry streams any registered Share or value as binary
+    frames: COBS framed, CRC checked, and tagged with a schema ID, at a rate per channel that the
+    host sets while Romi runs. tools/telemetry.py captures the stream into NumPy arrays, and
+    tools/telemetry_sim.py runs the same code against a simulated Romi on a pty for testing.
     
     @subsection ss_maneuv Maneuver Generation
     The last interesting nuance of Romi's programming is maneuver generation. For context, Romi uses
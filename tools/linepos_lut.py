@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+'''!@file       linepos_lut.py
+    @brief      Host-side Romi line position lookup table generator
+    @details    linepos_lut.py builds the 'linepos_lut.bin' table that LinePos uses to turn the
+                raw peak-fit line position into the true position. Run it on the host PC with
+                NumPy installed and copy the output onto PYBFLASH:
+
+                    python linepos_lut.py --width 19 --pitch 17 --sigma 4
+
+    @details    By default the sensor response comes from a model: each QTR sensor sees the
+                floor through a Gaussian spot of width sigma, so its reading is the fraction of
+                the spot covered by a line of the given width, scaled between the nominal white
+                and black levels. With --data, the response is taken from measurements instead:
+                a CSV of true position [mm] followed by the five normalized counts, logged with
+                Romi slid sideways across a line on a ruler.
+
+    @details    Either way, every true position is passed through the same LinePos.raw() fit
+                that runs on Romi. The true position is then tabulated against the raw
+                position on an evenly spaced raw grid, forcing the map to be monotonic, and
+                written as b'LP', '<Hff' (point count, first and last raw position), then the
+                true positions as int16 hundredths of a mm.
+    @author     Joseph Penrose & Paolo Navarro
+    @date       October 18, 2026
+'''
+import argparse
+import math
+import os
+import struct
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'PYBFLASH'))
+from LinePos import LinePos     # noqa: E402, the on-robot estimator
+
+## Nominal white and black levels [counts], as LineCal.WHITE and LineCal.BLACK
+WHITE = 248
+BLACK = 2854
+
+
+def model(x, width, pitch, sigma, n = 5):
+    '''!@brief      Modelled normalized counts for a line centred at x.
+        @param      x       True line position [mm].
+        @param      width   Line width [mm].
+        @param      pitch   Sensor spacing [mm].
+        @param      sigma   Sensor spot size (Gaussian standard deviation) [mm].
+        @param      n       Sensors in the array. Default 5
+        @return     Array of n normalized counts.
+    '''
+    s = (np.arange(n) - (n - 1)/2)*pitch
+    cdf = np.vectorize(lambda z: 0.5*(1 + math.erf(z/math.sqrt(2))))
+    cover = cdf((x + width/2 - s)/sigma) - cdf((x - width/2 - s)/sigma)
+    return np.round(WHITE + cover*(BLACK - WHITE)).astype(int)
+
+
+def build(x_true, x_raw, n_pts):
+    '''!@brief      Tabulate true position against raw position on an even grid.
+        @param      x_true  True positions [mm].
+        @param      x_raw   Raw positions from LinePos.raw() [mm].
+        @param      n_pts   Number of table points.
+        @return     Tuple (x0, x1, table), raw grid ends [mm] and true positions [mm].
+    '''
+    order = np.argsort(x_true)
+    x_true = x_true[order]
+    x_raw = np.maximum.accumulate(x_raw[order])     # the map must be monotonic
+    keep = np.concatenate(([True], np.diff(x_raw) > 1e-6))
+    x_true = x_true[keep]
+    x_raw = x_raw[keep]
+    grid = np.linspace(x_raw[0], x_raw[-1], n_pts)
+    return x_raw[0], x_raw[-1], np.interp(grid, x_raw, x_true)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the LinePos linearization table.')
+    parser.add_argument('--width', type=float, default=19.0, help='line width [mm]')
+    parser.add_argument('--pitch', type=float, default=17.0, help='sensor spacing [mm]')
+    parser.add_argument('--sigma', type=float, default=4.0, help='sensor spot size [mm]')
+    parser.add_argument('--n', type=int, default=65, help='table points')
+    parser.add_argument('--data', default=None, help='measured CSV: x [mm], then 5 counts')
+    parser.add_argument('--out', default='linepos_lut.bin', help='output file')
+    args = parser.parse_args()
+
+    pos = LinePos(pitch=args.pitch, fname=None)
+    if args.data is None:
+        # Out to the outer sensors; past them the peak fit has nothing left to resolve
+        x_true = np.linspace(-pos.x_lim, pos.x_lim, 2001)
+        frames = [model(x, args.width, args.pitch, args.sigma) for x in x_true]
+    else:
+        data = np.loadtxt(args.data, delimiter=',', ndmin=2)
+        x_true = data[:, 0]
+        frames = data[:, 1:6].astype(int)
+
+    # Same fit as on Romi, keeping only points it would call valid
+    x_raw = np.zeros(len(frames))
+    amp = np.zeros(len(frames))
+    for i, f in enumerate(frames):
+        x_raw[i] = pos.raw(f)
+        amp[i] = pos.amp
+    ok = amp >= pos.amp_min
+    x0, x1, table = build(x_true[ok], x_raw[ok], args.n)
+
+    err = np.abs(x_raw[ok] - x_true[ok])
+    print(f'{ok.sum()} valid points, raw error max {err.max():.2f} mm, rms {np.sqrt(np.mean(err**2)):.2f} mm')
+    lin = np.interp(x_raw[ok], np.linspace(x0, x1, args.n), table)
+    err = np.abs(lin - x_true[ok])
+    print(f'linearized error max {err.max():.2f} mm, rms {np.sqrt(np.mean(err**2)):.2f} mm')
+
+    with open(args.out, 'wb') as file:
+        file.write(b'LP' + struct.pack('<Hff', args.n, x0, x1))
+        file.write(struct.pack('<' + 'h'*args.n, *np.round(table*100).astype(int)))
+    print(f'{args.n} points over raw {x0:.1f}~{x1:.1f} mm saved as "{args.out}"')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+'''!@file       mpc_lut.py
+    @brief      Host-side Romi explicit MPC line follower table generator
+    @details    mpc_lut.py solves Romi's line following MPC problem offline over a grid of line
+                offset, line angle, and speed, and writes the 'mpc_lut.bin' table that MPCLut
+                evaluates on the robot. Run it on the host PC with NumPy installed and copy the
+                output onto PYBFLASH:
+
+                    python mpc_lut.py --horizon 20 --dt 0.02 --r-max 4
+
+    @details    The model is Romi's kinematics about the line, linearized for small angles, at
+                a fixed speed v, with the yaw rate r (positive left) as the input:
+
+                    e[k+1]   = e[k] + v dt psi[k] + v dt^2/2 r[k]
+                    psi[k+1] = psi[k] + dt r[k]
+
+                where e is the line offset at the wheel axis and psi the line angle to the
+                chassis, both positive to Romi's right as LineSensors publishes them. The cost
+                is the sum of q_e e^2 + q_psi psi^2 + q_r r^2 over the horizon, plus the
+                infinite-horizon (Riccati) cost of the final state, with |r| <= r_max. The
+                weights default to Bryson's rule on the largest acceptable values.
+
+    @details    For every grid node the box-constrained QP is solved by an active set method.
+                The first planned yaw rate is stored, along with its exact slopes in e and psi
+                from the optimal active set: zero when the first move is saturated, else the
+                first row of the unconstrained solution on the free moves. That is the affine
+                piece of the explicit MPC law around the node. Each quantity is scaled to
+                int16 and written after a b'MP', '<3H10f' header (see MPCLut). The tool reads
+                the file back with MPCLut and checks it against the QP at random points,
+                with the speed drawn anywhere in the grid's range rather than only at the
+                slices. It fails, with a nonzero exit, if the largest error is above --tol of
+                the yaw rate limit; refine the grid with --n if it does.
+    @author     Joseph Penrose & Paolo Navarro
+    @date       October 18, 2026
+'''
+import argparse
+import os
+import struct
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'PYBFLASH'))
+from MPCLut import MPCLut       # noqa: E402, the on-robot evaluator
+
+
+def model(v, dt):
+    '''!@brief      Discrete line tracking model at speed v.
+        @param      v       Forward speed [m/s].
+        @param      dt      MPC step [s].
+        @return     Tuple (A, B).
+    '''
+    A = np.array([[1.0, v*dt], [0.0, 1.0]])
+    B = np.array([[0.5*v*dt*dt], [dt]])
+    return A, B
+
+
+def riccati(A, B, Q, R, n = 2000):
+    '''!@brief      Infinite-horizon LQR cost matrix, by iterating the Riccati equation.
+        @return     Cost matrix P.
+    '''
+    P = Q.copy()
+    for _ in range(n):
+        K = np.linalg.solve(R + B.T @ P @ B, B.T @ P @ A)
+        P_new = Q + A.T @ P @ (A - B @ K)
+        if np.allclose(P_new, P, rtol=1e-10, atol=1e-12):
+            return P_new
+        P = P_new
+    return P
+
+
+def condense(A, B, Q, R, P, N):
+    '''!@brief      Condense the MPC problem into a QP in the N moves.
+        @details    The cost is 0.5 U'HU + x'F'U + const, so the unconstrained optimum is
+                    U = -H^-1 F x.
+        @return     Tuple (H, F).
+    '''
+    n = A.shape[0]
+    Phi = np.zeros((n*N, n))
+    Gam = np.zeros((n*N, N))
+    Ak = np.eye(n)
+    for k in range(N):
+        Ak = A @ Ak
+        Phi[n*k:n*(k + 1)] = Ak
+        for j in range(k + 1):
+            Gam[n*k:n*(k + 1), j:j + 1] = np.linalg.matrix_power(A, k - j) @ B
+    Qb = np.kron(np.eye(N), Q)
+    Qb[-n:, -n:] = P
+    H = 2*(Gam.T @ Qb @ Gam + R[0, 0]*np.eye(N))
+    F = 2*(Gam.T @ Qb @ Phi)
+    return H, F
+
+
+def solve(H, f, u_max, n_iter = 100):
+    '''!@brief      Box-constrained QP by a primal active set method.
+        @param      H       QP Hessian.
+        @param      f       QP linear term.
+        @param      u_max   Bound on every move.
+        @return     Tuple (U, free), the optimal moves and the mask of moves off the bounds.
+    '''
+    N = len(f)
+    U = np.clip(-np.linalg.solve(H, f), -u_max, u_max)
+    for _ in range(n_iter):
+        g = H @ U + f
+        act = ((U <= -u_max) & (g > 0)) | ((U >= u_max) & (g < 0))
+        free = ~act
+        U_new = U.copy()
+        if free.any():
+            rhs = f[free] + H[np.ix_(free, act)] @ U[act]
+            U_new[free] = np.linalg.solve(H[np.ix_(free, free)], -rhs)
+        U_new = np.clip(U_new, -u_max, u_max)
+        if np.allclose(U_new, U, atol=1e-12):
+            break
+        U = U_new
+    free = np.abs(U) < u_max
+    return U, free
+
+
+def law(H, F, x, u_max):
+    '''!@brief      First move of the MPC plan and its slopes in the state.
+        @return     Tuple (r0, g), with g the gradient of r0 in (e, psi).
+    '''
+    U, free = solve(H, F @ x, u_max)
+    if not free[0]:
+        return U[0], np.zeros(2)
+    # On the optimal active set, the free moves are affine in x
+    G = -np.linalg.solve(H[np.ix_(free, free)], F[free])
+    return U[0], G[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the explicit MPC line follower table.')
+    parser.add_argument('--horizon', type=int, default=20, help='MPC horizon [steps]')
+    parser.add_argument('--dt', type=float, default=0.02, help='MPC step [s]')
+    parser.add_argument('--r-max', type=float, default=4.0, help='yaw rate limit [rad/s]')
+    parser.add_argument('--e-max', type=float, default=0.010, help='acceptable line offset [m]')
+    parser.add_argument('--psi-max', type=float, default=0.20, help='acceptable line angle [rad]')
+    parser.add_argument('--e-range', type=float, default=0.034, help='table offset range [m]')
+    parser.add_argument('--psi-range', type=float, default=0.70, help='table angle range [rad]')
+    parser.add_argument('--v', type=float, nargs=2, default=(0.10, 0.50), help='speed range [m/s]')
+    parser.add_argument('--n', type=int, nargs=3, default=(25, 25, 5), help='grid n_e n_psi n_v')
+    parser.add_argument('--out', default='mpc_lut.bin', help='output file')
+    parser.add_argument('--tol', type=float, default=0.10, help='largest check error, fraction of r_max')
+    parser.add_argument('--n-check', type=int, default=500, help='random check points')
+    args = parser.parse_args()
+
+    n_e, n_p, n_v = args.n
+    e_grid = np.linspace(-args.e_range, args.e_range, n_e)
+    p_grid = np.linspace(-args.psi_range, args.psi_range, n_p)
+    v_grid = np.linspace(args.v[0], args.v[1], n_v) if n_v > 1 else np.array([args.v[0]])
+    Q = np.diag([1/args.e_max**2, 1/args.psi_max**2])
+    R = np.array([[1/args.r_max**2]])
+
+    # Solve every node
+    table = np.zeros((n_v, n_e, n_p, 3))
+    qps = []
+    for k, v in enumerate(v_grid):
+        A, B = model(v, args.dt)
+        P = riccati(A, B, Q, R)
+        H, F = condense(A, B, Q, R, P, args.horizon)
+        qps.append((H, F))
+        n_sat = 0
+        for i, e in enumerate(e_grid):
+            for j, p in enumerate(p_grid):
+                r0, g = law(H, F, np.array([e, p]), args.r_max)
+                table[k, i, j] = (r0, g[0], g[1])
+                n_sat += g[0] == 0 and g[1] == 0
+        print(f'v = {v:.2f} m/s: {n_sat}/{n_e*n_p} nodes saturated')
+
+    # Scale to int16 and write
+    scale = np.maximum(np.abs(table).reshape(-1, 3).max(axis=0), 1e-9)/32767
+    q = np.round(table/scale).astype(int)
+    de = e_grid[1] - e_grid[0]
+    dp = p_grid[1] - p_grid[0]
+    dv = v_grid[1] - v_grid[0] if n_v > 1 else 1.0
+    with open(args.out, 'wb') as file:
+        file.write(b'MP' + struct.pack('<3H10f', n_e, n_p, n_v, e_grid[0], de, p_grid[0], dp,
+                                        v_grid[0], dv, args.r_max, *scale))
+        file.write(struct.pack('<' + 'h'*q.size, *q.ravel()))
+    print(f'{n_v}x{n_e}x{n_p} table, {os.path.getsize(args.out)} bytes, saved as "{args.out}"')
+
+    # Check the table against the QP between nodes and between speed slices
+    lut = MPCLut(args.out)
+    rng = np.random.default_rng(0)
+    err = []
+    for _ in range(args.n_check):
+        v = rng.uniform(v_grid[0], v_grid[-1])
+        A, B = model(v, args.dt)
+        H, F = condense(A, B, Q, R, riccati(A, B, Q, R), args.horizon)
+        x = np.array([rng.uniform(-args.e_range, args.e_range),
+                      rng.uniform(-args.psi_range, args.psi_range)])
+        r0, g = law(H, F, x, args.r_max)
+        err.append(abs(lut.eval(x[0], x[1], v) - r0))
+    err = np.array(err)
+    print(f'table vs QP: error max {err.max():.3f} rad/s, rms {np.sqrt(np.mean(err**2)):.3f} rad/s')
+    if err.max() > args.tol*args.r_max:
+        print(f'error above {args.tol*100:.0f}% of r_max; refine the grid with --n')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+'''!@file       sysid_fit.py
+    @brief      Host-side Romi drive model fitting tool
+    @details    sysid_fit.py reads a 'sysid.bin' capture made on Romi by SysID, fits a first-
+                or second-order linear model from duty [%] to wheel speed [rad/s] for each
+                wheel, and prints recommended controller gains. Run it on the host PC with
+                NumPy installed, after copying 'sysid.bin' off of PYBFLASH:
+
+                    python sysid_fit.py sysid.bin --order 2
+
+    @details    Each wheel is fit as a discrete ARX model by linear least squares,
+
+                    w[k+1] = a1 w[k] + ... + b1 u[k] + ... + c
+
+                where c soaks up any friction offset the motor map did not remove. The
+                discrete poles are converted to continuous time with the mean sample period,
+                giving the DC gain K and the denominator 1 + A1 s + A2 s^2 (A1 = tau and A2 = 0
+                for a first-order model).
+
+    @details    Gains come from IMC (lambda) tuning with closed-loop time constant lam,
+                which cancels the plant poles:
+
+                    Kp = A1/(K lam),  Ki = 1/(K lam),  Kd = A2/(K lam)
+
+                lam defaults to half of the dominant time constant. The tool also prints the
+                speed feed-forward 1/K in [%/(rad/s)] and, with the wheel radius, in [%/(m/s)],
+                to check against the RomiMM.Kff MasterMind derives from the motor map.
+    @author     Joseph Penrose & Paolo Navarro
+    @date       October 18, 2026
+'''
+import argparse
+import struct
+import numpy as np
+
+
+def load(fname):
+    '''!@brief      Read a SysID capture file.
+        @param      fname   Path to 'sysid.bin'.
+        @return     Tuple (t [s], u [%], w_L [rad/s], w_R [rad/s], period [s]).
+    '''
+    with open(fname, 'rb') as file:
+        data = file.read()
+    magic, n, period = struct.unpack_from('<2sHH', data, 0)
+    if magic != b'SI':
+        raise ValueError(f'{fname} is not a SysID capture')
+    off = struct.calcsize('<2sHH')
+    t = np.frombuffer(data, '<u4', n, off)/1e6
+    off += 4*n
+    u, w_L, w_R = (np.frombuffer(data, '<f4', n, off + 4*n*i).astype(float) for i in range(3))
+    return t, u, w_L, w_R, period/1000
+
+
+def fit(u, w, order, dt):
+    '''!@brief      Fit a discrete ARX model and convert it to continuous time.
+        @param      u       Duty cycle samples [%].
+        @param      w       Wheel speed samples [rad/s].
+        @param      order   Model order, 1 or 2.
+        @param      dt      Sample period [s].
+        @return     Dict with the model order, K, A1, A2, discrete coefficients, and fit
+                    NRMSE. An order 2 fit whose discrete poles have no continuous-time pair
+                    falls back to order 1, with a warning.
+    '''
+    n = len(w)
+    k = np.arange(order, n - 1)
+    cols = [w[k - i] for i in range(order)] + [u[k - i] for i in range(order)] + [np.ones(len(k))]
+    X = np.column_stack(cols)
+    theta, *_ = np.linalg.lstsq(X, w[k + 1], rcond=None)
+    a = theta[:order]
+    b = theta[order:2*order]
+    c = theta[-1]
+
+    # DC gain & continuous poles
+    K = b.sum()/(1 - a.sum())
+    z = np.roots(np.concatenate(([1.0], -a)))
+    if order == 2:
+        # A pole on or left of z = 0, or a complex pole without its conjugate, maps to no
+        # real pair of continuous poles; the log would add an imaginary pi/dt
+        tol = 1e-9*max(np.abs(z).max(), 1.0)
+        real = np.abs(z.imag) <= tol
+        paired = real.all() or np.abs(z[0] - np.conj(z[1])) <= tol
+        if not paired or np.any(real & (z.real <= 0)):
+            print(f'    warning: order 2 poles z = {np.array2string(z, precision=3)} have no '
+                  'continuous-time equivalent, using the order 1 model')
+            return fit(u, w, 1, dt)
+    p = np.log(z.astype(complex))/dt
+    if order == 1:
+        A1 = -1/p[0].real
+        A2 = 0.0
+    else:
+        prod = (p[0]*p[1]).real
+        A1 = -(p[0] + p[1]).real/prod
+        A2 = 1/prod
+
+    # Free-run simulation for fit quality
+    w_sim = np.zeros(n)
+    w_sim[:order] = w[:order]
+    for j in range(order - 1, n - 1):
+        w_sim[j + 1] = sum(a[i]*w_sim[j - i] for i in range(order)) \
+                     + sum(b[i]*u[j - i] for i in range(order)) + c
+    nrmse = np.sqrt(np.mean((w - w_sim)**2))/max(np.ptp(w), 1e-9)
+
+    return {'order': order, 'K': K, 'A1': A1, 'A2': A2, 'a': a, 'b': b, 'c': c, 'poles': p, 'nrmse': nrmse}
+
+
+def gains(model, lam = None):
+    '''!@brief      IMC PID gains for a fitted model.
+        @param      model   Model dict from fit().
+        @param      lam     Closed-loop time constant [s]. Default half the dominant
+                            time constant
+        @return     Tuple (Kp, Ki, Kd, lam).
+    '''
+    tau = -1/min(abs(pp.real) for pp in model['poles'])
+    if lam is None:
+        lam = abs(tau)/2
+    K = model['K']
+    return model['A1']/(K*lam), 1/(K*lam), model['A2']/(K*lam), lam
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fit Romi drive models from a SysID capture.')
+    parser.add_argument('fname', help="SysID capture file, e.g. 'sysid.bin'")
+    parser.add_argument('--order', type=int, choices=(1, 2), default=1, help='model order')
+    parser.add_argument('--lam', type=float, default=None, help='closed-loop time constant [s]')
+    parser.add_argument('--r', type=float, default=0.035, help='wheel radius [m]')
+    args = parser.parse_args()
+
+    t, u, w_L, w_R, period = load(args.fname)
+    dt = float(np.mean(np.diff(t))) if len(t) > 1 else period
+    print(f'{len(t)} samples, mean period {dt*1000:.2f} ms (nominal {period*1000:.0f} ms)')
+
+    for name, w in (('Left', w_L), ('Right', w_R)):
+        m = fit(u, w, args.order, dt)
+        Kp, Ki, Kd, lam = gains(m, args.lam)
+        print(f'\n{name} wheel, order {m["order"]} model (NRMSE {m["nrmse"]*100:.1f}%):')
+        print(f'    K  = {m["K"]:.4f} (rad/s)/%')
+        print(f'    A1 = {m["A1"]:.4f} s, A2 = {m["A2"]:.6f} s^2')
+        print(f'    poles = {np.array2string(m["poles"], precision=2)} rad/s')
+        print(f'  Speed loop, IMC lam = {lam:.3f} s:')
+        print(f'    Kp = {Kp:.3f} %/(rad/s), Ki = {Ki:.3f} %/rad, Kd = {Kd:.4f} %/(rad/s^2)')
+        print('  Feed-forward:')
+        print(f'    1/K = {1/m["K"]:.3f} %/(rad/s) = {1/(m["K"]*args.r):.1f} %/(m/s) (RomiMM.Kff check)')
+
+
+if __name__ == '__main__':
+    main()
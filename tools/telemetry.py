@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+'''!@file       telemetry.py
+    @brief      Host-side Romi telemetry receiver and decoder
+    @details    telemetry.py reads the binary telemetry stream that Telemetry sends over Romi's
+                USB VCP, sets channel rates, and saves every channel as NumPy arrays. Run it on
+                the host PC with NumPy installed, with Romi plugged in and nothing else holding
+                the port:
+
+                    python telemetry.py /dev/ttyACM0 --rate sens_val=1 spd_L=1 spd_R=1 --time 10
+
+                Each --rate sets a channel's decimation (0 turns it off); without any, Romi's
+                defaults are kept. The capture is saved as an .npz with, for every channel, a
+                '<name>' array of values and a '<name>_t' array of time stamps [s].
+
+    @details    The frame format, CRC, and COBS framing are Telemetry's own, imported from
+                PYBFLASH so the two ends cannot drift apart. Decoder turns any run of stream
+                bytes into samples; it needs a schema frame before it can name the data, and
+                asks for one whenever the data frames' schema ID does not match what it has.
+                Frames that fail their CRC are counted in bad, and gaps in the sequence
+                numbers in lost. When it is done, the tool tells Romi to turn Ctrl-C back
+                on. Ports are opened as raw POSIX ttys, so no serial library is
+                needed; tools/telemetry_sim.py runs a simulated Romi on a pty to test against.
+    @author     Joseph Penrose & Paolo Navarro
+    @date       October 18, 2026
+'''
+import argparse
+import os
+import select
+import struct
+import sys
+import time
+import tty
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'PYBFLASH'))
+from Telemetry import Telemetry     # noqa: E402, the on-robot framing
+
+
+class Decoder():
+    '''!@brief      Romi telemetry stream decoder.
+        @details    Keeps one list of time stamps and one of values per channel. Time stamps
+                    are Romi's, unwrapped and counted from the first data frame.
+    '''
+
+    def __init__(self):
+        self.buf = bytearray()      # bytes since the last frame end
+        self.synced = False         # a frame end has been seen
+        self.schema_id = None
+        self.names = []
+        self.dec = []
+        self.t = []                 # per channel time stamps [s]
+        self.v = []                 # per channel values
+        self.t_last = None          # [us] last raw time stamp
+        self.t_acc = 0              # [us] unwrapped time stamp
+        self.seq = None
+        self.frames = 0             # good data frames
+        self.bad = 0                # frames failing COBS or CRC
+        self.lost = 0               # data frames missing from the sequence
+        self.unknown = 0            # data frames without a matching schema
+        self.want_schema = False    # a schema request should be sent
+
+    def feed(self, data):
+        '''!@brief      Decode a run of stream bytes.
+            @param      data    Bytes, in any pieces.
+        '''
+        self.buf += data
+        frames = self.buf.split(b'\x00')
+        self.buf = frames.pop()         # unfinished frame
+        for frame in frames:
+            # Whatever came before the first frame end may be the tail of a frame, but it
+            # may also be a whole one, such as the schema answering our first '?'
+            if frame:
+                self.packet(frame, self.synced)
+            self.synced = True
+
+    def packet(self, frame, synced = True):
+        '''!@brief      Act on one frame.
+            @param      frame   Frame bytes, without the ending zero.
+            @param      synced  False if the frame may be the tail of one cut off at the start
+                                of the capture, which is not counted as bad.
+        '''
+        p = Telemetry.decode(frame)
+        if p is None:
+            if synced:
+                self.bad += 1
+        elif p[0] == Telemetry.SCHEMA:
+            self.schema(p)
+        elif p[0] == Telemetry.DATA:
+            self.data(p)
+
+    def schema(self, p):
+        '''!@brief      Take in a schema frame payload.
+        '''
+        sid, n = struct.unpack_from('<HB', p, 1)
+        names = bytes(p[4 + 2*n:]).decode().split(',') if n else []
+        if sid != self.schema_id or names != self.names:
+            self.schema_id = sid
+            self.names = names
+            self.t = [[] for _ in names]
+            self.v = [[] for _ in names]
+        self.dec = list(struct.unpack_from(f'<{n}H', p, 4))
+        self.want_schema = False
+
+    def data(self, p):
+        '''!@brief      Take in a data frame payload.
+        '''
+        sid, seq, t_us, mask = struct.unpack_from('<HHII', p, 1)
+        if sid != self.schema_id:
+            self.unknown += 1
+            self.want_schema = True
+            return
+        if self.seq is not None:
+            self.lost += (seq - self.seq - 1) & 0xFFFF
+        self.seq = seq
+        if self.t_last is not None:
+            self.t_acc += (t_us - self.t_last) & 0x3FFFFFFF
+        self.t_last = t_us
+        t = self.t_acc/1e6
+        j = Telemetry.HDR
+        for ch in range(len(self.names)):
+            if mask >> ch & 1:
+                self.t[ch].append(t)
+                self.v[ch].append(struct.unpack_from('<f', p, j)[0])
+                j += 4
+        self.frames += 1
+
+    def arrays(self):
+        '''!@brief      Everything decoded so far.
+            @return     Dict of name: (time stamps [s], values) NumPy array pairs.
+        '''
+        return {name: (np.array(self.t[ch]), np.array(self.v[ch], dtype=np.float32))
+                for ch, name in enumerate(self.names)}
+
+
+def command(payload):
+    '''!@brief      Frame a command for Romi.
+        @param      payload Command payload bytes.
+        @return     Stream bytes.
+    '''
+    raw = bytearray(payload) + bytearray(2)
+    c = Telemetry.crc(raw, len(payload))
+    raw[-2] = c & 0xFF
+    raw[-1] = c >> 8
+    out = bytearray(len(raw) + len(raw)//254 + 2)
+    n = Telemetry.encode(raw, len(raw), out, 0)
+    return b'\x00' + bytes(out[:n])
+
+
+def ask_schema():
+    '''!@brief      Command asking Romi for its schema.
+    '''
+    return command(struct.pack('<B', Telemetry.CMD_SCHEMA))
+
+
+def release():
+    '''!@brief      Command giving Romi's VCP its Ctrl-C back.
+    '''
+    return command(struct.pack('<B', Telemetry.CMD_RELEASE))
+
+
+def set_rate(ch, decim):
+    '''!@brief      Command setting a channel's decimation, 0 for off.
+    '''
+    return command(struct.pack('<BBH', Telemetry.CMD_RATE, ch, decim))
+
+
+def open_port(path):
+    '''!@brief      Open a tty in raw, non-blocking mode.
+        @return     File descriptor.
+    '''
+    fd = os.open(path, os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
+    tty.setraw(fd)
+    return fd
+
+
+def capture(fd, t_run, rates = None, dec = None):
+    '''!@brief      Receive telemetry from an open port.
+        @param      fd      Port file descriptor.
+        @param      t_run   Capture time [s].
+        @param      rates   Dict of channel name: decimation to set first. Default none
+        @param      dec     Decoder to use. Default a new one
+        @return     The Decoder.
+    '''
+    dec = dec if dec is not None else Decoder()
+    rates = dict(rates or {})
+    os.write(fd, ask_schema())
+    t_ask = time.monotonic()
+    t_end = t_ask + t_run
+    while time.monotonic() < t_end:
+        r, _, _ = select.select([fd], [], [], 0.05)
+        if r:
+            try:
+                dec.feed(os.read(fd, 65536))
+            except BlockingIOError:
+                pass
+        if dec.names and rates:
+            for name, d in rates.items():
+                if name not in dec.names:
+                    raise ValueError(f'Romi has no telemetry channel {name}: {dec.names}')
+                os.write(fd, set_rate(dec.names.index(name), d))
+            rates = {}
+        if (dec.want_schema or not dec.names) and time.monotonic() - t_ask > 0.5:
+            os.write(fd, ask_schema())
+            t_ask = time.monotonic()
+    return dec
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Capture Romi telemetry into NumPy arrays.')
+    parser.add_argument('port', help="Romi's USB VCP, e.g. /dev/ttyACM0")
+    parser.add_argument('--rate', nargs='*', default=[], help='channel=decimation, 0 for off')
+    parser.add_argument('--time', type=float, default=10.0, help='capture time [s]')
+    parser.add_argument('--out', default='telemetry.npz', help='output file')
+    args = parser.parse_args()
+
+    rates = {}
+    for r in args.rate:
+        name, d = r.split('=')
+        rates[name] = int(d)
+    fd = open_port(args.port)
+    try:
+        dec = capture(fd, args.time, rates)
+    finally:
+        os.write(fd, release())
+        os.close(fd)
+
+    data = dec.arrays()
+    out = {}
+    for name, (t, v) in data.items():
+        out[name] = v
+        out[name + '_t'] = t
+        if len(t) > 1:
+            print(f'{name:>12}: {len(t)} samples at {(len(t) - 1)/(t[-1] - t[0]):.0f} Hz')
+        else:
+            print(f'{name:>12}: {len(t)} samples')
+    print(f'{dec.frames} frames, {dec.lost} lost, {dec.bad} bad')
+    np.savez(args.out, **out)
+    print(f'saved as "{args.out}"')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+'''!@file       telemetry_sim.py
+    @brief      Host-side simulated Romi telemetry source
+    @details    telemetry_sim.py runs Telemetry, exactly as it runs on Romi, on one end of a
+                pseudo-terminal pair, fed by a simple simulated Romi driving along a wavy line.
+                The other end stands in for Romi's USB VCP, so telemetry.py and anything else
+                written against the stream can be tried without a robot:
+
+                    python telemetry_sim.py
+                    python telemetry.py /dev/pts/5 --rate x=1 tick=1 --time 5
+
+    @details    With --test, the tool captures from its own pty with telemetry.py's capture()
+                and checks the stream end to end: the schema arrives, every channel decodes,
+                the 'tick' counter channel comes through at the full task rate, a rate
+                change from the host takes effect, Ctrl-C is only held off while the host
+                is talking, and stray text written into the stream
+                (as a print() on Romi's VCP would) costs only the frames it lands on.
+
+                    python telemetry_sim.py --test --hz 1000
+    @author     Joseph Penrose & Paolo Navarro
+    @date       October 18, 2026
+'''
+import argparse
+import math
+import os
+import select
+import sys
+import threading
+import time
+import tty
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'PYBFLASH'))
+from Telemetry import Telemetry     # noqa: E402, the on-robot stream
+import telemetry                    # noqa: E402, the host decoder
+
+
+class SimShare():
+    '''!@brief      Stand-in for a task_share Share.
+    '''
+
+    def __init__(self, val = 0.0):
+        self.val = val
+
+    def put(self, val):
+        self.val = val
+
+    def get(self):
+        return self.val
+
+
+class PtyVCP():
+    '''!@brief      Stand-in for pyb.USB_VCP on the robot end of a pty.
+    '''
+
+    def __init__(self, fd):
+        self.fd = fd
+        self.sent = 0       # [bytes] taken by the pty
+        self.intr = 3       # interrupt character, as pyb.USB_VCP.setinterrupt()
+
+    def setinterrupt(self, c):
+        self.intr = c
+
+    def isconnected(self):
+        return True
+
+    def any(self):
+        return bool(select.select([self.fd], [], [], 0)[0])
+
+    def read(self):
+        try:
+            return os.read(self.fd, 256)
+        except BlockingIOError:
+            return b''
+
+    def send(self, data, timeout = 0):
+        try:
+            n = os.write(self.fd, data)
+        except BlockingIOError:
+            n = 0
+        self.sent += n
+        return n
+
+
+def robot(tele, hz, stop, junk = 0.0):
+    '''!@brief      Simulated Romi: follow a wavy line, and run Telemetry every tick.
+        @param      tele    Telemetry object with the simulation channels.
+        @param      hz      Tick rate [Hz].
+        @param      stop    threading.Event that ends the run.
+        @param      junk    Period of stray text written into the stream [s], 0 for none.
+    '''
+    s = tele.shares
+    task = tele.MainTask()
+    dt = 1/hz
+    X = Y = phi = 0.0
+    k = 0
+    t_next = time.perf_counter()
+    t_junk = t_next + junk
+    while not stop.is_set():
+        # Unicycle on the line y = 0.05 sin(4 x), proportional steering
+        t = k*dt
+        e = Y - 0.05*math.sin(4*X)
+        w = -30*e - 4*(phi - math.atan(0.2*math.cos(4*X)))
+        X += 0.2*math.cos(phi)*dt
+        Y += 0.2*math.sin(phi)*dt
+        phi += w*dt
+        s['tick'].put(float(k))
+        s['sens_val'].put(-e/0.02)
+        s['spd_L'].put((0.2 - 0.0705*w)/0.035)
+        s['spd_R'].put((0.2 + 0.0705*w)/0.035)
+        s['distance'].put(1000 - 200*t)
+        tele.log(tele.ch_x, X)
+        tele.log(tele.ch_y, Y)
+        tele.log(tele.ch_phi, phi)
+        next(task)
+        if junk and time.perf_counter() > t_junk:
+            tele.vcp.send(b'Mission step 3: FOLLOW until LIDAR\r\n')
+            tele.junk += 1
+            t_junk += junk
+        k += 1
+        t_next += dt
+        pause = t_next - time.perf_counter()
+        if pause > 0:
+            time.sleep(pause)
+
+
+def build(fd):
+    '''!@brief      Telemetry on the robot end of the pty, with the simulation's channels.
+    '''
+    tele = Telemetry(PtyVCP(fd), buf = 8192)
+    tele.shares = {}
+    tele.junk = 0
+    for name in ('tick', 'sens_val', 'spd_L', 'spd_R', 'distance'):
+        tele.shares[name] = SimShare()
+        tele.channel(name, tele.shares[name], decim = 0 if name == 'distance' else 1)
+    tele.ch_x = tele.channel('x')
+    tele.ch_y = tele.channel('y')
+    tele.ch_phi = tele.channel('phi', decim = 10)
+    return tele
+
+
+def test(tele, path, hz):
+    '''!@brief      Capture from the pty and check the stream.
+        @return     True if every check passed.
+    '''
+    stop = threading.Event()
+    sim = threading.Thread(target=robot, args=(tele, hz, stop, 0.5))
+    sim.start()
+    fd = telemetry.open_port(path)
+    try:
+        intr_0 = tele.vcp.intr
+        dec = telemetry.capture(fd, 2.0, {'distance': 5})
+        intr_run = tele.vcp.intr
+        dec = telemetry.capture(fd, 1.0, {'tick': 2}, dec)
+        os.write(fd, telemetry.release())
+        time.sleep(0.1)
+    finally:
+        stop.set()
+        sim.join()
+        os.close(fd)
+
+    data = dec.arrays()
+    ok = True
+
+    def check(cond, what):
+        nonlocal ok
+        ok &= bool(cond)
+        print(f'{"ok  " if cond else "FAIL"} {what}')
+
+    check(dec.names == ['tick', 'sens_val', 'spd_L', 'spd_R', 'distance', 'x', 'y', 'phi'],
+          f'schema {dec.names}')
+    check(all(len(v) for _, v in data.values()), 'every channel has samples')
+    t, v = data['tick']
+    dv = np.diff(v)
+    steps = set(dv.astype(int)) - {0}
+    n_one = np.sum(dv == 1)
+    check(n_one > 1.5*hz, f'tick at full rate: {n_one} consecutive samples')
+    check(2 in steps, 'tick rate change to 1/2 took effect')
+    rate = (len(t) - 1)/(t[-1] - t[0])
+    check(rate > 0.5*hz, f'{len(t)} tick samples, {rate:.0f} Hz average')
+    check(dec.bad <= tele.junk + 1, f'{dec.bad} bad frames for {tele.junk} stray prints')
+    check(dec.lost <= dec.bad, f'{dec.lost} frames lost, all to bad frames')
+    check(intr_0 == 3 and intr_run == -1 and tele.vcp.intr == 3,
+          'Ctrl-C on before the host talks, off while it does, back on at release')
+    check(tele.dropped == 0, f'{tele.dropped} frames dropped on Romi')
+    t_d, v_d = data['distance']
+    check(len(v_d) > 0 and np.all(np.diff(v_d) < 0), f'distance turned on: {len(v_d)} samples')
+    print(f'{dec.frames} frames, {tele.vcp.sent} bytes, {tele.vcp.sent/(t[-1] - t[0])/1000:.0f} kB/s')
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulated Romi telemetry on a pty.')
+    parser.add_argument('--hz', type=float, default=1000.0, help='Telemetry task rate [Hz]')
+    parser.add_argument('--junk', type=float, default=0.0, help='stray text period [s], 0 for none')
+    parser.add_argument('--test', action='store_true', help='capture from the pty and check it')
+    args = parser.parse_args()
+
+    master, slave = os.openpty()
+    tty.setraw(master)
+    os.set_blocking(master, False)
+    path = os.ttyname(slave)
+    tele = build(master)
+    if args.test:
+        ok = test(tele, path, args.hz)
+        sys.exit(0 if ok else 1)
+
+    print(f'Simulated Romi telemetry on {path}, Ctrl-C to stop')
+    stop = threading.Event()
+    try:
+        robot(tele, args.hz, stop, args.junk)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()